@@ -0,0 +1,379 @@
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+
+from contracts.uniswap_v2 import UniswapV2
+from core import Blockchain, Transaction
+from simulation import create_env_from_yaml
+from simulation.agents import UserAgent
+from simulation.simulator import Epoch, Simulator
+
+CONFIG_PATH = "data/blockchain_config.yaml"
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Problem sizes of the full suite and of the `--quick` one.
+SIZES = {
+    "full": {
+        "mempool": [100, 1_000, 10_000, 100_000],
+        "agent_users": [100, 1_000, 10_000],
+        "epoch_users": [100, 1_000, 10_000],
+        "epoch_tokens": [2, 4, 8],
+        "epoch_pools": [1, 4, 16],
+        "memory_transactions": 200_000,
+        "repeat": 11,
+    },
+    "quick": {
+        "mempool": [100, 1_000, 10_000],
+        "agent_users": [100, 1_000],
+        "epoch_users": [100, 1_000],
+        "epoch_tokens": [2, 4],
+        "epoch_pools": [1, 4],
+        "memory_transactions": 20_000,
+        "repeat": 7,
+    },
+}
+
+EPOCH_BLOCKS = 10
+
+# Small mempools and populations are timed over more repeats or blocks, so
+# every measurement covers at least this many swaps.
+MIN_SWAPS = 20_000
+
+
+def time_runs(
+    run: Callable[[], None], setup: Callable[[], None], repeat: int
+) -> np.ndarray:
+    """
+    Returns the durations of `repeat` timed calls of `run`, each after a
+    call of `setup` that is not timed.
+    """
+    timings = []
+    for _ in range(repeat):
+        setup()
+        gc.collect()
+
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    return np.array(timings)
+
+
+def summarize(values: np.ndarray, unit: str, higher_is_better: bool) -> dict:
+    """
+    Returns a result as the median of the measured values, with their
+    interquartile range as the measure of their noise.
+    """
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+
+    return {
+        "value": float(median),
+        "iqr": float(q3 - q1),
+        "unit": unit,
+        "higher_is_better": higher_is_better,
+    }
+
+
+def create_env(
+    num_users: int, num_tokens: int = 2, num_pools: int = 1, engine: str = "sequential"
+) -> tuple[Blockchain, list]:
+    """
+    Builds a blockchain with `num_tokens` tokens, a UniswapV2 contract with
+    pools on the first `num_pools` token pairs and `num_users` funded users.
+    """
+    blockchain = Blockchain(engine=engine)
+    tokens = [
+        blockchain.create_token(f"T{i}", value=1.0 + i) for i in range(num_tokens)
+    ]
+
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    for token_1, token_2 in itertools.islice(
+        itertools.combinations(tokens, 2), num_pools
+    ):
+        uniswap_v2.create_pool(
+            token_1,
+            token_2,
+            0.003,
+            1_000_000 / token_1.value,
+            1_000_000 / token_2.value,
+        )
+
+    users = []
+    for i in range(num_users):
+        user = blockchain.create_user(f"User_{i}")
+        for token in tokens:
+            user.add_to_wallet(token, 1000.0)
+        users.append(user)
+
+    return blockchain, users
+
+
+def fill_mempool(blockchain: Blockchain, users: list, num_swaps: int) -> None:
+    tokens = list(blockchain.tokens.values())
+    uniswap_v2 = blockchain.contracts["UniswapV2"]
+
+    for i in range(num_swaps):
+        # Each sender is credited what its swap spends, so repeated blocks
+        # keep executing swaps instead of draining the wallets and failing.
+        sender = users[i % len(users)]
+        sender.add_to_wallet(tokens[i % 2], 1.0)
+        blockchain.add_transaction(
+            Transaction(
+                sender=sender,
+                contract=uniswap_v2,
+                function="swap",
+                args={
+                    "token_in": tokens[i % 2],
+                    "amount_in": 1.0,
+                    "token_out": tokens[1 - i % 2],
+                },
+            )
+        )
+
+
+def bench_create_block(sizes: dict) -> dict[str, dict]:
+    results = {}
+
+    for engine, num_swaps in itertools.product(
+        ("sequential", "batch"), sizes["mempool"]
+    ):
+        blockchain, users = create_env(1_000, engine=engine)
+        seconds = time_runs(
+            blockchain.create_block,
+            lambda: fill_mempool(blockchain, users, num_swaps),
+            max(sizes["repeat"], MIN_SWAPS // num_swaps),
+        )
+        results[f"create_block[{engine},{num_swaps}]"] = summarize(
+            num_swaps / seconds, "swaps/s", higher_is_better=True
+        )
+
+    return results
+
+
+def bench_user_agent(sizes: dict) -> dict[str, dict]:
+    results = {}
+
+    for num_users in sizes["agent_users"]:
+        blockchain, users = create_env(num_users)
+        uniswap_v2 = blockchain.contracts["UniswapV2"]
+
+        seconds = time_runs(
+            lambda: UserAgent.simulate_user_actions(users, uniswap_v2, blockchain),
+            blockchain.mempool.clear,
+            max(sizes["repeat"], MIN_SWAPS // num_users),
+        )
+        results[f"simulate_user_actions[{num_users}]"] = summarize(
+            seconds / num_users * 1e6, "us/user", higher_is_better=False
+        )
+
+    return results
+
+
+def bench_create_env(sizes: dict) -> dict[str, dict]:
+    seconds = time_runs(
+        lambda: create_env_from_yaml(CONFIG_PATH), lambda: None, sizes["repeat"] * 4
+    )
+
+    return {
+        "create_env_from_yaml": summarize(seconds * 1e3, "ms", higher_is_better=False)
+    }
+
+
+def bench_run_epoch(sizes: dict) -> dict[str, dict]:
+    results = {}
+
+    cases = [(num_users, 2, 1) for num_users in sizes["epoch_users"]]
+    cases += [
+        (sizes["epoch_users"][0], num_tokens, num_tokens * (num_tokens - 1) // 2)
+        for num_tokens in sizes["epoch_tokens"][1:]
+    ]
+    cases += [
+        (sizes["epoch_users"][0], sizes["epoch_tokens"][-1], num_pools)
+        for num_pools in sizes["epoch_pools"][1:]
+    ]
+
+    for num_users, num_tokens, num_pools in dict.fromkeys(cases):
+        blockchain, users = create_env(num_users, num_tokens, num_pools)
+        simulator = Simulator(blockchain, seed=0)
+        simulator.users = users
+        simulator.create_block_producers(1)
+
+        num_blocks = max(EPOCH_BLOCKS, MIN_SWAPS // num_users)
+        epoch = Epoch(
+            num_blocks, {token: token.value for token in blockchain.tokens.values()}
+        )
+
+        seconds = time_runs(
+            lambda: simulator.run_epoch(epoch), lambda: None, sizes["repeat"]
+        )
+        results[f"run_epoch[{num_users},{num_tokens},{num_pools}]"] = summarize(
+            seconds / num_blocks * 1e3, "ms/block", higher_is_better=False
+        )
+
+    return results
+
+
+def bench_memory(sizes: dict) -> dict[str, dict]:
+    num_transactions = sizes["memory_transactions"]
+    blockchain, users = create_env(1_000)
+
+    gc.collect()
+    tracemalloc.start()
+    for _ in range(10):
+        fill_mempool(blockchain, users, num_transactions // 10)
+        blockchain.create_block()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "peak_memory_per_1m_transactions": {
+            "value": peak / num_transactions * 1_000_000 / 2**20,
+            "iqr": 0.0,
+            "unit": "MiB",
+            "higher_is_better": False,
+        }
+    }
+
+
+BENCHMARKS: dict[str, Callable[[dict], dict[str, dict]]] = {
+    "create_block": bench_create_block,
+    "user_agent": bench_user_agent,
+    "create_env": bench_create_env,
+    "run_epoch": bench_run_epoch,
+    "memory": bench_memory,
+}
+
+
+def run_benchmarks(mode: str, selected: list[str]) -> dict:
+    """
+    Runs the selected benchmarks and returns the results document.
+    """
+    results = {}
+
+    for name in selected:
+        # Each benchmark replays the same random workload on every run.
+        random.seed(0)
+        results.update(BENCHMARKS[name](SIZES[mode]))
+
+    return {
+        "meta": {
+            "mode": mode,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+
+
+def compare(
+    report: dict, baseline: dict, tolerance: float, noise_factor: float
+) -> list[str]:
+    """
+    Compares results against a baseline.
+
+    A result regresses when it worsens by more than its limit: `tolerance`,
+    or `noise_factor` times the interquartile ranges of the baseline and
+    current values relative to their medians if that is more, so noisy
+    results need a larger change to count.
+
+    Returns:
+        list[str]: The names of the results that regressed by more than
+            their limit, as a fraction of the baseline value.
+    """
+    if report["meta"]["mode"] != baseline["meta"]["mode"]:
+        raise ValueError(
+            f"Cannot compare a {report['meta']['mode']!r} run to a {baseline['meta']['mode']!r} baseline"
+        )
+
+    regressions = []
+    print(
+        f"{'benchmark':<44} {'baseline':>14} {'current':>14} {'change':>8} {'limit':>7}"
+    )
+
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<44} {'-':>14} {result['value']:>14.4g} {'new':>8}")
+            continue
+
+        noise = base.get("iqr", 0.0) / base["value"] + result["iqr"] / result["value"]
+        limit = max(tolerance, noise_factor * noise)
+
+        change = result["value"] / base["value"] - 1
+        worse = -change if result["higher_is_better"] else change
+        flag = " REGRESSION" if worse > limit else ""
+        if flag:
+            regressions.append(name)
+
+        print(
+            f"{name:<44} {base['value']:>14.4g} {result['value']:>14.4g} {change:>+8.1%} {limit:>7.1%}{flag}"
+        )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the simulator hot paths")
+    parser.add_argument("--quick", action="store_true", help="run smaller sizes")
+    parser.add_argument(
+        "--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS)
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="overwrite the baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="the fraction a result may always worsen by before it counts as a regression",
+    )
+    parser.add_argument(
+        "--noise-factor",
+        type=float,
+        default=1.0,
+        help="the multiple of the relative interquartile ranges a result may worsen by",
+    )
+    args = parser.parse_args()
+
+    report = run_benchmarks("quick" if args.quick else "full", args.only)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(json.dumps(report["results"], indent=2))
+        return
+
+    if not os.path.exists(args.baseline):
+        print(json.dumps(report["results"], indent=2))
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+
+    regressions = compare(report, baseline, args.tolerance, args.noise_factor)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,35 @@
+import math
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+import numpy as np
+
 from contracts import Contract
+from contracts.router import Router
 from market.actors.user import User
 from market.token import Token
 
 
+class LPPosition:
+    """
+    Represents the shares of one liquidity provider in a pool.
+
+    Attributes:
+        shares (float): The number of shares held.
+        fee_checkpoint (dict[Token, float]): The pool's fees per share of
+            each token when the position was last settled.
+        fees_earned (dict[Token, float]): The fees of each token earned up
+            to the last settlement.
+    """
+
+    __slots__ = ("shares", "fee_checkpoint", "fees_earned")
+
+    def __init__(self, fee_per_share: dict[Token, float]):
+        self.shares = 0.0
+        self.fee_checkpoint = dict(fee_per_share)
+        self.fees_earned = dict.fromkeys(fee_per_share, 0.0)
+
+
 class LiquidityPool:
     """
     Represents the a liquidity pool.
@@ -13,6 +40,15 @@ class LiquidityPool:
         reserve_1 (float): The reserve of the first token in the liquidity pool.
         reserve_2 (float): The reserve of the second token in the liquidity pool.
         fee (float): The fee of the liquidity pool.
+        version (int): The number of reserve changes, used to invalidate
+            cached quotes.
+        lp_token (Token | None): The token of the pool's shares.
+        total_shares (float): The number of shares issued. Initial reserves
+            back shares that no provider holds.
+        fee_per_share (dict[Token, float]): The fees of each token earned
+            per share since the pool was created.
+        lp_positions (dict[str, LPPosition]): The positions of the liquidity
+            providers, by address.
     """
 
     def __init__(
@@ -35,8 +71,13 @@ class LiquidityPool:
         self.token_reserve[token_1] = reserve_1
         self.token_reserve[token_2] = reserve_2
         self.fee = fee
+        self.version = 0
         self.lp_token: Token | None = None
 
+        self.total_shares = math.sqrt(reserve_1 * reserve_2)
+        self.fee_per_share: dict[Token, float] = {token_1: 0.0, token_2: 0.0}
+        self.lp_positions: dict[str, LPPosition] = {}
+
     @property
     def pair_name(self) -> str:
         """
@@ -65,6 +106,7 @@ class LiquidityPool:
             amount_2 (float): The amount of the second token to add.
         """
         self.token_reserve[token] += amount
+        self.version += 1
 
     def remove_liquidity(self, token: Token, amount: float) -> None:
         """
@@ -78,6 +120,125 @@ class LiquidityPool:
             raise ValueError(f"{self} Insufficient funds")
 
         self.token_reserve[token] -= amount
+        self.version += 1
+
+    def snapshot(self) -> tuple:
+        """
+        Returns the state that swaps change, to be restored by `restore`.
+        """
+        return dict(self.token_reserve), self.version, dict(self.fee_per_share)
+
+    def restore(self, state: tuple) -> None:
+        """
+        Restores the state returned by `snapshot`.
+        """
+        token_reserve, self.version, fee_per_share = state
+        self.token_reserve.update(token_reserve)
+        self.fee_per_share.update(fee_per_share)
+
+    @property
+    def share_value(self) -> float:
+        """
+        Returns the value of one share of the pool.
+        """
+        return self.total_value_locked / self.total_shares if self.total_shares else 0.0
+
+    def add_fee(self, token: Token, amount: float) -> None:
+        """
+        Accrues a swap fee paid in `token` to every share, in O(1) whatever
+        the number of providers.
+        """
+        if self.total_shares:
+            self.fee_per_share[token] += amount / self.total_shares
+
+    def mint_shares(self, address: str, shares: float) -> None:
+        """
+        Issues shares to a provider, settling the fees of its position first.
+        """
+        position = self.lp_positions.get(address)
+        if position is None:
+            position = self.lp_positions[address] = LPPosition(self.fee_per_share)
+
+        self._settle(position)
+        position.shares += shares
+        self.total_shares += shares
+
+    def burn_shares(self, address: str, shares: float) -> None:
+        """
+        Cancels shares of a provider, settling the fees of its position first.
+        """
+        position = self.lp_positions.get(address)
+        if position is None or position.shares < shares:
+            raise ValueError(f"{self} Insufficient shares")
+
+        self._settle(position)
+        position.shares -= shares
+        self.total_shares -= shares
+
+    def position_amounts(self, address: str) -> dict[Token, float]:
+        """
+        Returns the amount of each token backing a provider's shares.
+        """
+        position = self.lp_positions.get(address)
+        if position is None or not self.total_shares:
+            return dict.fromkeys(self.token_reserve, 0.0)
+
+        fraction = position.shares / self.total_shares
+        return {
+            token: reserve * fraction for token, reserve in self.token_reserve.items()
+        }
+
+    def position_value(self, address: str) -> float:
+        """
+        Returns the value of a provider's shares.
+        """
+        position = self.lp_positions.get(address)
+        return 0.0 if position is None else position.shares * self.share_value
+
+    def fees_earned(self, address: str) -> dict[Token, float]:
+        """
+        Returns the fees of each token a provider's shares have earned,
+        from the per-share accumulators rather than from the swap history.
+        """
+        position = self.lp_positions.get(address)
+        if position is None:
+            return dict.fromkeys(self.token_reserve, 0.0)
+
+        return {
+            token: position.fees_earned[token]
+            + position.shares * (fee_per_share - position.fee_checkpoint[token])
+            for token, fee_per_share in self.fee_per_share.items()
+        }
+
+    def _settle(self, position: LPPosition) -> None:
+        for token, fee_per_share in self.fee_per_share.items():
+            position.fees_earned[token] += position.shares * (
+                fee_per_share - position.fee_checkpoint[token]
+            )
+            position.fee_checkpoint[token] = fee_per_share
+
+
+@dataclass
+class Quote:
+    """
+    Represents the priced outcome of a set of trades, element-wise.
+
+    Attributes:
+        amount_in (np.ndarray): The amount of the input token sold.
+        amount_out (np.ndarray): The amount of the output token bought.
+        execution_price (np.ndarray): The output token received per input
+            token, `amount_out / amount_in`.
+        spot_price (np.ndarray): The output token per input token quoted by
+            the reserves before the trade, without the fee.
+        price_impact (np.ndarray): The fraction of the fee-adjusted spot price
+            lost to slippage, `1 - execution_price / (spot_price * (1 - fee))`.
+    """
+
+    amount_in: np.ndarray
+    amount_out: np.ndarray
+    execution_price: np.ndarray
+    spot_price: np.ndarray
+    price_impact: np.ndarray
 
 
 class AmmProtocol(Contract):
@@ -97,8 +258,17 @@ class AmmProtocol(Contract):
         self.name = name
         self.pools: dict[tuple[Token, Token], LiquidityPool] = {}
 
+        # Canonical pair index: every pool under the (lower, higher) pair of
+        # the contract's integer token IDs, so a lookup is a single probe
+        # whatever the token order.
+        self.tokens: list[Token] = []
+        self.token_ids: dict[str, int] = {}
+        self.pair_index: dict[tuple[int, int], LiquidityPool] = {}
+        self.router = Router(self)
+
         self.functions = {
             "swap": self.swap,
+            "swap_exact_in": self.swap_exact_in,
             "add_liquidity": self.add_liquidity,
             "remove_liquidity": self.remove_liquidity,
         }
@@ -122,18 +292,37 @@ class AmmProtocol(Contract):
         if token_1 == token_2:
             raise ValueError("Tokens must be different")
 
-        if (token_1, token_2) in self.pools or (token_2, token_1) in self.pools:
+        pair = self._pair(self._register_token(token_1), self._register_token(token_2))
+        if pair in self.pair_index:
             raise ValueError("Liquidity pool already exists")
 
-        new_pool = LiquidityPool(token_1, token_2, fee, reserve_1, reserve_2)
-        # new_pool.lp_token = self.blockchain.create_token(
-        #     name=f"{self.name} {token_1.name}/{token_2.name}", value=0.0
-        # )
+        new_pool = self._new_pool(token_1, token_2, fee, reserve_1, reserve_2)
 
         self.pools[(token_1, token_2)] = new_pool
+        self.pair_index[pair] = new_pool
+        self.router.invalidate(pair)
 
         return new_pool
 
+    def create_pools(
+        self, pools: Iterable[tuple[Token, Token, float, float, float]]
+    ) -> list[LiquidityPool]:
+        """
+        Creates many liquidity pools.
+
+        Args:
+            pools (Iterable[tuple[Token, Token, float, float, float]]): The
+                first and second token, fee and first and second reserve of
+                every pool.
+
+        Returns:
+            list[LiquidityPool]: The created pools, in order.
+        """
+        return [
+            self.create_pool(token_1, token_2, fee, reserve_1, reserve_2)
+            for token_1, token_2, fee, reserve_1, reserve_2 in pools
+        ]
+
     def swap(
         self, sender: User, token_in: Token, token_out: Token, amount_in: float
     ) -> float:
@@ -147,8 +336,59 @@ class AmmProtocol(Contract):
         pool.remove_liquidity(token_out, amount_out)
         sender.add_to_wallet(token_out, amount_out)
 
+        pool.add_fee(token_in, amount_in * pool.fee)
+
         return amount_out
 
+    def swap_exact_in(
+        self,
+        sender: User,
+        token_in: Token,
+        token_out: Token,
+        amount_in: float,
+        min_amount_out: float = 0.0,
+    ) -> float:
+        """
+        Swaps an exact amount of a token along the path of pools giving the
+        most output, up to `router.max_hops` pools long.
+
+        Args:
+            sender (User): The user swapping.
+            token_in (Token): The token to sell.
+            token_out (Token): The token to buy.
+            amount_in (float): The amount of `token_in` to sell.
+            min_amount_out (float): The least amount of `token_out` accepted.
+
+        Returns:
+            float: The amount of `token_out` received.
+        """
+        if amount_in <= 0:
+            raise ValueError("Amount must be positive")
+
+        hops, _ = self.router.best_path(token_in, token_out, amount_in)
+
+        amounts = [amount_in]
+        for pool, hop_in, hop_out in hops:
+            amounts.append(self._get_amount_out(pool, hop_in, hop_out, amounts[-1]))
+
+        if amounts[-1] < min_amount_out:
+            raise ValueError(
+                f"Output amount {amounts[-1]} is less than the minimum {min_amount_out}"
+            )
+
+        sender.remove_from_wallet(token_in, amount_in)
+
+        for (pool, hop_in, hop_out), hop_amount_in, hop_amount_out in zip(
+            hops, amounts, amounts[1:]
+        ):
+            pool.add_liquidity(hop_in, hop_amount_in)
+            pool.remove_liquidity(hop_out, hop_amount_out)
+            pool.add_fee(hop_in, hop_amount_in * pool.fee)
+
+        sender.add_to_wallet(token_out, amounts[-1])
+
+        return amounts[-1]
+
     def add_liquidity(
         self,
         sender: User,
@@ -156,41 +396,159 @@ class AmmProtocol(Contract):
         token_2: Token,
         amount_1: float,
         amount_2: float,
-    ):
+    ) -> float:
+        """
+        Deposits tokens in a pool in exchange for newly minted shares.
+
+        Deposits into a pool with shares are proportional to its reserves:
+        the larger of the two amounts, relative to the reserves, is reduced
+        to match the other, and the rest stays in the sender's wallet.
+
+        Args:
+            sender (User): The liquidity provider.
+            token_1 (Token): A token of the pool.
+            token_2 (Token): The other token of the pool.
+            amount_1 (float): The most of `token_1` to deposit.
+            amount_2 (float): The most of `token_2` to deposit.
+
+        Returns:
+            float: The number of shares minted.
+        """
         pool = self._get_pool(token_1, token_2)
 
+        if amount_1 <= 0 or amount_2 <= 0:
+            raise ValueError("Amounts must be positive")
+
+        reserve_1 = pool.token_reserve[token_1]
+        reserve_2 = pool.token_reserve[token_2]
+
+        if pool.total_shares and reserve_1 and reserve_2:
+            if amount_1 / reserve_1 <= amount_2 / reserve_2:
+                amount_2 = min(amount_2, amount_1 * reserve_2 / reserve_1)
+            else:
+                amount_1 = min(amount_1, amount_2 * reserve_1 / reserve_2)
+            shares = amount_1 / reserve_1 * pool.total_shares
+        else:
+            shares = math.sqrt(amount_1 * amount_2)
+
+        if sender.wallet.get(token_1, 0.0) < amount_1:
+            raise ValueError(f"Insufficient {token_1.name} balance")
+        if sender.wallet.get(token_2, 0.0) < amount_2:
+            raise ValueError(f"Insufficient {token_2.name} balance")
+
         sender.remove_from_wallet(token_1, amount_1)
         sender.remove_from_wallet(token_2, amount_2)
 
         pool.add_liquidity(token_1, amount_1)
         pool.add_liquidity(token_2, amount_2)
 
+        pool.mint_shares(sender.address, shares)
+        sender.add_to_wallet(pool.lp_token, shares)
+
+        return shares
+
     def remove_liquidity(
         self,
         sender: User,
         token_1: Token,
         token_2: Token,
-        amount_1: float,
-        amount_2: float,
-    ):
+        shares: float,
+    ) -> tuple[float, float]:
+        """
+        Burns shares of a pool in exchange for their part of its reserves.
+
+        Args:
+            sender (User): The liquidity provider.
+            token_1 (Token): A token of the pool.
+            token_2 (Token): The other token of the pool.
+            shares (float): The number of shares to burn.
+
+        Returns:
+            tuple[float, float]: The amounts of `token_1` and `token_2`
+                withdrawn.
+        """
         pool = self._get_pool(token_1, token_2)
 
+        if shares <= 0:
+            raise ValueError("Shares must be positive")
+
+        position = pool.lp_positions.get(sender.address)
+        if position is None or position.shares < shares:
+            raise ValueError(f"{pool} Insufficient shares")
+
+        fraction = shares / pool.total_shares
+        amount_1 = pool.token_reserve[token_1] * fraction
+        amount_2 = pool.token_reserve[token_2] * fraction
+
+        sender.remove_from_wallet(pool.lp_token, shares)
+        pool.burn_shares(sender.address, shares)
+
         pool.remove_liquidity(token_1, amount_1)
         pool.remove_liquidity(token_2, amount_2)
 
         sender.add_to_wallet(token_1, amount_1)
         sender.add_to_wallet(token_2, amount_2)
 
-    def _get_pool(self, token_1: Token, token_2: Token) -> LiquidityPool:
-        if (token_1, token_2) in self.pools:
-            pool = self.pools[(token_1, token_2)]
-        elif (token_2, token_1) in self.pools:
-            pool = self.pools[(token_2, token_1)]
+        return amount_1, amount_2
+
+    def conflict_keys(self, transaction: "Transaction") -> tuple | None:  # type: ignore
+        """
+        Returns the pool a swap trades against. Routed swaps and liquidity
+        changes may touch the router's caches and the ledger's tokens, so
+        their keys are not known.
+        """
+        operands = getattr(transaction, "operands", None)
+        if operands is not None:
+            if transaction.function != "swap" or len(operands) != 3:
+                return None
+            token_in, token_out = operands[0], operands[1]
         else:
+            if transaction.function != "swap":
+                return None
+            token_in = transaction.args.get("token_in")
+            token_out = transaction.args.get("token_out")
+
+        try:
+            return (self._get_pool(token_in, token_out),)
+        except (AttributeError, ValueError):
+            return None
+
+    def _get_pool(self, token_1: Token, token_2: Token) -> LiquidityPool:
+        token_ids = self.token_ids
+        id_1 = token_ids.get(token_1.name, -1)
+        id_2 = token_ids.get(token_2.name, -2)
+
+        pool = self.pair_index.get((id_1, id_2) if id_1 < id_2 else (id_2, id_1))
+        if pool is None:
             raise ValueError(f"Liquidity pool ({token_1}/{token_2}) does not exist")
 
         return pool
 
+    def _new_pool(
+        self,
+        token_1: Token,
+        token_2: Token,
+        fee: float,
+        reserve_1: float,
+        reserve_2: float,
+    ) -> LiquidityPool:
+        pool = LiquidityPool(token_1, token_2, fee, reserve_1, reserve_2)
+        pool.lp_token = Token(f"{self.name} {token_1.name}/{token_2.name}", 0.0)
+
+        return pool
+
+    def _register_token(self, token: Token) -> int:
+        token_id = self.token_ids.get(token.name)
+        if token_id is None:
+            token_id = self.token_ids[token.name] = len(self.tokens)
+            self.tokens.append(token)
+
+        return token_id
+
+    @staticmethod
+    def _pair(id_1: int, id_2: int) -> tuple[int, int]:
+        return (id_1, id_2) if id_1 < id_2 else (id_2, id_1)
+
     def _get_amount_out(
         self, pool: LiquidityPool, token_in: Token, token_out: Token, amount_in: float
     ) -> float:
@@ -207,3 +565,144 @@ class AmmProtocol(Contract):
 
     def get_pools(self) -> list[LiquidityPool]:
         return list(self.pools.values())
+
+    def quote(
+        self,
+        token_in: Token,
+        token_out: Token,
+        amount_in: np.ndarray | float | None = None,
+        amount_out: np.ndarray | float | None = None,
+    ) -> Quote:
+        """
+        Prices swaps against the pool of a token pair without changing it.
+
+        Exactly one of `amount_in` and `amount_out` is given: an exact input
+        quotes the amount received, an exact output quotes the amount to sell.
+        Outputs the pool cannot pay quote an infinite input.
+
+        Args:
+            token_in (Token): The token to sell.
+            token_out (Token): The token to buy.
+            amount_in (np.ndarray | float | None): The amounts to sell.
+            amount_out (np.ndarray | float | None): The amounts to buy.
+
+        Returns:
+            Quote: The quote of every amount, shaped like the amounts.
+        """
+        return self.quote_pools([(token_in, token_out)], amount_in, amount_out)[0]
+
+    def quote_pools(
+        self,
+        pairs: list[tuple[Token, Token]],
+        amount_in: np.ndarray | float | None = None,
+        amount_out: np.ndarray | float | None = None,
+    ) -> list[Quote]:
+        """
+        Prices swaps against the pools of many token pairs in one vectorized
+        call, without changing them.
+
+        Args:
+            pairs (list[tuple[Token, Token]]): The input and output token of
+                every pool.
+            amount_in (np.ndarray | float | None): The amounts to sell, the
+                same for every pool or one row per pool.
+            amount_out (np.ndarray | float | None): The amounts to buy, the
+                same for every pool or one row per pool.
+
+        Returns:
+            list[Quote]: The quote of every pool, in the order of `pairs`.
+        """
+        if (amount_in is None) == (amount_out is None):
+            raise ValueError("Exactly one of amount_in and amount_out must be given")
+
+        pools = [self._get_pool(token_in, token_out) for token_in, token_out in pairs]
+        amounts = np.asarray(amount_in if amount_out is None else amount_out, float)
+
+        # Amounts with two or more dimensions hold one row per pool, fewer
+        # are broadcast to every pool.
+        if amounts.ndim >= 2 and amounts.shape[0] != len(pools):
+            raise ValueError(
+                f"Expected one row of amounts per pool, got {amounts.shape[0]} rows for {len(pools)} pools"
+            )
+        shape = (len(pools),) + (1,) * (amounts.ndim - (amounts.ndim >= 2))
+
+        reserve_in = np.array(
+            [pool.token_reserve[token_in] for pool, (token_in, _) in zip(pools, pairs)],
+            dtype=float,
+        ).reshape(shape)
+        reserve_out = np.array(
+            [
+                pool.token_reserve[token_out]
+                for pool, (_, token_out) in zip(pools, pairs)
+            ],
+            dtype=float,
+        ).reshape(shape)
+        fee = np.array([pool.fee for pool in pools], dtype=float).reshape(shape)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if amount_out is None:
+                amounts_in = np.broadcast_to(
+                    amounts, np.broadcast_shapes(shape, amounts.shape)
+                )
+                amounts_out = self._get_amounts_out(
+                    reserve_in, reserve_out, amounts_in, fee
+                )
+            else:
+                amounts_out = np.broadcast_to(
+                    amounts, np.broadcast_shapes(shape, amounts.shape)
+                )
+                amounts_in = self._get_amounts_in(
+                    reserve_in, reserve_out, amounts_out, fee
+                )
+
+            spot_price = reserve_out / reserve_in
+            marginal_price = spot_price * (1 - fee)
+            execution_price = np.where(
+                amounts_in > 0, amounts_out / amounts_in, marginal_price
+            )
+            price_impact = 1 - execution_price / marginal_price
+
+        spot_price = np.broadcast_to(spot_price, amounts_in.shape)
+
+        return [
+            Quote(
+                amount_in=amounts_in[row],
+                amount_out=amounts_out[row],
+                execution_price=execution_price[row],
+                spot_price=spot_price[row],
+                price_impact=price_impact[row],
+            )
+            for row in range(len(pools))
+        ]
+
+    def _get_amounts_out(
+        self,
+        reserve_in: np.ndarray,
+        reserve_out: np.ndarray,
+        amount_in: np.ndarray,
+        fee: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Returns the output amount of swaps element-wise, with the same
+        arithmetic as `_get_amount_out`.
+        """
+        new_reserve_in = reserve_in + amount_in * (1 - fee)
+
+        return reserve_out - (reserve_in * reserve_out / new_reserve_in)
+
+    def _get_amounts_in(
+        self,
+        reserve_in: np.ndarray,
+        reserve_out: np.ndarray,
+        amount_out: np.ndarray,
+        fee: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Returns the input amount needed for each output amount element-wise,
+        or infinity where the pool cannot pay it.
+        """
+        new_reserve_in = reserve_in * reserve_out / (reserve_out - amount_out)
+
+        return np.where(
+            amount_out < reserve_out, (new_reserve_in - reserve_in) / (1 - fee), np.inf
+        )
@@ -1,9 +1,33 @@
+import inspect
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import Any, Callable
 
 from market.actors.user import User
 
 
+@dataclass
+class DispatchTable:
+    """
+    Represents the functions of a contract indexed by opcode.
+
+    Opcode `i` is the `i`-th function of the contract's `functions`, called
+    with the sender and then its operands positionally.
+
+    Attributes:
+        opcodes (dict[str, int]): The opcode of each function name.
+        functions (list[Callable]): The function of each opcode.
+        names (list[str]): The name of each opcode.
+        operands (list[tuple[str, ...]]): The names of the operands of each
+            opcode, in the order of the function's parameters.
+    """
+
+    opcodes: dict[str, int]
+    functions: list[Callable]
+    names: list[str]
+    operands: list[tuple[str, ...]]
+
+
 class Contract(ABC):
     @abstractmethod
     def __init__(self):
@@ -14,5 +38,76 @@ class Contract(ABC):
     def process(self, function: str, sender: User, **kwargs: dict[str, Any]) -> Any:  # type: ignore
         return self.functions[function](sender=sender, **kwargs)
 
+    def process_batch(self, transactions: list["Transaction"]) -> list[bool]:  # type: ignore
+        """
+        Processes a run of consecutive transactions sent to this contract.
+
+        Contracts with a faster batch path override this; the default simply
+        processes the transactions one by one, in order.
+
+        Args:
+            transactions (list[Transaction]): The transactions to process.
+
+        Returns:
+            list[bool]: Whether each transaction succeeded.
+        """
+        return [transaction.process() for transaction in transactions]
+
+    def conflict_keys(self, transaction: "Transaction") -> tuple | None:  # type: ignore
+        """
+        Returns the shared objects a transaction may change besides its
+        sender's wallet, so transactions with no object in common can run
+        concurrently. The objects provide `snapshot` and `restore`, so an
+        execution can be rolled back.
+
+        Contracts that can tell override this; the default returns None,
+        meaning the transaction may change anything.
+
+        Args:
+            transaction (Transaction): A transaction sent to this contract.
+
+        Returns:
+            tuple | None: The objects, or None if they are not known.
+        """
+        return None
+
+    @property
+    def dispatch(self) -> DispatchTable:
+        """
+        Returns the dispatch table of the contract, compiled from `functions`
+        on first use.
+        """
+        table = self.__dict__.get("_dispatch")
+        if table is None:
+            names = list(self.functions)
+            functions = list(self.functions.values())
+            table = self._dispatch = DispatchTable(
+                opcodes={name: opcode for opcode, name in enumerate(names)},
+                functions=functions,
+                names=names,
+                operands=[
+                    tuple(inspect.signature(function).parameters)[1:]
+                    for function in functions
+                ],
+            )
+
+        return table
+
+    def opcode(self, function: str) -> int:
+        """
+        Returns the opcode of a function.
+
+        Args:
+            function (str): The name of the function.
+
+        Returns:
+            int: The opcode of the function.
+        """
+        opcode = self.dispatch.opcodes.get(function)
+        if opcode is None:
+            raise ValueError(f"{self.name} has no function {function!r}")
+
+        return opcode
+
     def connect_blockchain(self, blockchain: "Blockchain"):  # type: ignore
         self.blockchain = blockchain
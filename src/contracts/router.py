@@ -0,0 +1,338 @@
+import heapq
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+from market.token import Token
+
+
+@dataclass
+class Route:
+    """
+    Represents the candidate paths between two tokens and a reserve table of
+    the pools they go through.
+
+    Attributes:
+        pools (list[LiquidityPool]): The pools on any candidate path.
+        versions (list[int]): The version of each pool when its reserves
+            were last read.
+        reserves (np.ndarray): The reserves of each pool, in the pool's
+            token order.
+        fees (np.ndarray): The fee of each pool.
+        paths (list[list[int]]): The token IDs along each candidate path,
+            longest first.
+        hops (np.ndarray): The index in `pools` of each hop of each path,
+            padded to the longest path.
+        reserves_in (list[np.ndarray]): For every hop, the flat index in
+            `reserves` of the input reserve of each path long enough.
+        reserves_out (list[np.ndarray]): For every hop, the flat index in
+            `reserves` of the output reserve of each path long enough.
+    """
+
+    pools: list["LiquidityPool"]  # type: ignore
+    versions: list[int]
+    reserves: np.ndarray
+    fees: np.ndarray
+    paths: list[list[int]]
+    hops: np.ndarray
+    reserves_in: list[np.ndarray]
+    reserves_out: list[np.ndarray]
+
+
+class Router:
+    """
+    Finds the multi-hop path giving the most output for a swap over the pool
+    graph of an AMM contract.
+
+    The candidate paths between two tokens are found with a beam search over
+    the log spot rates of the pools: hop by hop, only the `max_paths` best
+    partial paths into every token are extended, so the search costs
+    O(max_hops * max_paths * pools) however dense the graph is. The direct
+    pool, if any, is always a candidate. Candidates are ranked by the spot
+    rates when a pair is first routed and cached per pair, and creating a
+    pool only drops the routes it could be on. Each
+    cached route also keeps a table of its pools' reserves, and a lookup
+    only re-reads the pools whose version changed since the last one.
+    Pricing every candidate path is then a few array operations per hop.
+
+    Attributes:
+        contract (AmmProtocol): The contract whose pools are routed over.
+        max_hops (int): The maximum number of pools on a path.
+        max_paths (int): The maximum number of candidate paths per pair.
+    """
+
+    def __init__(
+        self, contract: "AmmProtocol", max_hops: int = 3, max_paths: int = 8  # type: ignore
+    ):
+        if max_hops < 1:
+            raise ValueError("max_hops must be at least 1")
+
+        if max_paths < 1:
+            raise ValueError("max_paths must be at least 1")
+
+        self.contract = contract
+        self.max_hops = max_hops
+        self.max_paths = max_paths
+
+        self._graph: dict[int, dict[int, "LiquidityPool"]] | None = None  # type: ignore
+        self._routes: dict[tuple[int, int], Route] = {}
+
+    def __repr__(self) -> str:
+        return f"Router(contract={self.contract.name!r}, max_hops={self.max_hops}, routes={len(self._routes)})"
+
+    def invalidate(self, pair: tuple[int, int] | None = None) -> None:
+        """
+        Drops the cached routes a new pool could be on, after it was created.
+
+        Args:
+            pair (tuple[int, int] | None): The token IDs of the new pool, or
+                None to drop every cached route.
+        """
+        if pair is None or self._graph is None:
+            self._graph = None
+            self._routes.clear()
+            return
+
+        id_1, id_2 = pair
+        pool = self.contract.pair_index[pair]
+        self._graph.setdefault(id_1, {})[id_2] = pool
+        self._graph.setdefault(id_2, {})[id_1] = pool
+        if not self._routes:
+            return
+
+        # A path through the new pool reaches one of its tokens and leaves
+        # from the other within the remaining hops.
+        reach = self.max_hops - 1
+        distances_1 = self._distances(id_1, reach)
+        distances_2 = self._distances(id_2, reach)
+        stale = [
+            (id_in, id_out)
+            for id_in, id_out in self._routes
+            if min(
+                distances_1.get(id_in, reach + 1) + distances_2.get(id_out, reach + 1),
+                distances_2.get(id_in, reach + 1) + distances_1.get(id_out, reach + 1),
+            )
+            <= reach
+        ]
+        for key in stale:
+            del self._routes[key]
+
+    def best_path(
+        self, token_in: Token, token_out: Token, amount_in: float
+    ) -> tuple[list[tuple["LiquidityPool", Token, Token]], float]:  # type: ignore
+        """
+        Returns the path giving the most output for a swap.
+
+        Args:
+            token_in (Token): The token to sell.
+            token_out (Token): The token to buy.
+            amount_in (float): The amount of `token_in` to sell.
+
+        Returns:
+            tuple[list[tuple[LiquidityPool, Token, Token]], float]: The pool,
+                input and output token of every hop, and the estimated output
+                amount.
+        """
+        route = self.route(token_in, token_out)
+
+        amounts = self.quote_paths(route, amount_in)
+        best = int(np.argmax(amounts))
+
+        tokens = self.contract.tokens
+        path = route.paths[best]
+        hops = [
+            (
+                route.pools[route.hops[best, hop]],
+                tokens[path[hop]],
+                tokens[path[hop + 1]],
+            )
+            for hop in range(len(path) - 1)
+        ]
+
+        return hops, float(amounts[best])
+
+    def route(self, token_in: Token, token_out: Token) -> Route:
+        """
+        Returns the cached route between two tokens, with its reserve table
+        brought up to date.
+        """
+        token_ids = self.contract.token_ids
+        id_in = token_ids.get(token_in.name)
+        id_out = token_ids.get(token_out.name)
+        if id_in is None or id_out is None or id_in == id_out:
+            raise ValueError(f"No path from {token_in.name} to {token_out.name}")
+
+        route = self._routes.get((id_in, id_out))
+        if route is None:
+            route = self._routes[(id_in, id_out)] = self._build_route(id_in, id_out)
+            return route
+
+        versions = [pool.version for pool in route.pools]
+        if versions != route.versions:
+            for index, (version, previous) in enumerate(zip(versions, route.versions)):
+                if version != previous:
+                    pool = route.pools[index]
+                    route.reserves[index] = list(pool.token_reserve.values())
+                    route.fees[index] = pool.fee
+            route.versions = versions
+
+        return route
+
+    def quote_paths(self, route: Route, amount_in: float) -> np.ndarray:
+        """
+        Returns the output amount of every candidate path of a route.
+        """
+        amounts = np.full(len(route.paths), float(amount_in))
+        reserves = route.reserves.reshape(-1)
+        fees = route.fees
+
+        # Paths are sorted longest first, so the paths with a given hop are a
+        # prefix of the table.
+        for reserves_in, reserves_out in zip(route.reserves_in, route.reserves_out):
+            num_paths = len(reserves_in)
+            amounts[:num_paths] = self.contract._get_amounts_out(
+                reserves[reserves_in],
+                reserves[reserves_out],
+                amounts[:num_paths],
+                fees[reserves_in // 2],
+            )
+
+        return amounts
+
+    def _build_route(self, id_in: int, id_out: int) -> Route:
+        tokens = self.contract.tokens
+        paths = self._find_paths(id_in, id_out)
+        if not paths:
+            raise ValueError(
+                f"No path from {tokens[id_in].name} to {tokens[id_out].name}"
+            )
+
+        paths.sort(key=len, reverse=True)
+        graph = self._get_graph()
+        pool_index: dict[int, int] = {}
+        pools = []
+        hops = np.zeros((len(paths), len(paths[0]) - 1), dtype=int)
+        sides = np.zeros(hops.shape, dtype=int)
+
+        for row, path in enumerate(paths):
+            for hop, (id_1, id_2) in enumerate(zip(path, path[1:])):
+                pool = graph[id_1][id_2]
+                index = pool_index.get(id(pool))
+                if index is None:
+                    index = pool_index[id(pool)] = len(pools)
+                    pools.append(pool)
+
+                hops[row, hop] = index
+                first_token = next(iter(pool.token_reserve))
+                sides[row, hop] = 0 if first_token.name == tokens[id_1].name else 1
+
+        lengths = [len(path) - 1 for path in paths]
+        counts = [
+            sum(length > hop for length in lengths) for hop in range(hops.shape[1])
+        ]
+
+        return Route(
+            pools=pools,
+            versions=[pool.version for pool in pools],
+            reserves=np.array(
+                [list(pool.token_reserve.values()) for pool in pools], dtype=float
+            ),
+            fees=np.array([pool.fee for pool in pools], dtype=float),
+            paths=paths,
+            hops=hops,
+            reserves_in=[
+                hops[:count, hop] * 2 + sides[:count, hop]
+                for hop, count in enumerate(counts)
+            ],
+            reserves_out=[
+                hops[:count, hop] * 2 + 1 - sides[:count, hop]
+                for hop, count in enumerate(counts)
+            ],
+        )
+
+    def _find_paths(self, id_in: int, id_out: int) -> list[list[int]]:
+        graph = self._get_graph()
+        tokens = self.contract.tokens
+        rates: dict[tuple[int, int], float] = {}
+
+        def log_rate(id_1: int, id_2: int) -> float:
+            rate = rates.get((id_1, id_2))
+            if rate is None:
+                pool = graph[id_1][id_2]
+                (token, reserve_1), (_, reserve_2) = pool.token_reserve.items()
+                if token.name != tokens[id_1].name:
+                    reserve_1, reserve_2 = reserve_2, reserve_1
+                rate = rates[(id_1, id_2)] = (
+                    math.log(reserve_2 / reserve_1) + math.log1p(-pool.fee)
+                    if reserve_1 > 0 and reserve_2 > 0
+                    else -math.inf
+                )
+
+            return rate
+
+        frontier: dict[int, list[tuple[float, list[int]]]] = {id_in: [(0.0, [id_in])]}
+        paths: list[tuple[float, list[int]]] = []
+
+        for _ in range(self.max_hops):
+            extended: dict[int, list[tuple[float, list[int]]]] = {}
+            for token_id, partial in frontier.items():
+                for score, path in partial:
+                    for neighbor in graph.get(token_id, {}):
+                        if neighbor in path:
+                            continue
+
+                        rate = log_rate(token_id, neighbor)
+                        if rate == -math.inf:
+                            continue
+
+                        if neighbor == id_out:
+                            paths.append((score + rate, path + [neighbor]))
+                        else:
+                            extended.setdefault(neighbor, []).append(
+                                (score + rate, path + [neighbor])
+                            )
+
+            frontier = {
+                token_id: heapq.nlargest(self.max_paths, partial, key=_score)
+                for token_id, partial in extended.items()
+            }
+
+        best = [path for _, path in heapq.nlargest(self.max_paths, paths, key=_score)]
+        if id_out in graph.get(id_in, {}) and [id_in, id_out] not in best:
+            best.append([id_in, id_out])
+
+        return best
+
+    def _distances(self, token_id: int, reach: int) -> dict[int, int]:
+        """
+        Returns the number of hops to every token at most `reach` hops away.
+        """
+        graph = self._get_graph()
+        distances = {token_id: 0}
+        layer = [token_id]
+
+        for distance in range(1, reach + 1):
+            next_layer = []
+            for current in layer:
+                for neighbor in graph.get(current, {}):
+                    if neighbor not in distances:
+                        distances[neighbor] = distance
+                        next_layer.append(neighbor)
+            layer = next_layer
+
+        return distances
+
+    def _get_graph(self) -> dict[int, dict[int, "LiquidityPool"]]:  # type: ignore
+        if self._graph is None:
+            graph: dict[int, dict] = {}
+            for (id_1, id_2), pool in self.contract.pair_index.items():
+                graph.setdefault(id_1, {})[id_2] = pool
+                graph.setdefault(id_2, {})[id_1] = pool
+            self._graph = graph
+
+        return self._graph
+
+
+def _score(candidate: tuple[float, list[int]]) -> float:
+    return candidate[0]
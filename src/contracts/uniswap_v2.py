@@ -1,6 +1,61 @@
+import numpy as np
+
 from contracts.amm_protocol import AmmProtocol, LiquidityPool
 from market.token import Token
 
+# Swaps are compiled in chunks that start at this size, double when every swap
+# in them executes and halve when one fails, so a failing swap only discards
+# the rest of its chunk and runs of failures fall back to one at a time.
+INITIAL_CHUNK_SIZE = 64
+
+
+def get_amount_out(
+    reserve_in: np.ndarray | float,
+    reserve_out: np.ndarray | float,
+    amount_in: np.ndarray | float,
+    fee: np.ndarray | float,
+) -> np.ndarray | float:
+    """
+    Returns the constant-product output amount of a swap.
+
+    Works element-wise on scalars and arrays alike, so a whole set of pools
+    or trades can be priced in one call.
+
+    Args:
+        reserve_in (np.ndarray | float): The reserve of the input token.
+        reserve_out (np.ndarray | float): The reserve of the output token.
+        amount_in (np.ndarray | float): The amount of the input token.
+        fee (np.ndarray | float): The fee of the pool.
+    """
+    amount_in_with_fee = amount_in * (1 - fee)
+
+    return amount_in_with_fee * reserve_out / (reserve_in + amount_in_with_fee)
+
+
+def get_amount_in(
+    reserve_in: np.ndarray | float,
+    reserve_out: np.ndarray | float,
+    amount_out: np.ndarray | float,
+    fee: np.ndarray | float,
+) -> np.ndarray | float:
+    """
+    Returns the constant-product input amount needed to buy `amount_out`,
+    the inverse of `get_amount_out`.
+
+    Works element-wise on scalars and arrays alike. Outputs the pool cannot
+    pay, at or above `reserve_out`, need an infinite input.
+
+    Args:
+        reserve_in (np.ndarray | float): The reserve of the input token.
+        reserve_out (np.ndarray | float): The reserve of the output token.
+        amount_out (np.ndarray | float): The amount of the output token.
+        fee (np.ndarray | float): The fee of the pool.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amount_in = reserve_in * amount_out / ((reserve_out - amount_out) * (1 - fee))
+
+    return np.where(np.less(amount_out, reserve_out), amount_in, np.inf)
+
 
 class UniswapV2(AmmProtocol):
     """
@@ -16,9 +71,252 @@ class UniswapV2(AmmProtocol):
         reserve_in = pool.token_reserve[token_in]
         reserve_out = pool.token_reserve[token_out]
 
-        amount_in_with_fee = amount_in * (1 - pool.fee)
+        return get_amount_out(reserve_in, reserve_out, amount_in, pool.fee)
+
+    def _get_amounts_out(
+        self,
+        reserve_in: np.ndarray,
+        reserve_out: np.ndarray,
+        amount_in: np.ndarray,
+        fee: np.ndarray,
+    ) -> np.ndarray:
+        return get_amount_out(reserve_in, reserve_out, amount_in, fee)
+
+    def _get_amounts_in(
+        self,
+        reserve_in: np.ndarray,
+        reserve_out: np.ndarray,
+        amount_out: np.ndarray,
+        fee: np.ndarray,
+    ) -> np.ndarray:
+        return get_amount_in(reserve_in, reserve_out, amount_out, fee)
+
+    def process_batch(self, transactions: list["Transaction"]) -> list[bool]:  # type: ignore
+        """
+        Processes a run of transactions, executing consecutive swaps in bulk.
+
+        Swaps are grouped by pool into reserve and balance arrays and the
+        constant-product updates are applied in mempool order, so the final
+        reserves and wallets match the sequential path exactly. Any other
+        function, and any swap that would fail, goes through
+        `Transaction.process` so errors are reported the usual way.
+
+        Args:
+            transactions (list[Transaction]): The transactions to process.
+
+        Returns:
+            list[bool]: Whether each transaction succeeded.
+        """
+        statuses: list[bool] = []
+
+        start = 0
+        chunk_size = INITIAL_CHUNK_SIZE
+        while start < len(transactions):
+            if chunk_size == 1:
+                statuses.append(transactions[start].process())
+                start += 1
+                chunk_size = 2 if statuses[-1] else 1
+                continue
+
+            end = min(start + chunk_size, len(transactions))
+            stop = self._execute_swaps(transactions, start, end)
+            statuses.extend([True] * (stop - start))
+
+            if stop == end:
+                chunk_size *= 2
+            else:
+                statuses.append(transactions[stop].process())
+                stop += 1
+                chunk_size //= 2
+
+            start = stop
+
+        return statuses
+
+    def _execute_swaps(self, transactions: list["Transaction"], start: int, end: int) -> int:  # type: ignore
+        """
+        Executes the swaps from `start` up to `end` until the first
+        transaction that is not a swap or that would raise.
+
+        Returns:
+            int: The index of the first transaction that was not executed.
+        """
+        ledger = transactions[start].sender.ledger
+        token_ids = ledger.token_ids
+
+        pool_list: list[LiquidityPool] = []
+        pairs: dict[tuple[int, int], tuple[int, int, int, int]] = {}
+
+        pool_idx, directions, tokens_in, tokens_out = [], [], [], []
+        amounts, user_ids = [], []
 
-        amount_out = (
-            amount_in_with_fee * reserve_out / (reserve_in + amount_in_with_fee)
+        swap = self.opcode("swap")
+
+        stop = start
+        for index in range(start, end):
+            transaction = transactions[index]
+            # Compiled transactions carry positional operands.
+            operands = getattr(transaction, "operands", None)
+            if operands is not None:
+                if transaction.opcode != swap or len(operands) != 3:
+                    break
+
+                token_in, token_out, amount_in = operands
+            else:
+                args = transaction.args
+                if transaction.function != "swap" or len(args) != 3:
+                    break
+
+                try:
+                    token_in, token_out = args["token_in"], args["token_out"]
+                    amount_in = args["amount_in"]
+                except KeyError:
+                    break
+
+            if not isinstance(amount_in, (int, float)):
+                break
+
+            if transaction.sender.ledger is not ledger:
+                break
+
+            pair = pairs.get((id(token_in), id(token_out)))
+            if pair is None:
+                try:
+                    pool = self._get_pool(token_in, token_out)
+                    token_id_in = token_ids[token_in.name]
+                    token_id_out = token_ids[token_out.name]
+                except (KeyError, ValueError):
+                    break
+
+                if pool not in pool_list:
+                    pool_list.append(pool)
+
+                direction = 0 if next(iter(pool.token_reserve)) == token_in else 1
+                pair = (pool_list.index(pool), direction, token_id_in, token_id_out)
+                pairs[(id(token_in), id(token_out))] = pair
+
+            pool_idx.append(pair[0])
+            directions.append(pair[1])
+            tokens_in.append(pair[2])
+            tokens_out.append(pair[3])
+            amounts.append(amount_in)
+            user_ids.append(transaction.sender.user_id)
+            stop += 1
+
+        if stop == start:
+            return start
+
+        reserves = np.array(
+            [list(pool.token_reserve.values()) for pool in pool_list], dtype=float
+        )
+        fees = np.array([pool.fee for pool in pool_list])
+        amounts_in = np.array(amounts, dtype=float)
+        amounts_in_with_fee = amounts_in * (1 - fees[pool_idx])
+
+        # Each (user, token) cell touched by the batch gets a slot, addressed
+        # by its flat index into the ledger arrays.
+        num_tokens = ledger._balances.shape[1]
+        senders = np.array(user_ids) * num_tokens
+        cells = np.concatenate(
+            (senders + np.array(tokens_in), senders + np.array(tokens_out))
+        )
+        cells, slots = np.unique(cells, return_inverse=True)
+
+        balances = ledger._balances.reshape(-1)[cells]
+        present = ledger._held.reshape(-1)[cells]
+
+        executed = self._apply_swaps(
+            reserves,
+            balances,
+            present,
+            pool_idx,
+            directions,
+            amounts_in.tolist(),
+            amounts_in_with_fee.tolist(),
+            slots[: len(amounts)].tolist(),
+            slots[len(amounts) :].tolist(),
         )
-        return amount_out
+
+        pool_reserves = reserves.tolist()
+        for pool in set(pool_idx[:executed]):
+            reserve_1, reserve_2 = pool_reserves[pool]
+            token_1, token_2 = pool_list[pool].token_reserve
+            pool_list[pool].token_reserve[token_1] = reserve_1
+            pool_list[pool].token_reserve[token_2] = reserve_2
+            pool_list[pool].version += 1
+
+        # Fees accrue swap by swap, as they do when swaps run one at a time.
+        pool_tokens = [list(pool.token_reserve) for pool in pool_list]
+        for pool, direction, amount_in in zip(pool_idx[:executed], directions, amounts):
+            pool_list[pool].add_fee(
+                pool_tokens[pool][direction], amount_in * pool_list[pool].fee
+            )
+
+        ledger.write_cells(cells, balances, present)
+
+        return start + executed
+
+    @staticmethod
+    def _apply_swaps(
+        reserves: np.ndarray,
+        balances: np.ndarray,
+        present: np.ndarray,
+        pool_idx: list[int],
+        directions: list[int],
+        amounts_in: list[float],
+        amounts_in_with_fee: list[float],
+        slots_in: list[int],
+        slots_out: list[int],
+    ) -> int:
+        """
+        Applies the compiled swaps in order, updating `reserves`, `balances`
+        and `present` in place, and stops before the first swap that would
+        fail.
+
+        Returns:
+            int: The number of swaps applied.
+        """
+        pool_reserves = reserves.tolist()
+        wallet = balances.tolist()
+        held = present.tolist()
+
+        executed = 0
+        for pool, direction, amount_in, amount_in_with_fee, slot_in, slot_out in zip(
+            pool_idx, directions, amounts_in, amounts_in_with_fee, slots_in, slots_out
+        ):
+            pool_reserve = pool_reserves[pool]
+            reserve_in = pool_reserve[direction]
+            reserve_out = pool_reserve[1 - direction]
+
+            amount_out = (
+                amount_in_with_fee * reserve_out / (reserve_in + amount_in_with_fee)
+            )
+
+            if (
+                not held[slot_in]
+                or amount_in < 0
+                or wallet[slot_in] < amount_in
+                or reserve_out < amount_out
+                or amount_out < 0
+            ):
+                break
+
+            wallet[slot_in] -= amount_in
+            if wallet[slot_in] == 0:
+                held[slot_in] = False
+
+            pool_reserve[direction] = reserve_in + amount_in
+            pool_reserve[1 - direction] = reserve_out - amount_out
+
+            if not held[slot_out]:
+                held[slot_out] = True
+                wallet[slot_out] = 0.0
+            wallet[slot_out] += amount_out
+
+            executed += 1
+
+        reserves[:] = pool_reserves
+        balances[:] = wallet
+        present[:] = held
+
+        return executed
@@ -0,0 +1,891 @@
+import math
+
+import numpy as np
+
+from contracts.amm_protocol import AmmProtocol, LiquidityPool, Quote
+from market.actors.user import User
+from market.token import Token
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+
+# The tick spacing of each standard fee tier, and of any other fee.
+FEE_TICK_SPACINGS = {0.0001: 1, 0.0005: 10, 0.003: 60, 0.01: 200}
+DEFAULT_TICK_SPACING = 60
+
+# Ticks are powers of 1.0001 of the price, so half-ticks of its square root.
+LOG_SQRT_TICK_BASE = math.log(1.0001) / 2
+
+
+def sqrt_price_at_tick(tick: int) -> float:
+    return math.exp(tick * LOG_SQRT_TICK_BASE)
+
+
+def tick_at_sqrt_price(sqrt_price: float) -> int:
+    """
+    Returns the greatest tick whose square root price is at most `sqrt_price`.
+    """
+    tick = math.floor(math.log(sqrt_price) / LOG_SQRT_TICK_BASE)
+    if sqrt_price_at_tick(tick + 1) <= sqrt_price:
+        tick += 1
+    elif sqrt_price_at_tick(tick) > sqrt_price:
+        tick -= 1
+
+    return tick
+
+
+class TickBitmap:
+    """
+    Represents the initialized ticks of a pool as 256-bit words, one bit per
+    multiple of the tick spacing.
+
+    Only words with an initialized tick are stored, and finding the next
+    initialized tick within a word is a mask and a bit scan.
+
+    Attributes:
+        tick_spacing (int): The spacing of the ticks.
+        words (dict[int, int]): The non-empty words, by word position.
+    """
+
+    def __init__(self, tick_spacing: int):
+        self.tick_spacing = tick_spacing
+        self.words: dict[int, int] = {}
+
+    def flip(self, tick: int) -> None:
+        """
+        Flips whether a tick, a multiple of the tick spacing, is initialized.
+        """
+        if tick % self.tick_spacing:
+            raise ValueError(f"Tick {tick} is not a multiple of {self.tick_spacing}")
+
+        compressed = tick // self.tick_spacing
+        word_pos = compressed >> 8
+        word = self.words.get(word_pos, 0) ^ (1 << (compressed & 255))
+        if word:
+            self.words[word_pos] = word
+        else:
+            del self.words[word_pos]
+
+    def is_initialized(self, tick: int) -> bool:
+        compressed = tick // self.tick_spacing
+        return bool(self.words.get(compressed >> 8, 0) >> (compressed & 255) & 1)
+
+    def next_initialized_tick(self, tick: int, lte: bool) -> tuple[int, bool]:
+        """
+        Returns the next initialized tick in the word of `tick`, or the edge
+        of that word if it has none.
+
+        Args:
+            tick (int): The tick to search from.
+            lte (bool): Whether to search down, from `tick` included, or up,
+                from above `tick`.
+
+        Returns:
+            tuple[int, bool]: The tick found and whether it is initialized.
+        """
+        spacing = self.tick_spacing
+        compressed = tick // spacing
+
+        if lte:
+            bit_pos = compressed & 255
+            masked = self.words.get(compressed >> 8, 0) & ((2 << bit_pos) - 1)
+            if masked:
+                return (compressed - bit_pos + masked.bit_length() - 1) * spacing, True
+            return (compressed - bit_pos) * spacing, False
+
+        compressed += 1
+        bit_pos = compressed & 255
+        masked = self.words.get(compressed >> 8, 0) >> bit_pos
+        if masked:
+            return (compressed + (masked & -masked).bit_length() - 1) * spacing, True
+        return (compressed + 255 - bit_pos) * spacing, False
+
+
+class Tick:
+    """
+    Represents an initialized tick.
+
+    Attributes:
+        liquidity_gross (float): The liquidity of the positions bounded by
+            the tick.
+        liquidity_net (float): The liquidity added to the active liquidity
+            when the price crosses the tick upwards.
+        fee_growth_outside (list[float]): The fee growth per unit of
+            liquidity of each token on the other side of the tick from the
+            current price.
+    """
+
+    __slots__ = ("liquidity_gross", "liquidity_net", "fee_growth_outside")
+
+    def __init__(self, fee_growth_outside: list[float]):
+        self.liquidity_gross = 0.0
+        self.liquidity_net = 0.0
+        self.fee_growth_outside = fee_growth_outside
+
+
+class Position:
+    """
+    Represents the liquidity of one owner in one tick range.
+
+    Attributes:
+        liquidity (float): The liquidity of the position.
+        fee_growth_inside_last (list[float]): The fee growth per unit of
+            liquidity inside the range when the position was last updated.
+        tokens_owed (list[float]): The fees of each token owed to the owner.
+    """
+
+    __slots__ = ("liquidity", "fee_growth_inside_last", "tokens_owed")
+
+    def __init__(self):
+        self.liquidity = 0.0
+        self.fee_growth_inside_last = [0.0, 0.0]
+        self.tokens_owed = [0.0, 0.0]
+
+
+class ConcentratedPool(LiquidityPool):
+    """
+    Represents a concentrated-liquidity pool, in which liquidity is provided
+    over tick ranges.
+
+    Prices are of the second token in the first, and `token_reserve` holds
+    the tokens deposited in the pool, uncollected fees included.
+
+    Additional Attributes:
+        tick_spacing (int): The spacing of the ticks positions may bound.
+        sqrt_price (float): The square root of the current price.
+        tick (int): The tick of the current price.
+        liquidity (float): The liquidity active at the current price.
+        ticks (dict[int, Tick]): The initialized ticks.
+        bitmap (TickBitmap): The index of the initialized ticks.
+        positions (dict[tuple[str | None, int, int], Position]): The positions
+            by owner address, lower and upper tick.
+        fee_growth_global (list[float]): The fees of each token earned per
+            unit of liquidity since the pool was created.
+    """
+
+    def __init__(
+        self,
+        token_1: Token,
+        token_2: Token,
+        fee: float,
+        price: float = 1.0,
+        tick_spacing: int | None = None,
+    ):
+        """
+        Initializes an empty concentrated-liquidity pool.
+
+        Args:
+            token_1 (Token): The first token in the liquidity pool.
+            token_2 (Token): The second token in the liquidity pool.
+            fee (float): The fee of the liquidity pool.
+            price (float): The initial price of the second token in the first.
+            tick_spacing (int | None): The tick spacing, by default the one
+                of the fee tier.
+        """
+        super().__init__(token_1, token_2, fee)
+
+        if price <= 0:
+            raise ValueError("Price must be positive")
+
+        self.tick_spacing = tick_spacing or FEE_TICK_SPACINGS.get(
+            fee, DEFAULT_TICK_SPACING
+        )
+        self.sqrt_price = math.sqrt(price)
+        self.tick = tick_at_sqrt_price(self.sqrt_price)
+        self.liquidity = 0.0
+
+        self.ticks: dict[int, Tick] = {}
+        self.bitmap = TickBitmap(self.tick_spacing)
+        self.positions: dict[tuple[str | None, int, int], Position] = {}
+        self.fee_growth_global = [0.0, 0.0]
+
+        # The widest range of ticks positions may bound.
+        self.min_tick = -(-MIN_TICK // self.tick_spacing) * self.tick_spacing
+        self.max_tick = MAX_TICK // self.tick_spacing * self.tick_spacing
+
+    @property
+    def price(self) -> float:
+        return self.sqrt_price**2
+
+    def snapshot(self) -> tuple:
+        """
+        Returns the state that swaps and position changes change, ticks and
+        positions included, to be restored by `restore`.
+        """
+        return (
+            super().snapshot(),
+            self.sqrt_price,
+            self.tick,
+            self.liquidity,
+            list(self.fee_growth_global),
+            {
+                tick: (
+                    info.liquidity_gross,
+                    info.liquidity_net,
+                    list(info.fee_growth_outside),
+                )
+                for tick, info in self.ticks.items()
+            },
+            dict(self.bitmap.words),
+            {
+                key: (
+                    position.liquidity,
+                    list(position.fee_growth_inside_last),
+                    list(position.tokens_owed),
+                )
+                for key, position in self.positions.items()
+            },
+        )
+
+    def restore(self, state: tuple) -> None:
+        """
+        Restores the state returned by `snapshot`.
+        """
+        (
+            reserves,
+            self.sqrt_price,
+            self.tick,
+            self.liquidity,
+            fee_growth_global,
+            ticks,
+            words,
+            positions,
+        ) = state
+        super().restore(reserves)
+        self.fee_growth_global[:] = fee_growth_global
+
+        self.ticks.clear()
+        for tick, (liquidity_gross, liquidity_net, fee_growth_outside) in ticks.items():
+            info = self.ticks[tick] = Tick(list(fee_growth_outside))
+            info.liquidity_gross = liquidity_gross
+            info.liquidity_net = liquidity_net
+        self.bitmap.words = dict(words)
+
+        self.positions.clear()
+        for key, (liquidity, fee_growth_inside_last, tokens_owed) in positions.items():
+            position = self.positions[key] = Position()
+            position.liquidity = liquidity
+            position.fee_growth_inside_last = list(fee_growth_inside_last)
+            position.tokens_owed = list(tokens_owed)
+
+    def simulate_swap(
+        self, zero_for_one: bool, amount_in: float
+    ) -> tuple[float, float, float, int, float, float, list[tuple[int, float]]]:
+        """
+        Computes a swap of an exact input without changing the pool.
+
+        The price moves in steps that end at the next initialized tick or
+        at a word boundary of the bitmap, so uninitialized ticks cost nothing.
+
+        Args:
+            zero_for_one (bool): Whether the first token is sold.
+            amount_in (float): The amount sold, fee included.
+
+        Returns:
+            tuple[float, float, float, int, float, float,
+                list[tuple[int, float]]]: The amount out, the fee paid, the
+                new square root price, tick and active liquidity, the fee
+                growth per unit of liquidity, and the initialized ticks
+                crossed with the fee growth of the swap when each was
+                crossed.
+        """
+        if amount_in <= 0:
+            raise ValueError("Amount must be positive")
+
+        fee = self.fee
+        sqrt_price = self.sqrt_price
+        tick = self.tick
+        liquidity = self.liquidity
+        limit_tick = self.min_tick if zero_for_one else self.max_tick
+
+        remaining = amount_in
+        amount_out = 0.0
+        fee_paid = 0.0
+        fee_growth = 0.0
+        crossed: list[tuple[int, float]] = []
+
+        while remaining > 0:
+            next_tick, initialized = self.bitmap.next_initialized_tick(
+                tick, zero_for_one
+            )
+            if zero_for_one:
+                next_tick = max(next_tick, limit_tick)
+            else:
+                next_tick = min(next_tick, limit_tick)
+            sqrt_target = sqrt_price_at_tick(next_tick)
+
+            if liquidity > 0:
+                remaining_less_fee = remaining * (1 - fee)
+                if zero_for_one:
+                    to_target = (
+                        liquidity
+                        * (sqrt_price - sqrt_target)
+                        / (sqrt_price * sqrt_target)
+                    )
+                else:
+                    to_target = liquidity * (sqrt_target - sqrt_price)
+
+                if remaining_less_fee >= to_target:
+                    sqrt_next = sqrt_target
+                    step_in = to_target
+                    step_fee = to_target * fee / (1 - fee)
+                    remaining -= step_in + step_fee
+                else:
+                    if zero_for_one:
+                        sqrt_next = (
+                            liquidity
+                            * sqrt_price
+                            / (liquidity + remaining_less_fee * sqrt_price)
+                        )
+                    else:
+                        sqrt_next = sqrt_price + remaining_less_fee / liquidity
+                    step_fee = remaining - remaining_less_fee
+                    remaining = 0.0
+
+                if zero_for_one:
+                    amount_out += liquidity * (sqrt_price - sqrt_next)
+                else:
+                    amount_out += (
+                        liquidity * (sqrt_next - sqrt_price) / (sqrt_next * sqrt_price)
+                    )
+                fee_paid += step_fee
+                fee_growth += step_fee / liquidity
+            else:
+                sqrt_next = sqrt_target
+
+            if sqrt_next == sqrt_target:
+                if initialized:
+                    liquidity_net = self.ticks[next_tick].liquidity_net
+                    liquidity += -liquidity_net if zero_for_one else liquidity_net
+                    crossed.append((next_tick, fee_growth))
+
+                if next_tick == limit_tick and remaining > 0:
+                    raise ValueError(f"{self.pair_name} Insufficient liquidity")
+
+                tick = next_tick - 1 if zero_for_one else next_tick
+            else:
+                tick = tick_at_sqrt_price(sqrt_next)
+
+            sqrt_price = sqrt_next
+
+        return amount_out, fee_paid, sqrt_price, tick, liquidity, fee_growth, crossed
+
+    def swap(self, token_in: Token, amount_in: float) -> float:
+        """
+        Swaps an exact input through the pool.
+
+        Args:
+            token_in (Token): The token sold.
+            amount_in (float): The amount sold, fee included.
+
+        Returns:
+            float: The amount of the other token bought.
+        """
+        zero_for_one = token_in == next(iter(self.token_reserve))
+        swap = self.simulate_swap(zero_for_one, amount_in)
+        self.apply_swap(zero_for_one, amount_in, swap)
+
+        return swap[0]
+
+    def apply_swap(
+        self,
+        zero_for_one: bool,
+        amount_in: float,
+        swap: tuple[float, float, float, int, float, float, list[tuple[int, float]]],
+    ) -> None:
+        """
+        Applies a swap computed by `simulate_swap` on the current state.
+        """
+        amount_out, _, sqrt_price, tick, liquidity, fee_growth, crossed = swap
+        self.sqrt_price = sqrt_price
+        self.tick = tick
+        self.liquidity = liquidity
+
+        # Each tick flips with the global fee growth at the time it was
+        # crossed, so fees after it go to the range on its other side.
+        side = 0 if zero_for_one else 1
+        fee_growth_global = self.fee_growth_global
+        for crossed_tick, growth in crossed:
+            outside = self.ticks[crossed_tick].fee_growth_outside
+            at_cross = list(fee_growth_global)
+            at_cross[side] += growth
+            outside[0] = at_cross[0] - outside[0]
+            outside[1] = at_cross[1] - outside[1]
+        fee_growth_global[side] += fee_growth
+
+        token_0, token_1 = self.token_reserve
+        if zero_for_one:
+            self.token_reserve[token_0] += amount_in
+            self.token_reserve[token_1] -= amount_out
+        else:
+            self.token_reserve[token_1] += amount_in
+            self.token_reserve[token_0] -= amount_out
+        self.version += 1
+
+    def mint(
+        self, owner: str | None, tick_lower: int, tick_upper: int, liquidity: float
+    ) -> tuple[float, float]:
+        """
+        Adds liquidity to a position.
+
+        Args:
+            owner (str | None): The address of the position's owner.
+            tick_lower (int): The lower tick of the range.
+            tick_upper (int): The upper tick of the range.
+            liquidity (float): The liquidity to add.
+
+        Returns:
+            tuple[float, float]: The amounts of the first and second token
+                deposited.
+        """
+        if liquidity <= 0:
+            raise ValueError("Liquidity must be positive")
+
+        amounts = self.amounts_for_liquidity(tick_lower, tick_upper, liquidity)
+        self._update_position(owner, tick_lower, tick_upper, liquidity)
+
+        token_0, token_1 = self.token_reserve
+        self.token_reserve[token_0] += amounts[0]
+        self.token_reserve[token_1] += amounts[1]
+        self.version += 1
+
+        return amounts
+
+    def burn(
+        self, owner: str | None, tick_lower: int, tick_upper: int, liquidity: float
+    ) -> tuple[float, float]:
+        """
+        Removes liquidity from a position, and withdraws it with the
+        position's fees.
+
+        Returns:
+            tuple[float, float]: The amounts of the first and second token
+                withdrawn.
+        """
+        position = self.positions.get((owner, tick_lower, tick_upper))
+        if position is None or position.liquidity < liquidity:
+            raise ValueError(f"{self.pair_name} Insufficient position liquidity")
+
+        if liquidity <= 0:
+            raise ValueError("Liquidity must be positive")
+
+        amounts = self.amounts_for_liquidity(tick_lower, tick_upper, liquidity)
+        self._update_position(owner, tick_lower, tick_upper, -liquidity)
+
+        return self._withdraw(
+            owner,
+            tick_lower,
+            tick_upper,
+            amounts[0] + position.tokens_owed[0],
+            amounts[1] + position.tokens_owed[1],
+        )
+
+    def collect(
+        self, owner: str | None, tick_lower: int, tick_upper: int
+    ) -> tuple[float, float]:
+        """
+        Withdraws the fees earned by a position.
+
+        Returns:
+            tuple[float, float]: The fees of the first and second token.
+        """
+        position = self.positions.get((owner, tick_lower, tick_upper))
+        if position is None:
+            raise ValueError(f"{self.pair_name} Position does not exist")
+
+        self._update_position(owner, tick_lower, tick_upper, 0.0)
+
+        return self._withdraw(owner, tick_lower, tick_upper, *position.tokens_owed)
+
+    def amounts_for_liquidity(
+        self, tick_lower: int, tick_upper: int, liquidity: float
+    ) -> tuple[float, float]:
+        """
+        Returns the amounts of the first and second token backing an amount
+        of liquidity over a range at the current price.
+        """
+        self._check_range(tick_lower, tick_upper)
+
+        sqrt_lower = sqrt_price_at_tick(tick_lower)
+        sqrt_upper = sqrt_price_at_tick(tick_upper)
+
+        if self.tick < tick_lower:
+            return (
+                liquidity * (sqrt_upper - sqrt_lower) / (sqrt_lower * sqrt_upper),
+                0.0,
+            )
+
+        if self.tick >= tick_upper:
+            return 0.0, liquidity * (sqrt_upper - sqrt_lower)
+
+        sqrt_price = self.sqrt_price
+        return (
+            liquidity * (sqrt_upper - sqrt_price) / (sqrt_price * sqrt_upper),
+            liquidity * (sqrt_price - sqrt_lower),
+        )
+
+    def _withdraw(
+        self,
+        owner: str | None,
+        tick_lower: int,
+        tick_upper: int,
+        amount_0: float,
+        amount_1: float,
+    ) -> tuple[float, float]:
+        position = self.positions[(owner, tick_lower, tick_upper)]
+        position.tokens_owed = [0.0, 0.0]
+        if position.liquidity == 0:
+            del self.positions[(owner, tick_lower, tick_upper)]
+
+        # Rounding may leave the reserves a hair short of the owed amounts.
+        token_0, token_1 = self.token_reserve
+        amount_0 = min(amount_0, self.token_reserve[token_0])
+        amount_1 = min(amount_1, self.token_reserve[token_1])
+        self.token_reserve[token_0] -= amount_0
+        self.token_reserve[token_1] -= amount_1
+        self.version += 1
+
+        return amount_0, amount_1
+
+    def _update_position(
+        self, owner: str | None, tick_lower: int, tick_upper: int, delta: float
+    ) -> None:
+        key = (owner, tick_lower, tick_upper)
+        position = self.positions.get(key)
+        if position is None:
+            position = self.positions[key] = Position()
+
+        if delta:
+            self._update_tick(tick_lower, delta, upper=False)
+            self._update_tick(tick_upper, delta, upper=True)
+            if tick_lower <= self.tick < tick_upper:
+                self.liquidity += delta
+
+        fee_growth_inside = self._fee_growth_inside(tick_lower, tick_upper)
+        for side in (0, 1):
+            position.tokens_owed[side] += position.liquidity * (
+                fee_growth_inside[side] - position.fee_growth_inside_last[side]
+            )
+        position.fee_growth_inside_last = fee_growth_inside
+        position.liquidity += delta
+
+        if delta < 0:
+            for tick in (tick_lower, tick_upper):
+                # Allow for the rounding of sums of many positions.
+                if self.ticks[tick].liquidity_gross <= -delta * 1e-12:
+                    del self.ticks[tick]
+                    self.bitmap.flip(tick)
+
+    def _update_tick(self, tick: int, delta: float, upper: bool) -> None:
+        info = self.ticks.get(tick)
+        if info is None:
+            # Fees so far count as earned below the tick if the price is
+            # above it, and above it otherwise.
+            info = self.ticks[tick] = Tick(
+                list(self.fee_growth_global) if tick <= self.tick else [0.0, 0.0]
+            )
+            self.bitmap.flip(tick)
+
+        info.liquidity_gross += delta
+        info.liquidity_net += -delta if upper else delta
+
+    def _fee_growth_inside(self, tick_lower: int, tick_upper: int) -> list[float]:
+        lower = self.ticks[tick_lower].fee_growth_outside
+        upper = self.ticks[tick_upper].fee_growth_outside
+        fee_growth_global = self.fee_growth_global
+
+        inside = []
+        for side in (0, 1):
+            below = (
+                lower[side]
+                if self.tick >= tick_lower
+                else fee_growth_global[side] - lower[side]
+            )
+            above = (
+                upper[side]
+                if self.tick < tick_upper
+                else fee_growth_global[side] - upper[side]
+            )
+            inside.append(fee_growth_global[side] - below - above)
+
+        return inside
+
+    def _check_range(self, tick_lower: int, tick_upper: int) -> None:
+        if not self.min_tick <= tick_lower < tick_upper <= self.max_tick:
+            raise ValueError(f"Invalid tick range [{tick_lower}, {tick_upper})")
+
+        if tick_lower % self.tick_spacing or tick_upper % self.tick_spacing:
+            raise ValueError(
+                f"Ticks must be multiples of the tick spacing {self.tick_spacing}"
+            )
+
+
+class UniswapV3(AmmProtocol):
+    """
+    Represents a Uniswap V3 style concentrated-liquidity protocol.
+
+    Liquidity providers mint positions over tick ranges, and swaps step
+    through the initialized ticks only, found with a word-packed bitmap, so
+    their cost depends on the ticks crossed rather than on the number of
+    positions. Routing only uses direct pools, as the router prices paths
+    from constant-product reserves.
+    """
+
+    def __init__(self, name: str = "UniswapV3"):  # type: ignore
+        super().__init__(name)
+
+        self.functions = {
+            "swap": self.swap,
+            "swap_exact_in": self.swap_exact_in,
+            "mint": self.mint,
+            "burn": self.burn,
+            "collect": self.collect,
+        }
+
+    def create_pool(
+        self,
+        token_1: Token,
+        token_2: Token,
+        fee: float,
+        reserve_1: float = 0.0,
+        reserve_2: float = 0.0,
+    ) -> ConcentratedPool:
+        """
+        Creates a concentrated-liquidity pool. Reserves, if given, set the
+        initial price and are deposited as a full-range position with no
+        owner.
+
+        Args:
+            token_1 (Token): The first token in the liquidity pool.
+            token_2 (Token): The second token in the liquidity pool.
+            fee (float): The fee of the liquidity pool.
+            reserve_1 (float): The initial reserve of the first token.
+            reserve_2 (float): The initial reserve of the second token.
+        """
+        return super().create_pool(token_1, token_2, fee, reserve_1, reserve_2)  # type: ignore
+
+    def swap(
+        self, sender: User, token_in: Token, token_out: Token, amount_in: float
+    ) -> float:
+        return self.swap_exact_in(sender, token_in, token_out, amount_in)
+
+    def swap_exact_in(
+        self,
+        sender: User,
+        token_in: Token,
+        token_out: Token,
+        amount_in: float,
+        min_amount_out: float = 0.0,
+    ) -> float:
+        """
+        Swaps an exact amount of a token through the pool of the pair,
+        failing if it would receive less than `min_amount_out`.
+        """
+        pool: ConcentratedPool = self._get_pool(token_in, token_out)  # type: ignore
+        zero_for_one = token_in == next(iter(pool.token_reserve))
+
+        swap = pool.simulate_swap(zero_for_one, amount_in)
+        amount_out = swap[0]
+        if amount_out < min_amount_out:
+            raise ValueError(
+                f"Output amount {amount_out} is less than the minimum {min_amount_out}"
+            )
+
+        sender.remove_from_wallet(token_in, amount_in)
+        pool.apply_swap(zero_for_one, amount_in, swap)
+        sender.add_to_wallet(token_out, amount_out)
+
+        return amount_out
+
+    def mint(
+        self,
+        sender: User,
+        token_1: Token,
+        token_2: Token,
+        tick_lower: int,
+        tick_upper: int,
+        liquidity: float,
+    ) -> tuple[float, float]:
+        """
+        Adds liquidity over a tick range, taking the backing tokens from the
+        sender's wallet.
+
+        Returns:
+            tuple[float, float]: The amounts of the pool's first and second
+                token deposited.
+        """
+        pool: ConcentratedPool = self._get_pool(token_1, token_2)  # type: ignore
+
+        # The amounts are in the pool's token order, whatever the order of
+        # the arguments.
+        amounts = pool.amounts_for_liquidity(tick_lower, tick_upper, liquidity)
+        for token, amount in zip(pool.token_reserve, amounts):
+            if sender.wallet.get(token, 0.0) < amount:
+                raise ValueError(f"Insufficient {token.name} balance")
+
+        for token, amount in zip(pool.token_reserve, amounts):
+            if amount:
+                sender.remove_from_wallet(token, amount)
+
+        return pool.mint(sender.address, tick_lower, tick_upper, liquidity)
+
+    def burn(
+        self,
+        sender: User,
+        token_1: Token,
+        token_2: Token,
+        tick_lower: int,
+        tick_upper: int,
+        liquidity: float,
+    ) -> tuple[float, float]:
+        """
+        Removes liquidity from the sender's position, paying out the backing
+        tokens and the position's fees.
+
+        Returns:
+            tuple[float, float]: The amounts of the pool's first and second
+                token paid out.
+        """
+        pool: ConcentratedPool = self._get_pool(token_1, token_2)  # type: ignore
+
+        amounts = pool.burn(sender.address, tick_lower, tick_upper, liquidity)
+        self._pay(sender, pool, amounts)
+
+        return amounts
+
+    def collect(
+        self,
+        sender: User,
+        token_1: Token,
+        token_2: Token,
+        tick_lower: int,
+        tick_upper: int,
+    ) -> tuple[float, float]:
+        """
+        Pays out the fees earned by the sender's position.
+
+        Returns:
+            tuple[float, float]: The fees of the pool's first and second token.
+        """
+        pool: ConcentratedPool = self._get_pool(token_1, token_2)  # type: ignore
+
+        amounts = pool.collect(sender.address, tick_lower, tick_upper)
+        self._pay(sender, pool, amounts)
+
+        return amounts
+
+    def conflict_keys(self, transaction: "Transaction") -> tuple | None:  # type: ignore
+        """
+        Returns the pool a transaction trades against or changes a position
+        of. Every function of the contract takes the pool's two tokens first
+        and changes nothing else besides the sender's wallet.
+        """
+        operands = getattr(transaction, "operands", None)
+        if operands is not None:
+            tokens = operands[:2]
+        else:
+            args = transaction.args
+            tokens = (
+                args.get("token_in", args.get("token_1")),
+                args.get("token_out", args.get("token_2")),
+            )
+
+        try:
+            return (self._get_pool(*tokens),)
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+    def quote_pools(
+        self,
+        pairs: list[tuple[Token, Token]],
+        amount_in: np.ndarray | float | None = None,
+        amount_out: np.ndarray | float | None = None,
+    ) -> list[Quote]:
+        """
+        Prices exact-input swaps by simulating each amount through the ticks
+        of its pool. Exact-output quotes are not supported.
+        """
+        if amount_in is None or amount_out is not None:
+            raise ValueError("UniswapV3 quotes exact inputs only")
+
+        amounts = np.asarray(amount_in, dtype=float)
+        if amounts.ndim < 2:
+            amounts = np.broadcast_to(amounts, (len(pairs),) + amounts.shape)
+
+        quotes = []
+        for (token_in, token_out), amounts_in in zip(pairs, amounts):
+            pool: ConcentratedPool = self._get_pool(token_in, token_out)  # type: ignore
+            zero_for_one = token_in == next(iter(pool.token_reserve))
+
+            amounts_out = np.array(
+                [
+                    self._simulate_amount_out(pool, zero_for_one, amount)
+                    for amount in amounts_in.reshape(-1)
+                ]
+            ).reshape(amounts_in.shape)
+
+            spot_price = pool.price if zero_for_one else 1 / pool.price
+            marginal_price = spot_price * (1 - pool.fee)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                execution_price = np.where(
+                    amounts_in > 0, amounts_out / amounts_in, marginal_price
+                )
+
+            quotes.append(
+                Quote(
+                    amount_in=np.array(amounts_in),
+                    amount_out=amounts_out,
+                    execution_price=execution_price,
+                    spot_price=np.full(amounts_in.shape, spot_price),
+                    price_impact=1 - execution_price / marginal_price,
+                )
+            )
+
+        return quotes
+
+    def _new_pool(
+        self,
+        token_1: Token,
+        token_2: Token,
+        fee: float,
+        reserve_1: float,
+        reserve_2: float,
+    ) -> ConcentratedPool:
+        if (reserve_1 > 0) != (reserve_2 > 0):
+            raise ValueError("Both or neither initial reserves must be given")
+
+        if not reserve_1:
+            return ConcentratedPool(token_1, token_2, fee)
+
+        pool = ConcentratedPool(token_1, token_2, fee, price=reserve_2 / reserve_1)
+        pool.mint(None, pool.min_tick, pool.max_tick, math.sqrt(reserve_1 * reserve_2))
+
+        return pool
+
+    def _get_amount_out(
+        self,
+        pool: LiquidityPool,
+        token_in: Token,
+        token_out: Token,
+        amount_in: float,
+    ) -> float:
+        zero_for_one = token_in == next(iter(pool.token_reserve))
+        return pool.simulate_swap(zero_for_one, amount_in)[0]  # type: ignore
+
+    @staticmethod
+    def _simulate_amount_out(
+        pool: ConcentratedPool, zero_for_one: bool, amount_in: float
+    ) -> float:
+        if amount_in <= 0:
+            return 0.0
+
+        try:
+            return pool.simulate_swap(zero_for_one, amount_in)[0]
+        except ValueError:
+            return np.nan
+
+    @staticmethod
+    def _pay(sender: User, pool: ConcentratedPool, amounts: tuple[float, float]):
+        for token, amount in zip(pool.token_reserve, amounts):
+            if amount > 0:
+                sender.add_to_wallet(token, amount)
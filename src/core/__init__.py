@@ -1,2 +1,7 @@
+from core.block_store import Block, BlockStore
 from core.blockchain import Blockchain
-from core.transaction import Transaction
+from core.checkpoint import load_blockchain, save_blockchain
+from core.export import BlockExporter, create_sink
+from core.mempool import Mempool
+from core.parallel import ParallelExecutor
+from core.transaction import CompiledTransaction, Transaction
@@ -0,0 +1,443 @@
+from dataclasses import dataclass, field
+from typing import Iterator
+
+import numpy as np
+
+from contracts.contract import Contract
+from core.transaction import CompiledTransaction, Transaction
+from market.token import Token
+
+TRANSACTION_COLUMNS: dict[str, type] = {
+    "block": np.int64,
+    "sender": np.int64,
+    "contract": np.int32,
+    "opcode": np.int16,
+    "schema": np.int16,
+    "token_a": np.int32,
+    "token_b": np.int32,
+    "amount_a": np.float64,
+    "amount_b": np.float64,
+    "gas_fee": np.float64,
+    "status": np.bool_,
+}
+
+# The columns filled from `BlockStore.encode`, in order.
+ENCODED_COLUMNS = (
+    "sender",
+    "contract",
+    "opcode",
+    "schema",
+    "token_a",
+    "token_b",
+    "amount_a",
+    "amount_b",
+    "gas_fee",
+)
+TOKEN_COLUMNS = ("token_a", "token_b")
+AMOUNT_COLUMNS = ("amount_a", "amount_b")
+
+RETENTIONS = ("all", "last", "summary")
+
+
+@dataclass
+class Block:
+    block_number: int = 0
+    transactions: list[Transaction] = field(default_factory=list)
+    statuses: list[bool] = field(default_factory=list)
+
+
+class BlockStore:
+    """
+    Represents the block history of a blockchain as fixed-width transaction
+    rows in growable typed column arrays.
+
+    Each transaction is encoded as its block number, sender ID, contract ID,
+    function opcode, up to two token IDs and two amounts, gas fee and status.
+    Transactions that do not fit that layout are kept as objects. Blocks are
+    rebuilt from their rows on access.
+
+    The retention policy bounds memory on long runs:
+        - "all" keeps every block.
+        - "last" keeps only the last `keep_last` blocks.
+        - "summary" keeps only the per-block transaction and failure counts.
+
+    Attributes:
+        retention (str): The retention policy.
+        keep_last (int | None): The number of blocks kept by the "last" policy.
+        num_transactions (np.ndarray): The number of transactions of every block.
+        num_failed (np.ndarray): The number of failed transactions of every block.
+    """
+
+    def __init__(
+        self,
+        blockchain: "Blockchain",  # type: ignore
+        retention: str = "all",
+        keep_last: int | None = None,
+        capacity: int = 1024,
+    ):
+        """
+        Initializes an empty block store.
+
+        Args:
+            blockchain (Blockchain): The blockchain whose users, contracts and
+                tokens the rows refer to.
+            retention (str): The retention policy.
+            keep_last (int | None): The number of blocks kept by the "last" policy.
+            capacity (int): The number of rows to preallocate.
+        """
+        if retention not in RETENTIONS:
+            raise ValueError(
+                f"Unknown retention {retention!r}, expected one of {RETENTIONS}"
+            )
+
+        if retention == "last" and (keep_last is None or keep_last < 0):
+            raise ValueError("The 'last' retention needs a non-negative keep_last")
+
+        self.blockchain = blockchain
+        self.retention = retention
+        self.keep_last = keep_last
+
+        self.height = 0
+        self.first_block = 0
+
+        self._columns = {
+            name: np.empty(capacity, dtype=dtype)
+            for name, dtype in TRANSACTION_COLUMNS.items()
+        }
+        self._num_rows = 0
+        self._row_start = 0
+        self._row_base = 0
+        self._offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self._num_transactions = np.zeros(capacity, dtype=np.int32)
+        self._num_failed = np.zeros(capacity, dtype=np.int32)
+
+        self._objects: dict[int, Transaction] = {}
+        self._contracts: list[Contract] = []
+        self._contract_ids: dict[int, int] = {}
+        self._functions: list[list[str]] = []
+        self._opcodes: list[dict[str, int]] = []
+        self._schemas: list[tuple[tuple[str, str], ...]] = []
+        self._schema_ids: dict[tuple, int] = {}
+
+    def __repr__(self) -> str:
+        return f"BlockStore(height={self.height}, retained={self.height - self.first_block}, retention={self.retention!r})"
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __getitem__(self, index: int | slice) -> Block | list[Block]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.height))]
+
+        if index < 0:
+            index += self.height
+
+        if not 0 <= index < self.height:
+            raise IndexError(f"Block {index} does not exist")
+
+        if index < self.first_block:
+            raise IndexError(f"Block {index} is no longer retained")
+
+        return self._materialize(index)
+
+    def __iter__(self) -> Iterator[Block]:
+        for index in range(self.first_block, self.height):
+            yield self._materialize(index)
+
+    @property
+    def num_transactions(self) -> np.ndarray:
+        return self._num_transactions[: self.height]
+
+    @property
+    def num_failed(self) -> np.ndarray:
+        return self._num_failed[: self.height]
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        """
+        Returns the columns of the retained transaction rows.
+        """
+        return {
+            name: column[self._row_start : self._num_rows]
+            for name, column in self._columns.items()
+        }
+
+    def append(self, transactions: list[Transaction], statuses: list[bool]) -> None:
+        """
+        Records the next block.
+
+        Args:
+            transactions (list[Transaction]): The transactions of the block.
+            statuses (list[bool]): Whether each transaction succeeded.
+        """
+        block_number = self.height
+        self._grow_blocks(block_number + 1)
+
+        self._num_transactions[block_number] = len(transactions)
+        self._num_failed[block_number] = statuses.count(False)
+        self._offsets[block_number + 1] = self._offsets[block_number] + len(
+            transactions
+        )
+        self.height += 1
+
+        if self.retention == "summary" or (
+            self.retention == "last" and self.keep_last == 0
+        ):
+            self._drop_before(self.height)
+            return
+
+        self._write_rows(block_number, transactions, statuses)
+
+        if self.retention == "last":
+            self._drop_before(max(self.height - self.keep_last, 0))
+
+    def append_empty(self, count: int) -> None:
+        """
+        Records the next `count` blocks, all without transactions, at once.
+
+        Args:
+            count (int): The number of blocks.
+        """
+        if count <= 0:
+            return
+
+        height = self.height
+        self._grow_blocks(height + count)
+
+        self._num_transactions[height : height + count] = 0
+        self._num_failed[height : height + count] = 0
+        self._offsets[height + 1 : height + count + 1] = self._offsets[height]
+        self.height += count
+
+        if self.retention == "summary" or (
+            self.retention == "last" and self.keep_last == 0
+        ):
+            self._drop_before(self.height)
+        elif self.retention == "last":
+            self._drop_before(max(self.height - self.keep_last, 0))
+
+    def restore(self, num_transactions: np.ndarray, num_failed: np.ndarray) -> None:
+        """
+        Continues the history of a restored blockchain in an empty store.
+
+        Only the per-block counts of the earlier blocks are known, so they
+        are kept as summaries and the store resumes at the next block.
+
+        Args:
+            num_transactions (np.ndarray): The number of transactions of
+                every earlier block.
+            num_failed (np.ndarray): The number of failed transactions of
+                every earlier block.
+        """
+        if self.height:
+            raise ValueError("Only an empty block store can be restored")
+
+        height = len(num_transactions)
+        self._grow_blocks(height)
+
+        self._num_transactions[:height] = num_transactions
+        self._num_failed[:height] = num_failed
+        self._offsets[: height + 1] = 0
+        self.height = self.first_block = height
+
+    def _write_rows(
+        self, block_number: int, transactions: list[Transaction], statuses: list[bool]
+    ) -> None:
+        start = self._num_rows
+        stop = start + len(transactions)
+        self._grow_rows(stop)
+
+        encoded = [self.encode(transaction) for transaction in transactions]
+
+        rows = self._columns
+        rows["block"][start:stop] = block_number
+        rows["status"][start:stop] = statuses
+        for column, values in zip(
+            ENCODED_COLUMNS, zip(*encoded) if encoded else [()] * len(ENCODED_COLUMNS)
+        ):
+            rows[column][start:stop] = values
+
+        for row, (transaction, encoding) in enumerate(
+            zip(transactions, encoded), start=start
+        ):
+            if encoding[3] < 0:
+                self._objects[self._row_base + row] = transaction
+
+        self._num_rows = stop
+
+    def encode(self, transaction: Transaction) -> tuple:
+        """
+        Encodes a transaction as the values of `ENCODED_COLUMNS`.
+
+        A schema of -1 marks a transaction whose arguments do not fit the
+        row layout, and a sender of -1 one sent from outside the ledger.
+        """
+        ledger = self.blockchain.ledger
+        gas_fee = np.nan if transaction.gas_fee is None else transaction.gas_fee
+
+        contract_id = self._contract_id(transaction.contract)
+        sender = transaction.sender
+
+        if type(transaction) is CompiledTransaction:
+            opcode = transaction.opcode
+            values = transaction.operands
+            names = transaction.contract.dispatch.operands[opcode][: len(values)]
+        else:
+            opcode = self._opcodes[contract_id].get(transaction.function, -1)
+            names = tuple(transaction.args)
+            values = tuple(transaction.args.values())
+
+        if opcode < 0 or sender.ledger is not ledger:
+            return (-1, contract_id, opcode, -1, -1, -1, 0.0, 0.0, gas_fee)
+
+        kinds = tuple(
+            "token"
+            if isinstance(value, Token)
+            else "amount"
+            if isinstance(value, (int, float))
+            else "other"
+            for value in values
+        )
+
+        key = (contract_id, opcode, names, kinds)
+        schema_id = self._schema_ids.get(key)
+        if schema_id is None:
+            schema_id = self._register_schema(key)
+
+        if schema_id < 0:
+            return (sender.user_id, contract_id, opcode, -1, -1, -1, 0.0, 0.0, gas_fee)
+
+        tokens = [
+            ledger.register_token(value)
+            for kind, value in zip(kinds, values)
+            if kind == "token"
+        ]
+        amounts = [value for kind, value in zip(kinds, values) if kind == "amount"]
+        tokens += [-1] * (2 - len(tokens))
+        amounts += [0.0] * (2 - len(amounts))
+
+        return (
+            sender.user_id,
+            contract_id,
+            opcode,
+            schema_id,
+            *tokens,
+            *amounts,
+            gas_fee,
+        )
+
+    def _register_schema(self, key: tuple) -> int:
+        _, _, names, kinds = key
+        if (
+            "other" in kinds
+            or kinds.count("token") > len(TOKEN_COLUMNS)
+            or kinds.count("amount") > len(AMOUNT_COLUMNS)
+        ):
+            self._schema_ids[key] = -1
+            return -1
+
+        token_columns = iter(TOKEN_COLUMNS)
+        amount_columns = iter(AMOUNT_COLUMNS)
+        schema = tuple(
+            (name, next(token_columns) if kind == "token" else next(amount_columns))
+            for name, kind in zip(names, kinds)
+        )
+
+        schema_id = len(self._schemas)
+        self._schemas.append(schema)
+        self._schema_ids[key] = schema_id
+
+        return schema_id
+
+    def _contract_id(self, contract: Contract) -> int:
+        contract_id = self._contract_ids.get(id(contract))
+        if contract_id is None:
+            contract_id = len(self._contracts)
+            self._contracts.append(contract)
+            self._contract_ids[id(contract)] = contract_id
+            self._functions.append(contract.dispatch.names)
+            self._opcodes.append(contract.dispatch.opcodes)
+
+        return contract_id
+
+    def _materialize(self, block_number: int) -> Block:
+        start = int(self._offsets[block_number]) - self._row_base
+        stop = int(self._offsets[block_number + 1]) - self._row_base
+
+        tokens = self.blockchain.ledger.tokens
+        rows = {
+            name: column[start:stop].tolist() for name, column in self._columns.items()
+        }
+
+        transactions = []
+        for offset in range(stop - start):
+            row = start + offset
+            if rows["schema"][offset] < 0:
+                transactions.append(self._objects[self._row_base + row])
+                continue
+
+            contract_id = rows["contract"][offset]
+            args = {}
+            for name, column in self._schemas[rows["schema"][offset]]:
+                value = rows[column][offset]
+                args[name] = tokens[value] if column in TOKEN_COLUMNS else value
+
+            gas_fee = rows["gas_fee"][offset]
+            transactions.append(
+                Transaction(
+                    sender=self.blockchain.get_user(rows["sender"][offset]),
+                    contract=self._contracts[contract_id],
+                    function=self._functions[contract_id][rows["opcode"][offset]],
+                    args=args,
+                    gas_fee=None if np.isnan(gas_fee) else gas_fee,
+                )
+            )
+
+        return Block(block_number, transactions, rows["status"])
+
+    def _drop_before(self, block_number: int) -> None:
+        """
+        Forgets the rows of every block before `block_number`, compacting the
+        columns once the dropped rows outnumber the retained ones.
+        """
+        self.first_block = max(self.first_block, block_number)
+
+        cutoff = int(self._offsets[self.first_block]) - self._row_base
+        self._row_start = min(max(cutoff, self._row_start), self._num_rows)
+
+        live = self._num_rows - self._row_start
+        if self._row_start < live:
+            return
+
+        for column in self._columns.values():
+            column[:live] = column[self._row_start : self._num_rows]
+
+        self._num_rows = live
+        self._row_start = 0
+        self._row_base = int(self._offsets[self.first_block])
+        self._objects = {
+            row: transaction
+            for row, transaction in self._objects.items()
+            if row >= self._row_base
+        }
+
+    def _grow_rows(self, size: int) -> None:
+        capacity = len(self._columns["block"])
+        if size <= capacity:
+            return
+
+        capacity = max(size, capacity * 2)
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[: self._num_rows] = column[: self._num_rows]
+            self._columns[name] = grown
+
+    def _grow_blocks(self, size: int) -> None:
+        capacity = len(self._num_transactions)
+        if size <= capacity:
+            return
+
+        capacity = max(size, capacity * 2)
+        self._num_transactions = np.resize(self._num_transactions, capacity)
+        self._num_failed = np.resize(self._num_failed, capacity)
+        self._offsets = np.resize(self._offsets, capacity + 1)
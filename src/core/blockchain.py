@@ -1,51 +1,301 @@
+import time
 from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
 
 from contracts.contract import Contract
+from core.block_store import Block, BlockStore
+from core.export import BlockExporter
+from core.mempool import Mempool, gas_of
+from core.parallel import ParallelExecutor
 from core.transaction import Transaction
-from market.actors.user import BlockProducer, User
+from market.actors.user import BlockProducer, Population, User
+from market.ledger import Ledger
 from market.token import Token
+from utils.profiling import Profiler
 
-
-@dataclass
-class Block:
-    block_number: int = 0
-    transactions: list[Transaction] = field(default_factory=list)
+ENGINES = ("sequential", "batch", "parallel")
 
 
 @dataclass
 class Blockchain:
     name: str = "Blockchain"
-    blocks: list[Block] = field(default_factory=list)
-    mempool: list[Transaction] = field(default_factory=list)
+    blocks: BlockStore = field(init=False)
+    mempool: Mempool = field(default_factory=Mempool)
     users: dict[str, User] = field(default_factory=dict)
+    populations: list[Population] = field(default_factory=list, repr=False)
     tokens: dict[str, Token] = field(default_factory=dict)
     contracts: dict[str, Contract] = field(default_factory=dict)
+    engine: str = "sequential"
+    ledger: Ledger = field(default_factory=Ledger, repr=False)
+    retention: str = "all"
+    keep_last: int | None = None
+    max_block_transactions: int | None = None
+    block_gas_limit: int | None = None
+    fee_token: Token | None = None
+    max_workers: int | None = None
+    exporter: BlockExporter | None = field(default=None, repr=False)
+    profiler: Profiler | None = field(default=None, repr=False)
+    executor: ParallelExecutor | None = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.engine not in ENGINES:
+            raise ValueError(
+                f"Unknown engine {self.engine!r}, expected one of {ENGINES}"
+            )
+
+        self.blocks = BlockStore(self, self.retention, self.keep_last)
+        self._user_ids: dict[int, User] = {}
 
     @property
     def block_number(self):
         return len(self.blocks)
 
     def add_transaction(self, transaction: Transaction):
-        self.mempool.append(transaction)
+        if (
+            self.block_gas_limit is not None
+            and gas_of(transaction) > self.block_gas_limit
+        ):
+            raise ValueError(
+                f"Transaction gas {gas_of(transaction)} exceeds the block gas limit {self.block_gas_limit}"
+            )
+
+        self.mempool.add(transaction)
+
+    def add_transactions(self, transactions: list[Transaction]):
+        """
+        Adds a batch of transactions to the mempool, in order.
+        """
+        if self.block_gas_limit is not None:
+            for transaction in transactions:
+                if gas_of(transaction) > self.block_gas_limit:
+                    raise ValueError(
+                        f"Transaction gas {gas_of(transaction)} exceeds the block gas limit {self.block_gas_limit}"
+                    )
+
+        self.mempool.extend(transactions)
+
+    def create_block(self, block_producer: BlockProducer | None = None):
+        """
+        Builds and processes the next block from the top of the mempool,
+        within the block transaction and gas limits. The remaining
+        transactions stay pending for the next blocks.
+
+        With a `fee_token`, the gas fee of every included transaction is
+        charged to its sender in that token before the block runs, and the
+        block producer is credited the fees charged. A transaction whose
+        sender cannot pay its fee is not run and is recorded as failed.
+        Without a fee token, fees only order the mempool.
+
+        Args:
+            block_producer (BlockProducer | None): The block producer credited
+                with the gas fees of the block's transactions. Without one,
+                the fees are burnt.
+        """
+        transactions = self.mempool.pop_block(
+            self.max_block_transactions, self.block_gas_limit
+        )
+
+        unpaid: list[int] = []
+        if self.fee_token is not None:
+            fees, unpaid = self._charge_fees(transactions)
+            if block_producer is not None:
+                block_producer.balance += fees
+
+        executed = transactions
+        if unpaid:
+            skipped = set(unpaid)
+            executed = [
+                transaction
+                for index, transaction in enumerate(transactions)
+                if index not in skipped
+            ]
+
+        if self.engine == "batch":
+            statuses = self._process_batched(executed)
+        elif self.engine == "parallel":
+            if self.executor is None:
+                self.executor = ParallelExecutor(self.max_workers)
+            statuses = self.executor.execute(executed, self.ledger)
+        elif self.profiler is not None:
+            statuses = self._process_profiled(executed)
+        else:
+            statuses = [transaction.process() for transaction in executed]
+
+        for index in unpaid:
+            statuses.insert(index, False)
+
+        start = time.perf_counter()
+
+        block_number = self.block_number
+        self.blocks.append(transactions, statuses)
+
+        if self.exporter is not None:
+            self.exporter.record_block(self, block_number, transactions, statuses)
+
+        if self.profiler is not None:
+            self.profiler.add("blockchain", "record_block", time.perf_counter() - start)
+            self.profiler.count("transactions", len(statuses))
+            self.profiler.count("failed_transactions", statuses.count(False))
+
+    def skip_blocks(self, count: int):
+        """
+        Records `count` empty blocks at once, as `create_block` would with an
+        empty mempool, but without processing or exporting them.
+
+        Args:
+            count (int): The number of blocks.
+        """
+        if len(self.mempool):
+            raise ValueError("Only blocks without pending transactions can be skipped")
 
-    def create_block(self):
-        transactions = self.mempool
+        self.blocks.append_empty(count)
+
+    def _charge_fees(self, transactions: list[Transaction]) -> tuple[float, list[int]]:
+        """
+        Charges the gas fee of each transaction to its sender in the fee
+        token, in block order.
+
+        Returns:
+            tuple[float, list[int]]: The total fees charged, and the indices
+                of the transactions whose sender could not pay.
+        """
+        fee_token = self.fee_token
+        fees = 0.0
+        unpaid = []
+
+        for index, transaction in enumerate(transactions):
+            fee = transaction.gas_fee
+            if not fee:
+                continue
+
+            sender = transaction.sender
+            if sender.wallet.get(fee_token, 0.0) < fee:
+                unpaid.append(index)
+                continue
+
+            sender.remove_from_wallet(fee_token, fee)
+            fees += fee
+
+        return fees, unpaid
+
+    def _process_profiled(self, transactions: list[Transaction]) -> list[bool]:
+        """
+        Processes transactions one by one, timing each contract function.
+        """
+        profiler = self.profiler
+        names: dict[tuple[int, str], str] = {}
+        statuses: list[bool] = []
 
         for transaction in transactions:
-            transaction.process()
+            key = (id(transaction.contract), transaction.function)
+            name = names.get(key)
+            if name is None:
+                name = names[
+                    key
+                ] = f"{transaction.contract.name}.{transaction.function}"
+
+            start = time.perf_counter()
+            statuses.append(transaction.process())
+            profiler.add("function", name, time.perf_counter() - start)
+
+        return statuses
+
+    def _process_batched(self, transactions: list[Transaction]) -> list[bool]:
+        """
+        Hands each run of consecutive transactions sent to the same contract
+        to that contract's batch path, preserving the mempool order.
+        """
+        statuses: list[bool] = []
+
+        start = 0
+        while start < len(transactions):
+            contract = transactions[start].contract
+            stop = start + 1
+            while stop < len(transactions) and transactions[stop].contract is contract:
+                stop += 1
 
-        self.mempool = []
+            if self.profiler is None:
+                statuses.extend(contract.process_batch(transactions[start:stop]))
+            else:
+                batch_start = time.perf_counter()
+                statuses.extend(contract.process_batch(transactions[start:stop]))
+                self.profiler.add(
+                    "function",
+                    f"{contract.name}.process_batch",
+                    time.perf_counter() - batch_start,
+                    stop - start,
+                )
 
-        self.blocks.append(Block(self.block_number, transactions))
+            start = stop
+
+        return statuses
 
     def create_user(self, name: str = "") -> User:
-        user = User(name)
+        user = User(name, ledger=self.ledger)
         self.users[user.address] = user
 
         return user
 
+    def create_population(
+        self,
+        num: int,
+        name_prefix: str = "User_",
+        kind: type[User] = User,
+        balances: dict[Token, float | np.ndarray | Callable[[int], np.ndarray]]
+        | None = None,
+    ) -> Population:
+        """
+        Allocates many users at once, created lazily on first access.
+
+        Args:
+            num (int): The number of users.
+            name_prefix (str): The prefix of the users' names.
+            kind (type[User]): The type of the users.
+            balances (dict[Token, float | np.ndarray | Callable[[int], np.ndarray]] | None):
+                The initial balance of each token: one amount for every user,
+                an amount per user, or a function drawing `num` amounts.
+
+        Returns:
+            Population: The users.
+        """
+        population = Population(
+            self.ledger, self.ledger.register_users(num), kind, name_prefix
+        )
+        for token, amounts in (balances or {}).items():
+            if callable(amounts):
+                amounts = amounts(num)
+            self.ledger.deposit_many(population.ids, token, amounts)
+
+        self.populations.append(population)
+
+        return population
+
+    def get_user(self, user_id: int) -> User:
+        """
+        Returns a user of the blockchain's ledger by user ID, creating it if
+        it belongs to a population.
+
+        Args:
+            user_id (int): The ID of the user.
+        """
+        for population in self.populations:
+            user = population.get(user_id)
+            if user is not None:
+                return user
+
+        if len(self._user_ids) != len(self.users):
+            self._user_ids = {
+                user.user_id: user
+                for user in self.users.values()
+                if user.ledger is self.ledger
+            }
+
+        return self._user_ids[user_id]
+
     def create_block_producer(self, name: str = "") -> BlockProducer:
-        block_producer = BlockProducer(name)
+        block_producer = BlockProducer(name, ledger=self.ledger)
         self.users[block_producer.address] = block_producer
 
         return block_producer
@@ -53,6 +303,7 @@ class Blockchain:
     def create_token(self, name: str, value: float) -> Token:
         token = Token(name, value)
         self.tokens[token.name] = token
+        self.ledger.register_token(token)
 
         return token
 
@@ -0,0 +1,424 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from contracts.amm_protocol import AmmProtocol, LiquidityPool, LPPosition
+from contracts.uniswap_v2 import UniswapV2
+from contracts.uniswap_v3 import ConcentratedPool, Position, Tick, UniswapV3
+from core.blockchain import Blockchain
+from core.transaction import Transaction
+from market.actors.user import BlockProducer, Population, User
+from market.ledger import Ledger
+from market.token import Token
+
+CHECKPOINT_VERSION = 1
+
+CONTRACT_TYPES: dict[str, type[AmmProtocol]] = {
+    "UniswapV2": UniswapV2,
+    "UniswapV3": UniswapV3,
+}
+
+USER_KINDS: tuple[type[User], ...] = (User, BlockProducer)
+
+
+def save_blockchain(blockchain: Blockchain, path: str) -> None:
+    """
+    Writes the state of a blockchain to a checkpoint directory.
+
+    The ledger tables and the per-user columns are written as `.npy` arrays
+    so they can be memory-mapped on load; tokens, contracts, pools and the
+    mempool are small and written to `blockchain.json`, the mempool in
+    arrival order. Concentrated pools are written with their ticks and
+    positions. Populations are written as their ID ranges, without
+    creating their users, and the names and addresses of populations that
+    have them as arrays. Only the per-block counts of the block history
+    are kept.
+
+    Args:
+        blockchain (Blockchain): The blockchain to checkpoint.
+        path (str): The checkpoint directory.
+    """
+    os.makedirs(path, exist_ok=True)
+    ledger = blockchain.ledger
+
+    users = list(blockchain.users.values())
+    if any(user.ledger is not ledger for user in users):
+        raise ValueError("Every user must hold its balances in the blockchain ledger")
+
+    arrays = {
+        "balances": ledger.balances,
+        "held": ledger.held,
+        "groups": ledger.groups,
+        "group_totals": ledger.group_totals,
+        "user_ids": np.array([user.user_id for user in users], dtype=np.int64),
+        "user_kinds": np.array(
+            [USER_KINDS.index(type(user)) for user in users], dtype=np.int8
+        ),
+        "user_names": np.array([user.name for user in users], dtype=str),
+        "user_addresses": np.array([user.address for user in users], dtype=str),
+        "user_balances": np.array(
+            [getattr(user, "balance", 0.0) for user in users], dtype=np.float64
+        ),
+        "num_transactions": blockchain.blocks.num_transactions,
+        "num_failed": blockchain.blocks.num_failed,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+
+    meta = {
+        "version": CHECKPOINT_VERSION,
+        "name": blockchain.name,
+        "engine": blockchain.engine,
+        "retention": blockchain.retention,
+        "keep_last": blockchain.keep_last,
+        "max_block_transactions": blockchain.max_block_transactions,
+        "block_gas_limit": blockchain.block_gas_limit,
+        "fee_token": (
+            None
+            if blockchain.fee_token is None
+            else [blockchain.fee_token.name, blockchain.fee_token.value]
+        ),
+        "max_workers": blockchain.max_workers,
+        "tokens": [[token.name, token.value] for token in ledger.tokens],
+        "groups": ledger.group_names,
+        "chain_tokens": list(blockchain.tokens),
+        "contracts": [
+            _encode_contract(contract) for contract in blockchain.contracts.values()
+        ],
+        "populations": [
+            _encode_population(population, path, number)
+            for number, population in enumerate(blockchain.populations)
+        ],
+        "mempool": [
+            _encode_transaction(transaction) for transaction in blockchain.mempool
+        ],
+    }
+    with open(os.path.join(path, "blockchain.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+
+
+def load_blockchain(path: str, mmap: bool = True) -> Blockchain:
+    """
+    Restores a blockchain from a checkpoint directory.
+
+    The ledger adopts the loaded tables without copying them. The users are
+    restored as populations of consecutive user IDs with their names and
+    addresses, so their `User` objects are only created when accessed, as
+    for populations created in bulk; they are no longer listed in
+    `Blockchain.users`.
+
+    Args:
+        path (str): The checkpoint directory, as written by `save_blockchain`.
+        mmap (bool): Whether to memory-map the ledger tables and user
+            columns, the tables copy-on-write, instead of reading them into
+            memory. The checkpoint files are never modified either way.
+
+    Returns:
+        Blockchain: The restored blockchain.
+    """
+    with open(os.path.join(path, "blockchain.json"), "r", encoding="utf-8") as file:
+        meta = json.load(file)
+
+    if meta["version"] != CHECKPOINT_VERSION:
+        raise ValueError(
+            f"Unsupported checkpoint version {meta['version']}, expected {CHECKPOINT_VERSION}"
+        )
+
+    def load(name: str, mmap_mode: str | None = None) -> np.ndarray:
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+
+    tokens = [Token(name, value) for name, value in meta["tokens"]]
+    ledger = Ledger.from_arrays(
+        tokens,
+        load("balances", "c" if mmap else None),
+        load("held", "c" if mmap else None),
+        meta["groups"],
+        load("groups"),
+        load("group_totals"),
+    )
+
+    fee_token = meta.get("fee_token")
+    if fee_token is not None:
+        name, value = fee_token
+        token_id = ledger.token_ids.get(name)
+        fee_token = Token(name, value) if token_id is None else tokens[token_id]
+
+    blockchain = Blockchain(
+        name=meta["name"],
+        engine=meta["engine"],
+        ledger=ledger,
+        retention=meta["retention"],
+        keep_last=meta["keep_last"],
+        max_block_transactions=meta.get("max_block_transactions"),
+        block_gas_limit=meta.get("block_gas_limit"),
+        fee_token=fee_token,
+        max_workers=meta.get("max_workers"),
+    )
+    blockchain.tokens = {
+        name: tokens[ledger.token_ids[name]] for name in meta["chain_tokens"]
+    }
+    blockchain.blocks.restore(load("num_transactions"), load("num_failed"))
+
+    # The saved populations come first, as simulators refer to them by index.
+    for number, info in enumerate(meta.get("populations", [])):
+        blockchain.populations.append(
+            _decode_population(info, ledger, path, number, "r" if mmap else None)
+        )
+
+    user_ids = load("user_ids")
+    user_kinds = load("user_kinds")
+    names = load("user_names", "r" if mmap else None)
+    addresses = load("user_addresses", "r" if mmap else None)
+    for start, stop in _runs(user_ids, user_kinds):
+        blockchain.populations.append(
+            Population(
+                ledger,
+                range(int(user_ids[start]), int(user_ids[start]) + stop - start),
+                USER_KINDS[user_kinds[start]],
+                names=names[start:stop],
+                addresses=addresses[start:stop],
+            )
+        )
+
+    user_balances = load("user_balances")
+    for index in np.flatnonzero(user_balances).tolist():
+        blockchain.get_user(int(user_ids[index])).balance = float(user_balances[index])
+
+    for info in meta["contracts"]:
+        contract = CONTRACT_TYPES[info["type"]](info["name"])
+        blockchain.create_contract(contract)
+
+        for (name_1, name_2), fee, reserves, *state in info["pools"]:
+            token_1 = blockchain.tokens[name_1]
+            token_2 = blockchain.tokens[name_2]
+            if isinstance(contract, UniswapV3):
+                pool = contract.create_pool(token_1, token_2, fee)
+                _decode_concentrated(pool, reserves, state[0])
+                continue
+
+            pool = contract.create_pool(token_1, token_2, fee, *reserves)
+            if state:
+                _decode_shares(pool, state[0], ledger)
+
+    for info in meta["mempool"]:
+        blockchain.mempool.add(_decode_transaction(info, blockchain))
+
+    return blockchain
+
+
+def replace_directory(source: str, path: str) -> None:
+    """
+    Moves a freshly written checkpoint directory to `path`, replacing the
+    previous checkpoint only once the new one is complete.
+
+    The previous checkpoint is renamed before it is removed, so arrays
+    memory-mapped from it stay valid.
+    """
+    previous = f"{path}.old"
+    shutil.rmtree(previous, ignore_errors=True)
+
+    if os.path.exists(path):
+        os.replace(path, previous)
+    os.replace(source, path)
+
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def _runs(user_ids: np.ndarray, user_kinds: np.ndarray) -> list[tuple[int, int]]:
+    """
+    Returns the bounds of the runs of users with consecutive IDs and the
+    same kind.
+    """
+    breaks = np.flatnonzero((np.diff(user_ids) != 1) | (np.diff(user_kinds) != 0))
+    bounds = [0, *(breaks + 1).tolist(), len(user_ids)]
+
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def _encode_population(population: Population, path: str, number: int) -> dict:
+    for name in ("names", "addresses"):
+        values = getattr(population, name)
+        if values is not None:
+            np.save(
+                os.path.join(path, f"population_{number}_{name}.npy"),
+                np.asarray(values, dtype=str),
+            )
+
+    # Only block producers carry state outside the ledger, and only the ones
+    # created so far can have changed it.
+    return {
+        "kind": USER_KINDS.index(population.kind),
+        "ids": [population.ids.start, population.ids.stop],
+        "name_prefix": population.name_prefix,
+        "named": population.names is not None,
+        "addressed": population.addresses is not None,
+        "balances": {
+            index: user.balance
+            for index, user in population.created.items()
+            if getattr(user, "balance", 0.0)
+        },
+    }
+
+
+def _decode_population(
+    info: dict, ledger: Ledger, path: str, number: int, mmap_mode: str | None
+) -> Population:
+    def load(name: str) -> np.ndarray:
+        return np.load(
+            os.path.join(path, f"population_{number}_{name}.npy"), mmap_mode=mmap_mode
+        )
+
+    population = Population(
+        ledger,
+        range(*info["ids"]),
+        USER_KINDS[info["kind"]],
+        info["name_prefix"],
+        names=load("names") if info.get("named") else None,
+        addresses=load("addresses") if info.get("addressed") else None,
+    )
+    for index, balance in info["balances"].items():
+        population[int(index)].balance = balance
+
+    return population
+
+
+def _encode_contract(contract: AmmProtocol) -> dict:
+    if type(contract).__name__ not in CONTRACT_TYPES:
+        raise ValueError(f"Cannot checkpoint contract {contract.name!r}")
+
+    return {
+        "type": type(contract).__name__,
+        "name": contract.name,
+        "pools": [
+            [
+                [token.name for token in pool.token_reserve],
+                pool.fee,
+                list(pool.token_reserve.values()),
+                _encode_concentrated(pool)
+                if isinstance(pool, ConcentratedPool)
+                else _encode_shares(pool),
+            ]
+            for pool in contract.get_pools()
+        ],
+    }
+
+
+def _encode_shares(pool: LiquidityPool) -> dict:
+    tokens = list(pool.token_reserve)
+
+    return {
+        "total_shares": pool.total_shares,
+        "fee_per_share": [pool.fee_per_share[token] for token in tokens],
+        "positions": [
+            [
+                address,
+                position.shares,
+                [position.fee_checkpoint[token] for token in tokens],
+                [position.fees_earned[token] for token in tokens],
+            ]
+            for address, position in pool.lp_positions.items()
+        ],
+    }
+
+
+def _decode_shares(pool: LiquidityPool, info: dict, ledger: Ledger) -> None:
+    tokens = list(pool.token_reserve)
+
+    pool.total_shares = info["total_shares"]
+    pool.fee_per_share = dict(zip(tokens, info["fee_per_share"]))
+    for address, shares, fee_checkpoint, fees_earned in info["positions"]:
+        position = pool.lp_positions[address] = LPPosition(pool.fee_per_share)
+        position.shares = shares
+        position.fee_checkpoint = dict(zip(tokens, fee_checkpoint))
+        position.fees_earned = dict(zip(tokens, fees_earned))
+
+    # Share tokens held in wallets are restored with the ledger.
+    if pool.lp_token is not None:
+        token_id = ledger.token_ids.get(pool.lp_token.name)
+        if token_id is not None:
+            pool.lp_token = ledger.tokens[token_id]
+
+
+def _encode_concentrated(pool: ConcentratedPool) -> dict:
+    return {
+        "sqrt_price": pool.sqrt_price,
+        "tick": pool.tick,
+        "liquidity": pool.liquidity,
+        "fee_growth_global": pool.fee_growth_global,
+        "ticks": [
+            [tick, info.liquidity_gross, info.liquidity_net, info.fee_growth_outside]
+            for tick, info in pool.ticks.items()
+        ],
+        "positions": [
+            [
+                owner,
+                tick_lower,
+                tick_upper,
+                position.liquidity,
+                position.fee_growth_inside_last,
+                position.tokens_owed,
+            ]
+            for (owner, tick_lower, tick_upper), position in pool.positions.items()
+        ],
+    }
+
+
+def _decode_concentrated(
+    pool: ConcentratedPool, reserves: list[float], info: dict
+) -> None:
+    for token, reserve in zip(list(pool.token_reserve), reserves):
+        pool.token_reserve[token] = reserve
+
+    pool.sqrt_price = info["sqrt_price"]
+    pool.tick = info["tick"]
+    pool.liquidity = info["liquidity"]
+    pool.fee_growth_global = info["fee_growth_global"]
+
+    # The bitmap is an index of the initialized ticks, so it is rebuilt.
+    for tick, liquidity_gross, liquidity_net, fee_growth_outside in info["ticks"]:
+        tick_info = pool.ticks[tick] = Tick(fee_growth_outside)
+        tick_info.liquidity_gross = liquidity_gross
+        tick_info.liquidity_net = liquidity_net
+        pool.bitmap.flip(tick)
+
+    for owner, tick_lower, tick_upper, liquidity, inside, owed in info["positions"]:
+        position = pool.positions[(owner, tick_lower, tick_upper)] = Position()
+        position.liquidity = liquidity
+        position.fee_growth_inside_last = inside
+        position.tokens_owed = owed
+
+
+def _encode_transaction(transaction: Transaction) -> dict:
+    args = {}
+    for name, value in transaction.args.items():
+        if isinstance(value, Token):
+            args[name] = {"token": value.name}
+        elif isinstance(value, (int, float)):
+            args[name] = value
+        else:
+            raise ValueError(f"Cannot checkpoint transaction argument {name}={value!r}")
+
+    return {
+        "sender": transaction.sender.user_id,
+        "contract": transaction.contract.name,
+        "function": transaction.function,
+        "args": args,
+        "gas_fee": transaction.gas_fee,
+    }
+
+
+def _decode_transaction(info: dict, blockchain: Blockchain) -> Transaction:
+    return Transaction(
+        sender=blockchain.get_user(info["sender"]),
+        contract=blockchain.contracts[info["contract"]],
+        function=info["function"],
+        args={
+            name: blockchain.tokens[value["token"]]
+            if isinstance(value, dict)
+            else value
+            for name, value in info["args"].items()
+        },
+        gas_fee=info["gas_fee"],
+    )
@@ -0,0 +1,348 @@
+import json
+import os
+import queue
+import threading
+from abc import ABC, abstractmethod
+
+from contracts.amm_protocol import AmmProtocol
+from core.transaction import Transaction
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+# The columns of each exported table and their Arrow types.
+TABLES: dict[str, dict[str, str]] = {
+    "transactions": {
+        "block": "int64",
+        "sender": "string",
+        "contract": "string",
+        "function": "string",
+        "token_a": "string",
+        "token_b": "string",
+        "amount_a": "float64",
+        "amount_b": "float64",
+        "gas_fee": "float64",
+        "status": "bool",
+    },
+    "reserves": {
+        "block": "int64",
+        "contract": "string",
+        "pool": "string",
+        "token": "string",
+        "reserve": "float64",
+    },
+    "prices": {"block": "int64", "token": "string", "value": "float64"},
+}
+
+FORMATS = ("ndjson", "parquet", "arrow")
+
+
+class ExportSink(ABC):
+    """
+    Represents a destination for exported rows, with one output per table.
+
+    Sinks receive column batches from the exporter's writer thread only, so
+    they do not need to be thread-safe.
+
+    Attributes:
+        path (str): The directory the tables are written to.
+    """
+
+    extension = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.path!r})"
+
+    def table_path(self, table: str) -> str:
+        return os.path.join(self.path, f"{table}.{self.extension}")
+
+    @abstractmethod
+    def write(self, table: str, columns: dict[str, list]) -> None:
+        """
+        Writes a batch of rows to a table.
+
+        Args:
+            table (str): The table name.
+            columns (dict[str, list]): The values of each column of the batch.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class NDJSONSink(ExportSink):
+    """
+    Writes each table as newline-delimited JSON, one object per row.
+    """
+
+    extension = "ndjson"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._files = {}
+
+    def write(self, table: str, columns: dict[str, list]) -> None:
+        file = self._files.get(table)
+        if file is None:
+            file = open(self.table_path(table), "w", encoding="utf-8")
+            self._files[table] = file
+
+        names = list(columns)
+        file.writelines(
+            json.dumps(dict(zip(names, row))) + "\n" for row in zip(*columns.values())
+        )
+
+    def close(self) -> None:
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+
+
+class ArrowSink(ExportSink):
+    """
+    Writes each table as a Parquet file with one row group per batch, or as
+    an Arrow IPC file with one record batch per batch.
+
+    Requires pyarrow.
+    """
+
+    def __init__(self, path: str, format: str = "parquet"):
+        if pa is None:
+            raise ImportError(f"Exporting to {format} requires pyarrow")
+
+        if format not in ("parquet", "arrow"):
+            raise ValueError(
+                f"Unknown Arrow format {format!r}, expected 'parquet' or 'arrow'"
+            )
+
+        super().__init__(path)
+        self.format = format
+        self.extension = format
+        self._writers = {}
+
+    def write(self, table: str, columns: dict[str, list]) -> None:
+        schema = pa.schema(
+            [
+                (column, pa.type_for_alias(kind))
+                for column, kind in TABLES[table].items()
+            ]
+        )
+        batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+
+        writer = self._writers.get(table)
+        if writer is None:
+            if self.format == "parquet":
+                writer = pa.parquet.ParquetWriter(self.table_path(table), schema)
+            else:
+                writer = pa.ipc.new_file(self.table_path(table), schema)
+            self._writers[table] = writer
+
+        if self.format == "parquet":
+            writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+
+    def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+def create_sink(path: str, format: str = "ndjson") -> ExportSink:
+    """
+    Creates an export sink for one of `FORMATS`.
+
+    Args:
+        path (str): The directory the tables are written to.
+        format (str): The output format.
+
+    Returns:
+        ExportSink: The sink.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format {format!r}, expected one of {FORMATS}")
+
+    if format == "ndjson":
+        return NDJSONSink(path)
+
+    return ArrowSink(path, format)
+
+
+class BlockExporter:
+    """
+    Streams the executed transactions, pool reserves and token prices of
+    every block to an export sink.
+
+    Rows are buffered per table and handed to a background writer thread in
+    batches of `batch_size` rows, so the simulation loop never waits on file
+    I/O unless `max_pending` batches are already queued.
+
+    Attributes:
+        sink (ExportSink): The destination of the rows.
+        batch_size (int): The number of rows per written batch.
+        num_rows (dict[str, int]): The number of rows exported per table.
+    """
+
+    def __init__(
+        self, sink: ExportSink, batch_size: int = 65536, max_pending: int = 16
+    ):
+        """
+        Initializes the exporter and starts its writer thread.
+
+        Args:
+            sink (ExportSink): The destination of the rows.
+            batch_size (int): The number of rows per written batch.
+            max_pending (int): The number of batches that may wait for the
+                writer before the simulation blocks.
+        """
+        self.sink = sink
+        self.batch_size = batch_size
+        self.num_rows = {table: 0 for table in TABLES}
+
+        self._buffers = {
+            table: {column: [] for column in columns}
+            for table, columns in TABLES.items()
+        }
+        self._queue: queue.Queue = queue.Queue(max_pending)
+        self._error: BaseException | None = None
+        self._closed = False
+
+        self._thread = threading.Thread(
+            target=self._write_batches, name="BlockExporter", daemon=True
+        )
+        self._thread.start()
+
+    def __repr__(self) -> str:
+        return f"BlockExporter({self.sink}, rows={self.num_rows})"
+
+    def __enter__(self) -> "BlockExporter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def record_block(
+        self,
+        blockchain: "Blockchain",  # type: ignore
+        block_number: int,
+        transactions: list[Transaction],
+        statuses: list[bool],
+    ) -> None:
+        """
+        Buffers the rows of a block that has just been created.
+
+        Args:
+            blockchain (Blockchain): The blockchain the block was created on.
+            block_number (int): The number of the block.
+            transactions (list[Transaction]): The transactions of the block.
+            statuses (list[bool]): Whether each transaction succeeded.
+        """
+        if self._error is not None:
+            raise RuntimeError("Block export failed") from self._error
+
+        tokens = blockchain.ledger.tokens
+        rows = self._buffers["transactions"]
+        for transaction, status in zip(transactions, statuses):
+            (
+                _,
+                _,
+                _,
+                _,
+                token_a,
+                token_b,
+                amount_a,
+                amount_b,
+                gas_fee,
+            ) = blockchain.blocks.encode(transaction)
+
+            rows["block"].append(block_number)
+            rows["sender"].append(transaction.sender.name)
+            rows["contract"].append(transaction.contract.name)
+            rows["function"].append(transaction.function)
+            rows["token_a"].append(tokens[token_a].name if token_a >= 0 else None)
+            rows["token_b"].append(tokens[token_b].name if token_b >= 0 else None)
+            rows["amount_a"].append(amount_a)
+            rows["amount_b"].append(amount_b)
+            rows["gas_fee"].append(None if gas_fee != gas_fee else gas_fee)
+            rows["status"].append(status)
+        self._flush("transactions")
+
+        rows = self._buffers["reserves"]
+        for contract in blockchain.contracts.values():
+            if not isinstance(contract, AmmProtocol):
+                continue
+
+            for pool in contract.get_pools():
+                for token, reserve in pool.token_reserve.items():
+                    rows["block"].append(block_number)
+                    rows["contract"].append(contract.name)
+                    rows["pool"].append(pool.pair_name)
+                    rows["token"].append(token.name)
+                    rows["reserve"].append(reserve)
+        self._flush("reserves")
+
+        rows = self._buffers["prices"]
+        for token in blockchain.tokens.values():
+            rows["block"].append(block_number)
+            rows["token"].append(token.name)
+            rows["value"].append(token.value)
+        self._flush("prices")
+
+    def flush(self) -> None:
+        """
+        Hands every buffered row to the writer and waits until it is written.
+        """
+        for table in TABLES:
+            self._flush(table, force=True)
+
+        self._queue.join()
+
+        if self._error is not None:
+            raise RuntimeError("Block export failed") from self._error
+
+    def close(self) -> None:
+        """
+        Writes the remaining rows, stops the writer thread and closes the sink.
+        """
+        if self._closed:
+            return
+
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+            self.sink.close()
+
+    def _flush(self, table: str, force: bool = False) -> None:
+        buffer = self._buffers[table]
+        num_rows = len(buffer["block"])
+        if num_rows == 0 or (num_rows < self.batch_size and not force):
+            return
+
+        self._queue.put((table, buffer))
+        self.num_rows[table] += num_rows
+        self._buffers[table] = {column: [] for column in TABLES[table]}
+
+    def _write_batches(self) -> None:
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+
+                if self._error is None:
+                    self.sink.write(*batch)
+            except BaseException as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
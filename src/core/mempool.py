@@ -0,0 +1,233 @@
+import heapq
+from collections import deque
+from operator import itemgetter
+from typing import Iterator
+
+from core.transaction import Transaction
+
+# Rough gas used by each contract function, after the equivalent Uniswap V2
+# and V3 calls. Functions not listed use `DEFAULT_GAS`.
+GAS_COSTS: dict[str, int] = {
+    "swap": 100_000,
+    "swap_exact_in": 100_000,
+    "add_liquidity": 150_000,
+    "remove_liquidity": 120_000,
+    "mint": 200_000,
+    "burn": 150_000,
+    "collect": 80_000,
+}
+DEFAULT_GAS = 100_000
+
+# Marks a mempool whose pending transactions do not all pay the same fee.
+_MIXED_FEES = object()
+
+
+class Mempool:
+    """
+    Represents the pending transactions of a blockchain as a priority queue
+    ordered by gas fee.
+
+    Transactions of one sender are executed in the order they were sent,
+    standing in for account nonces: only the first pending transaction of
+    every sender is in the heap, and the next one replaces it when it is
+    popped. Transactions paying the same fee are popped in arrival order, so
+    without fees the mempool behaves like a FIFO list.
+
+    Insertions and pops cost O(log n), so a block can take the top of a
+    mempool of millions of transactions without sorting or copying the rest.
+    """
+
+    def __init__(self, transactions: list[Transaction] | None = None):
+        """
+        Initializes a mempool.
+
+        Args:
+            transactions (list[Transaction] | None): The initial pending
+                transactions, in arrival order.
+        """
+        self._heap: list[tuple[float, int, Transaction]] = []
+        # The senders with a transaction in the heap, by address, and the
+        # transactions they sent after it.
+        self._senders: dict[str, deque | None] = {}
+        self._count = 0
+        self._size = 0
+        self._fee: object = None
+
+        for transaction in transactions or []:
+            self.add(transaction)
+
+    def __repr__(self) -> str:
+        return f"Mempool(size={self._size}, senders={len(self._senders)})"
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Transaction]:
+        """
+        Iterates over the pending transactions in arrival order.
+        """
+        return (transaction for _, transaction in self._entries())
+
+    def add(self, transaction: Transaction) -> None:
+        """
+        Adds a transaction to the mempool.
+        """
+        fee = transaction.gas_fee or 0.0
+        count = self._count
+        self._count = count + 1
+
+        if not self._size:
+            self._fee = fee
+        elif fee != self._fee:
+            self._fee = _MIXED_FEES
+        self._size += 1
+
+        key = transaction.sender.address
+        if key in self._senders:
+            followers = self._senders[key]
+            if followers is None:
+                followers = self._senders[key] = deque()
+            followers.append((count, transaction))
+        else:
+            self._senders[key] = None
+            heapq.heappush(self._heap, (-fee, count, transaction))
+
+    def extend(self, transactions: list[Transaction]) -> None:
+        """
+        Adds transactions to the mempool in order, as repeated `add` calls
+        would. A batch of new senders is appended to the heap in one go,
+        which keeps a single-fee heap valid, and otherwise heapified.
+        """
+        if not transactions:
+            return
+
+        senders = self._senders
+        count = self._count
+        fees = [-(transaction.gas_fee or 0.0) for transaction in transactions]
+        keys = [transaction.sender.address for transaction in transactions]
+
+        fee = -fees[0]
+        if len(set(fees)) > 1 or (self._size and self._fee != fee):
+            self._fee = _MIXED_FEES
+        elif not self._size:
+            self._fee = fee
+
+        new_keys = dict.fromkeys(keys)
+        if len(new_keys) == len(keys) and senders.keys().isdisjoint(new_keys):
+            # Every transaction heads the queue of a new sender.
+            senders.update(new_keys)
+            heads = list(zip(fees, range(count, count + len(keys)), transactions))
+        else:
+            heads = []
+            for fee, key, transaction in zip(fees, keys, transactions):
+                if key in senders:
+                    followers = senders[key]
+                    if followers is None:
+                        followers = senders[key] = deque()
+                    followers.append((count, transaction))
+                else:
+                    senders[key] = None
+                    heads.append((fee, count, transaction))
+                count += 1
+
+        # Entries of a single fee arrive in increasing order, so appending
+        # them keeps the heap valid.
+        if self._fee is not _MIXED_FEES:
+            self._heap.extend(heads)
+        elif len(heads) > len(self._heap):
+            self._heap.extend(heads)
+            heapq.heapify(self._heap)
+        else:
+            for head in heads:
+                heapq.heappush(self._heap, head)
+
+        self._size += len(transactions)
+        self._count += len(transactions)
+
+    def pop(self) -> Transaction:
+        """
+        Removes and returns the pending transaction paying the highest fee
+        that is next in its sender's order.
+        """
+        if not self._heap:
+            raise IndexError("pop from an empty mempool")
+
+        _, _, transaction = heapq.heappop(self._heap)
+        self._size -= 1
+
+        key = transaction.sender.address
+        followers = self._senders[key]
+        if followers:
+            count, follower = followers.popleft()
+            heapq.heappush(self._heap, (-(follower.gas_fee or 0.0), count, follower))
+        else:
+            del self._senders[key]
+
+        return transaction
+
+    def pop_block(
+        self, max_transactions: int | None = None, max_gas: int | None = None
+    ) -> list[Transaction]:
+        """
+        Removes and returns the transactions of the next block, in execution
+        order. The remaining transactions stay pending.
+
+        Args:
+            max_transactions (int | None): The maximum number of transactions
+                of the block, or None for no limit.
+            max_gas (int | None): The gas limit of the block, or None for no
+                limit. The block stops at the first transaction that does not
+                fit.
+
+        Returns:
+            list[Transaction]: The transactions of the block.
+        """
+        if max_gas is None and (
+            max_transactions is None or max_transactions >= self._size
+        ):
+            return self._pop_all()
+
+        transactions = []
+        gas = 0
+        limit = self._size if max_transactions is None else max_transactions
+
+        while self._heap and len(transactions) < limit:
+            if max_gas is not None:
+                gas += gas_of(self._heap[0][2])
+                if gas > max_gas:
+                    break
+
+            transactions.append(self.pop())
+
+        return transactions
+
+    def clear(self) -> None:
+        self._heap = []
+        self._senders = {}
+        self._size = 0
+
+    def _pop_all(self) -> list[Transaction]:
+        if self._fee is _MIXED_FEES:
+            transactions = [self.pop() for _ in range(self._size)]
+        else:
+            # With a single fee the priority order is the arrival order.
+            transactions = [transaction for _, transaction in self._entries()]
+            self.clear()
+
+        return transactions
+
+    def _entries(self) -> list[tuple[int, Transaction]]:
+        entries = [(count, transaction) for _, count, transaction in self._heap]
+        for followers in self._senders.values():
+            if followers:
+                entries.extend(followers)
+        entries.sort(key=itemgetter(0))
+
+        return entries
+
+
+def gas_of(transaction: Transaction) -> int:
+    """
+    Returns the gas a transaction uses.
+    """
+    return GAS_COSTS.get(transaction.function, DEFAULT_GAS)
@@ -0,0 +1,351 @@
+import heapq
+import multiprocessing
+import os
+from typing import Sequence
+
+import numpy as np
+
+from core.transaction import Transaction
+from market.ledger import Ledger
+from utils.logger import events
+
+# Segments shorter than this run in the calling process, as forking workers
+# for them costs more than running them on several cores saves.
+MIN_SEGMENT_SIZE = 1024
+
+# Workers are forked, so they start from the state the block runs on.
+FORK_AVAILABLE = "fork" in multiprocessing.get_all_start_methods()
+
+
+class ParallelExecutor:
+    """
+    Executes the transactions of a block on several worker processes, with
+    the same balances, reserves and fees as executing them one by one. As
+    with the batch engine, the group holdings match up to rounding.
+
+    Every transaction changes its sender's wallet and the shared objects its
+    contract reports with `Contract.conflict_keys`, such as the pool of a
+    swap. Transactions sharing a wallet or an object are chained into a
+    group that runs in block order in one worker, while groups with nothing
+    in common run concurrently. Each worker hands its transactions to the
+    contracts' batch path, `Contract.process_batch`. A transaction whose
+    objects are unknown is a barrier: the transactions before it finish, it
+    runs alone, and the next segment of the block starts after it.
+
+    The groups of a segment are spread over `max_workers` bins. The first
+    bin runs in the calling process, and each other bin in a process forked
+    for the segment, which sends back the wallets of its senders, the
+    snapshots of its objects, its statuses, its group holding updates and
+    its failures. Bins share no wallet and no object, so the calling process
+    merges them by writing the wallets, restoring the objects, summing the
+    group holdings in bin order and logging the failures. Profiler timings
+    of the forked workers are not merged.
+
+    Execution is optimistic: if a bin changed the ledger's token table,
+    which no object covers, or raised, the senders' wallets and the objects
+    are restored and the segment is executed again in the calling process.
+
+    Attributes:
+        max_workers (int): The number of processes a segment runs on, by
+            default the number of CPUs where processes can be forked and 1
+            elsewhere.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        if max_workers is None:
+            max_workers = (os.cpu_count() or 1) if FORK_AVAILABLE else 1
+        elif max_workers > 1 and not FORK_AVAILABLE:
+            raise ValueError("Parallel execution needs processes to be forked")
+
+        self.max_workers = max_workers
+
+    def __repr__(self) -> str:
+        return f"ParallelExecutor(max_workers={self.max_workers})"
+
+    def execute(self, transactions: list[Transaction], ledger: Ledger) -> list[bool]:
+        """
+        Executes transactions as if one by one, in order.
+
+        Args:
+            transactions (list[Transaction]): The transactions to execute.
+            ledger (Ledger): The ledger of the senders' wallets.
+
+        Returns:
+            list[bool]: Whether each transaction succeeded.
+        """
+        statuses: list[bool] = [False] * len(transactions)
+        if self.max_workers < 2:
+            self._process_batched(transactions, range(len(transactions)), statuses)
+            return statuses
+
+        keys = [
+            transaction.contract.conflict_keys(transaction)
+            for transaction in transactions
+        ]
+
+        start = 0
+        while start < len(transactions):
+            stop = start
+            while stop < len(transactions) and keys[stop] is not None:
+                stop += 1
+
+            if stop > start:
+                self._execute_segment(transactions, keys, statuses, start, stop, ledger)
+
+            if stop < len(transactions):
+                statuses[stop] = transactions[stop].process()
+                stop += 1
+
+            start = stop
+
+        return statuses
+
+    @staticmethod
+    def _process_batched(
+        transactions: list[Transaction], indices: Sequence[int], statuses: list[bool]
+    ) -> None:
+        """
+        Processes the transactions at `indices` in order, handing each run
+        sent to the same contract to that contract's batch path.
+        """
+        start = 0
+        while start < len(indices):
+            contract = transactions[indices[start]].contract
+            stop = start + 1
+            while (
+                stop < len(indices) and transactions[indices[stop]].contract is contract
+            ):
+                stop += 1
+
+            run = indices[start:stop]
+            batch = contract.process_batch([transactions[index] for index in run])
+            for index, status in zip(run, batch):
+                statuses[index] = status
+
+            start = stop
+
+    def _execute_segment(
+        self,
+        transactions: list[Transaction],
+        keys: list[tuple],
+        statuses: list[bool],
+        start: int,
+        stop: int,
+        ledger: Ledger,
+    ) -> None:
+        if stop - start < MIN_SEGMENT_SIZE:
+            self._process_batched(transactions, range(start, stop), statuses)
+            return
+
+        bins = self._partition(transactions, keys, start, stop)
+        if len(bins) < 2:
+            self._process_batched(transactions, range(start, stop), statuses)
+            return
+
+        user_ids = [
+            np.unique([transactions[index].sender.user_id for index in indices])
+            for indices in bins
+        ]
+        pools = [
+            list({id(pool): pool for index in indices for pool in keys[index]}.values())
+            for indices in bins
+        ]
+        num_tokens = len(ledger.tokens)
+        balances = [ledger._balances[ids].copy() for ids in user_ids]
+        held = [ledger._held[ids].copy() for ids in user_ids]
+        states = [[pool.snapshot() for pool in objects] for objects in pools]
+
+        context = multiprocessing.get_context("fork")
+        workers = []
+        for number in range(1, len(bins)):
+            receiver, sender = context.Pipe(duplex=False)
+            worker = context.Process(
+                target=_run_bin,
+                args=(
+                    sender,
+                    transactions,
+                    bins[number],
+                    user_ids[number],
+                    pools[number],
+                    ledger,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            sender.close()
+            workers.append((worker, receiver))
+
+        journal: list = []
+        ledger.start_journal()
+        ledger.journal_to(journal)
+        try:
+            self._process_batched(transactions, bins[0], statuses)
+            valid = len(ledger.tokens) == num_tokens
+        except Exception:  # pylint: disable=broad-except
+            valid = False
+
+        results = []
+        for worker, receiver in workers:
+            try:
+                results.append(receiver.recv())
+            except EOFError:
+                results.append(None)
+            receiver.close()
+            worker.join()
+        valid = valid and all(result is not None for result in results)
+
+        journals = [journal]
+        if valid:
+            for number, result in enumerate(results, 1):
+                (
+                    bin_statuses,
+                    bin_balances,
+                    bin_held,
+                    bin_states,
+                    entries,
+                    failures,
+                ) = result
+                for index, status in zip(bins[number], bin_statuses):
+                    statuses[index] = status
+                ledger._balances[user_ids[number]] = bin_balances
+                ledger._held[user_ids[number]] = bin_held
+                for pool, state in zip(pools[number], bin_states):
+                    pool.restore(state)
+                journals.append(entries)
+                for error, event, fields in failures:
+                    events.failure(error, event, **fields)
+
+        ledger.stop_journal(journals if valid else ())
+        if valid:
+            return
+
+        # Roll the calling process's bin back and execute the segment serially.
+        for ids, bin_balances, bin_held in zip(user_ids, balances, held):
+            columns = bin_balances.shape[1]
+            ledger._balances[ids, :columns] = bin_balances
+            ledger._balances[ids, columns:] = 0.0
+            ledger._held[ids, :columns] = bin_held
+            ledger._held[ids, columns:] = False
+        for objects, bin_states in zip(pools, states):
+            for pool, state in zip(objects, bin_states):
+                pool.restore(state)
+
+        self._process_batched(transactions, range(start, stop), statuses)
+
+    def _partition(
+        self, transactions: list[Transaction], keys: list[tuple], start: int, stop: int
+    ) -> list[list[int]]:
+        """
+        Groups the transactions in `[start, stop)` that share their sender or
+        a key, and spreads the groups over at most `max_workers` bins of
+        similar size. Each bin lists its transactions in block order.
+
+        The objects are numbered, and union-find runs over the distinct
+        (sender, object) pairs rather than over the transactions.
+        """
+        senders = [
+            transaction.sender.user_id for transaction in transactions[start:stop]
+        ]
+        objects = [id(key) for index in range(start, stop) for key in keys[index]]
+        rows = np.repeat(
+            np.arange(stop - start), [len(keys[index]) for index in range(start, stop)]
+        )
+
+        ids, codes = np.unique(
+            np.array(senders + objects, dtype=np.int64), return_inverse=True
+        )
+        sender_codes = codes[: len(senders)]
+        pairs = np.unique(sender_codes[rows] * len(ids) + codes[len(senders) :])
+
+        parent = list(range(len(ids)))
+
+        def find(code: int) -> int:
+            root = code
+            while parent[root] != root:
+                root = parent[root]
+            while parent[code] != root:
+                parent[code], code = root, parent[code]
+            return root
+
+        for code_1, code_2 in zip(*(part.tolist() for part in divmod(pairs, len(ids)))):
+            root_1, root_2 = find(code_1), find(code_2)
+            if root_1 != root_2:
+                parent[max(root_1, root_2)] = min(root_1, root_2)
+
+        roots = np.array([find(code) for code in range(len(ids))])
+        labels = roots[sender_codes]
+        order = np.argsort(labels, kind="stable")
+        groups = np.split(order + start, np.flatnonzero(np.diff(labels[order])) + 1)
+
+        if len(groups) < 2 or self.max_workers < 2:
+            return [list(range(start, stop))]
+
+        # Largest groups first, each to the least loaded bin.
+        bins: list[list[int]] = [[] for _ in range(min(self.max_workers, len(groups)))]
+        loads = [(0, number) for number in range(len(bins))]
+        for group in sorted(groups, key=len, reverse=True):
+            load, number = heapq.heappop(loads)
+            bins[number].extend(group.tolist())
+            heapq.heappush(loads, (load + len(group), number))
+
+        for indices in bins:
+            indices.sort()
+
+        return bins
+
+
+def _run_bin(
+    connection,
+    transactions: list[Transaction],
+    indices: list[int],
+    user_ids: np.ndarray,
+    pools: list,
+    ledger: Ledger,
+) -> None:
+    """
+    Executes a bin in a forked worker and sends back its statuses, the
+    wallets of its senders, the snapshots of its objects, its group holding
+    updates summed by group and token, and its failures, or None if the bin
+    cannot be merged.
+    """
+    statuses: list[bool] = [False] * len(transactions)
+    failures: list = []
+    journal: list = []
+    num_tokens = len(ledger.tokens)
+
+    events.record_failures(failures)
+    ledger.start_journal()
+    ledger.journal_to(journal)
+    try:
+        ParallelExecutor._process_batched(transactions, indices, statuses)
+    except Exception:  # pylint: disable=broad-except
+        connection.send(None)
+        return
+
+    if len(ledger.tokens) != num_tokens:
+        connection.send(None)
+        return
+
+    totals: dict[tuple[int, int], float] = {}
+    for group_id, token_id, amount in journal:
+        totals[group_id, token_id] = totals.get((group_id, token_id), 0.0) + amount
+
+    try:
+        connection.send(
+            (
+                [statuses[index] for index in indices],
+                ledger._balances[user_ids],
+                ledger._held[user_ids],
+                [pool.snapshot() for pool in pools],
+                [
+                    (group_id, token_id, amount)
+                    for (group_id, token_id), amount in totals.items()
+                ],
+                failures,
+            )
+        )
+    except Exception:  # pylint: disable=broad-except
+        connection.send(None)
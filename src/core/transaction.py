@@ -3,6 +3,7 @@ from typing import Any, Optional
 
 from contracts.contract import Contract
 from market.actors.user import User
+from utils.logger import events
 
 
 @dataclass
@@ -24,13 +25,113 @@ class Transaction:
     args: dict[str, Any]
     gas_fee: Optional[float] = None
 
-    def process(self) -> None:
+    def process(self) -> bool:
         """
         Processes the transaction.
+
+        Returns:
+            bool: Whether the transaction succeeded.
         """
         try:
             self.contract.process(
                 function=self.function, sender=self.sender, **self.args
             )
         except Exception as e:
-            print(f"{self} {e}")
+            events.failure(
+                e,
+                "transaction_failed",
+                sender=self.sender.name,
+                contract=self.contract.name,
+                function=self.function,
+                args=self.args,
+            )
+            return False
+
+        return True
+
+    def compile(self) -> "CompiledTransaction":
+        """
+        Returns the transaction as a compiled transaction, with its
+        arguments as the positional operands of the function's opcode.
+        """
+        opcode = self.contract.opcode(self.function)
+        names = self.contract.dispatch.operands[opcode][: len(self.args)]
+        if self.args.keys() != set(names):
+            raise ValueError(f"Cannot compile the arguments of {self.function}")
+
+        return CompiledTransaction(
+            self.sender,
+            self.contract,
+            opcode,
+            tuple(self.args[name] for name in names),
+            self.gas_fee,
+        )
+
+
+class CompiledTransaction:
+    """
+    Represents a transaction as an opcode of its contract's dispatch table
+    and positional operands.
+
+    Processing one is an indexed call, without the name lookup and keyword
+    arguments of `Transaction`. `function` and `args` are derived from the
+    dispatch table, so the mempool, block store and exporters handle both
+    kinds alike.
+
+    Attributes:
+        sender (User): The sender of the transaction.
+        contract (Contract): The contract the transaction is sent to.
+        opcode (int): The opcode of the function to call.
+        operands (tuple): The arguments to pass to the function, in the
+            order of its parameters.
+        gas_fee (Optional[float]): The gas fee of the transaction.
+    """
+
+    __slots__ = ("sender", "contract", "opcode", "operands", "gas_fee")
+
+    def __init__(
+        self,
+        sender: User,
+        contract: Contract,
+        opcode: int,
+        operands: tuple,
+        gas_fee: Optional[float] = None,
+    ):
+        self.sender = sender
+        self.contract = contract
+        self.opcode = opcode
+        self.operands = operands
+        self.gas_fee = gas_fee
+
+    def __repr__(self) -> str:
+        return f"CompiledTransaction(sender={self.sender.name!r}, contract={self.contract.name!r}, function={self.function!r}, operands={self.operands!r}, gas_fee={self.gas_fee!r})"
+
+    @property
+    def function(self) -> str:
+        return self.contract.dispatch.names[self.opcode]
+
+    @property
+    def args(self) -> dict[str, Any]:
+        return dict(zip(self.contract.dispatch.operands[self.opcode], self.operands))
+
+    def process(self) -> bool:
+        """
+        Processes the transaction.
+
+        Returns:
+            bool: Whether the transaction succeeded.
+        """
+        try:
+            self.contract.dispatch.functions[self.opcode](self.sender, *self.operands)
+        except Exception as e:
+            events.failure(
+                e,
+                "transaction_failed",
+                sender=self.sender.name,
+                contract=self.contract.name,
+                function=self.function,
+                args=self.args,
+            )
+            return False
+
+        return True
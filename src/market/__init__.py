@@ -1 +1,2 @@
+from market.ledger import Ledger, Wallet
 from market.token import Token
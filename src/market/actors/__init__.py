@@ -1 +1 @@
-from market.actors.user import User
+from market.actors.user import Population, User
@@ -1,6 +1,10 @@
 import uuid
+from collections.abc import Iterator, Sequence
 from dataclasses import dataclass, field
 
+import numpy as np
+
+from market.ledger import Ledger, Wallet
 from market.token import Token
 
 
@@ -11,20 +15,33 @@ class User:
 
     Attributes:
         address (str): The address of the user.
-        wallet (dict[Token, float]): The wallet of the user, containing different tokens.
+        ledger (Ledger): The ledger holding the user's balances.
+        user_id (int): The ID of the user in the ledger.
+        wallet (Wallet): The wallet of the user, a view over its ledger row.
         transaction_history (list[Transaction]): The transaction history of the user.
     """
 
     name: str
     address: str = field(default_factory=lambda: str(uuid.uuid4()))
-    wallet: dict[Token, float] = field(default_factory=dict)
+    ledger: Ledger | None = field(default=None, repr=False, compare=False)
+    user_id: int = field(default=-1, repr=False, compare=False)
+    wallet: Wallet = field(init=False, compare=False)
+
+    def __post_init__(self):
+        if self.ledger is None:
+            self.ledger = Ledger(user_capacity=1)
+
+        if self.user_id < 0:
+            self.user_id = self.ledger.register_user()
+
+        self.wallet = Wallet(self.ledger, self.user_id)
 
     @property
     def total_value(self) -> float:
         """
         Returns the total value of the user's wallet.
         """
-        return sum(token.value * amount for token, amount in self.wallet.items())
+        return float(self.ledger.balances[self.user_id] @ self.ledger.prices)
 
     def send_transaction(
         self, transaction: "Transaction", blockchain: "Blockchain"  # type: ignore
@@ -39,13 +56,7 @@ class User:
             token (Token): The token to add.
             amount (float): The amount of the token to add.
         """
-        if amount < 0:
-            raise ValueError("Amount must be positive")
-
-        if token not in self.wallet:
-            self.wallet[token] = 0.0
-
-        self.wallet[token] += amount
+        self.ledger.deposit(self.user_id, token, amount)
 
     def remove_from_wallet(self, token: Token, amount: float) -> None:
         """
@@ -55,19 +66,7 @@ class User:
             token (Token): The token to remove.
             amount (float): The amount of the token to remove.
         """
-        if amount < 0:
-            raise ValueError("Amount must be positive")
-
-        if token not in self.wallet:
-            raise ValueError("Token not in wallet")
-
-        if self.wallet[token] < amount:
-            raise ValueError("Insufficient funds")
-
-        self.wallet[token] -= amount
-
-        if self.wallet[token] == 0:
-            del self.wallet[token]
+        self.ledger.withdraw(self.user_id, token, amount)
 
 
 @dataclass
@@ -80,3 +79,138 @@ class BlockProducer(User):
     """
 
     balance: float = 0.0
+
+
+class Population(Sequence):
+    """
+    Represents users allocated together in a ledger, created only when used.
+
+    The users' ledger rows are allocated at once and each user is described
+    by its index: its name is `name_prefix` followed by the index and its
+    address is derived from its user ID, unless the population was given
+    the names and addresses of existing users, as when restoring them from
+    a checkpoint. The `User` object of an index is created the first time
+    it is accessed and reused afterwards, so a population costs its ledger
+    rows until code touches individual users.
+
+    Attributes:
+        ledger (Ledger): The ledger holding the users' balances.
+        ids (range): The IDs of the users in the ledger.
+        kind (type[User]): The type of the users.
+        name_prefix (str): The prefix of the users' names.
+        names (np.ndarray | None): The name of each user, if not derived.
+        addresses (np.ndarray | None): The address of each user, if not derived.
+    """
+
+    def __init__(
+        self,
+        ledger: Ledger,
+        ids: range,
+        kind: type[User] = User,
+        name_prefix: str = "User_",
+        names: np.ndarray | None = None,
+        addresses: np.ndarray | None = None,
+    ):
+        if (names is not None and len(names) != len(ids)) or (
+            addresses is not None and len(addresses) != len(ids)
+        ):
+            raise ValueError("A population needs one name and address per user")
+
+        self.ledger = ledger
+        self.ids = ids
+        self.kind = kind
+        self.name_prefix = name_prefix
+        self.names = names
+        self.addresses = addresses
+
+        self._users: dict[int, User] = {}
+
+    def __repr__(self) -> str:
+        return f"Population(kind={self.kind.__name__}, size={len(self)}, created={len(self._users)})"
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        index = self._index(index)
+        user = self._users.get(index)
+        if user is None:
+            user = self._users[index] = self._create(index)
+
+        return user
+
+    def __iter__(self) -> Iterator[User]:
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def user_ids(self) -> np.ndarray:
+        """
+        Returns the IDs of the users, without creating them.
+        """
+        return np.arange(self.ids.start, self.ids.stop, dtype=np.int64)
+
+    @property
+    def created(self) -> dict[int, User]:
+        """
+        Returns the users created so far, by index.
+        """
+        return self._users
+
+    def peek(self, index: int) -> User:
+        """
+        Returns the user of an index without keeping it: the user created
+        for the index if there is one, or else a new one that is not cached.
+        Only users whose whole state is in the ledger, unlike block
+        producers, can be handled this way.
+
+        Args:
+            index (int): The index of the user.
+        """
+        index = self._index(index)
+        user = self._users.get(index)
+
+        return self._create(index) if user is None else user
+
+    def get(self, user_id: int) -> User | None:
+        """
+        Returns the user with a user ID, or None if it is not in the
+        population.
+        """
+        if user_id not in self.ids:
+            return None
+
+        return self[user_id - self.ids.start]
+
+    def _index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Population index out of range")
+
+        return index
+
+    def _create(self, index: int) -> User:
+        user_id = self.ids[index]
+        name = (
+            f"{self.name_prefix}{index}"
+            if self.names is None
+            else str(self.names[index])
+        )
+        address = (
+            address_of(user_id)
+            if self.addresses is None
+            else str(self.addresses[index])
+        )
+
+        return self.kind(name, address, self.ledger, user_id)
+
+
+def address_of(user_id: int) -> str:
+    """
+    Returns the compact address derived from a user ID.
+    """
+    return f"0x{user_id:x}"
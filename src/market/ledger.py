@@ -0,0 +1,554 @@
+import threading
+from collections.abc import ItemsView, Iterable, Iterator, MutableMapping
+from itertools import compress
+
+import numpy as np
+
+from market.token import Token
+
+
+class Ledger:
+    """
+    Represents a dense balance table shared by a population of users.
+
+    Balances live in a (users x tokens) float array indexed by integer user
+    and token IDs, handed out by the ledger's own registries.
+
+    Every user belongs to a named group, "default" unless assigned, and the
+    ledger keeps each group's per-token holdings up to date as balances
+    change, so a group's total value costs one dot product with the prices.
+
+    Attributes:
+        tokens (list[Token]): The registered tokens, indexed by token ID.
+        token_ids (dict[str, int]): The token ID of each token name.
+        num_users (int): The number of registered users.
+        group_names (list[str]): The registered groups, indexed by group ID.
+        group_ids (dict[str, int]): The group ID of each group name.
+        balances (np.ndarray): The balance of every user in every token.
+        held (np.ndarray): Whether each token is in each user's wallet.
+        groups (np.ndarray): The group ID of every user.
+    """
+
+    def __init__(self, user_capacity: int = 16, token_capacity: int = 4):
+        """
+        Initializes an empty ledger.
+
+        Args:
+            user_capacity (int): The number of user rows to preallocate.
+            token_capacity (int): The number of token columns to preallocate.
+        """
+        self.tokens: list[Token] = []
+        self.token_ids: dict[str, int] = {}
+        self.num_users = 0
+
+        self._balances = np.zeros((max(user_capacity, 1), max(token_capacity, 1)))
+        self._held = np.zeros(self._balances.shape, dtype=bool)
+
+        self.group_names: list[str] = []
+        self.group_ids: dict[str, int] = {}
+        self._groups = np.zeros(self._balances.shape[0], dtype=np.int32)
+        # Rows of per-token holdings, kept as Python floats since single
+        # deposits and withdrawals update them one cell at a time.
+        self._group_totals: list[list[float]] = []
+        self.register_group("default")
+
+        # While journaling, the group holding updates of each thread are
+        # recorded instead of applied. See `start_journal`.
+        self._journal: threading.local | None = None
+
+    @classmethod
+    def from_arrays(
+        cls,
+        tokens: list[Token],
+        balances: np.ndarray,
+        held: np.ndarray,
+        group_names: list[str] | None = None,
+        groups: np.ndarray | None = None,
+        group_totals: np.ndarray | None = None,
+    ) -> "Ledger":
+        """
+        Creates a ledger that adopts existing balance and membership tables
+        without copying them, such as memory-mapped checkpoint arrays.
+
+        Args:
+            tokens (list[Token]): The tokens of the table columns.
+            balances (np.ndarray): The (users x tokens) balance table.
+            held (np.ndarray): The (users x tokens) wallet membership table.
+            group_names (list[str] | None): The group names, indexed by group ID.
+            groups (np.ndarray | None): The group ID of every user, defaulting
+                to the "default" group.
+            group_totals (np.ndarray | None): The (groups x tokens) group
+                holdings, recomputed from the balances when not given.
+
+        Returns:
+            Ledger: The ledger.
+        """
+        ledger = cls(user_capacity=1, token_capacity=len(tokens))
+
+        for token in tokens:
+            ledger.register_token(token)
+        for name in group_names or []:
+            ledger.register_group(name)
+
+        # The tables are adopted as they are: registering the users first
+        # would allocate zeroed tables of the same size only to drop them.
+        if balances.size:
+            ledger._balances = balances
+            ledger._held = held
+            ledger._groups = np.zeros(len(balances), dtype=np.int32)
+            ledger.num_users = len(balances)
+        else:
+            ledger.register_users(len(balances))
+
+        if groups is not None:
+            ledger._groups[: len(groups)] = groups
+
+        if group_totals is None:
+            ledger._refresh_group_totals()
+        else:
+            for row, totals in zip(ledger._group_totals, group_totals.tolist()):
+                row[: len(totals)] = totals
+
+        return ledger
+
+    @property
+    def balances(self) -> np.ndarray:
+        """
+        Returns the balance table of the registered users and tokens.
+        """
+        return self._balances[: self.num_users, : len(self.tokens)]
+
+    @property
+    def held(self) -> np.ndarray:
+        """
+        Returns the wallet membership table of the registered users and tokens.
+        """
+        return self._held[: self.num_users, : len(self.tokens)]
+
+    @property
+    def groups(self) -> np.ndarray:
+        """
+        Returns the group ID of every registered user.
+        """
+        return self._groups[: self.num_users]
+
+    @property
+    def group_totals(self) -> np.ndarray:
+        """
+        Returns the holdings of every group in every registered token.
+        """
+        num_tokens = len(self.tokens)
+
+        return np.array(
+            [row[:num_tokens] for row in self._group_totals], dtype=float
+        ).reshape(len(self._group_totals), num_tokens)
+
+    @property
+    def prices(self) -> np.ndarray:
+        """
+        Returns the current value of every registered token.
+        """
+        return np.fromiter(
+            (token.value for token in self.tokens), dtype=float, count=len(self.tokens)
+        )
+
+    def register_token(self, token: Token) -> int:
+        """
+        Registers a token, or returns its ID if it is already registered.
+
+        Args:
+            token (Token): The token to register.
+
+        Returns:
+            int: The ID of the token.
+        """
+        token_id = self.token_ids.get(token.name)
+        if token_id is not None:
+            return token_id
+
+        token_id = len(self.tokens)
+        if token_id == self._balances.shape[1]:
+            self._resize(self._balances.shape[0], token_id * 2)
+
+        self.tokens.append(token)
+        self.token_ids[token.name] = token_id
+
+        return token_id
+
+    def register_users(self, num: int) -> range:
+        """
+        Allocates rows for new users.
+
+        Args:
+            num (int): The number of users to register.
+
+        Returns:
+            range: The IDs of the new users.
+        """
+        start = self.num_users
+        if start + num > self._balances.shape[0]:
+            self._resize(max(start + num, start * 2), self._balances.shape[1])
+
+        self.num_users += num
+
+        return range(start, self.num_users)
+
+    def register_user(self) -> int:
+        """
+        Allocates a row for a new user.
+
+        Returns:
+            int: The ID of the new user.
+        """
+        return self.register_users(1).start
+
+    def register_group(self, name: str) -> int:
+        """
+        Registers a group of users, or returns its ID if it is already registered.
+
+        Args:
+            name (str): The name of the group.
+
+        Returns:
+            int: The ID of the group.
+        """
+        group_id = self.group_ids.get(name)
+        if group_id is not None:
+            return group_id
+
+        group_id = len(self.group_names)
+        self.group_names.append(name)
+        self.group_ids[name] = group_id
+        self._group_totals.append([0.0] * self._balances.shape[1])
+
+        return group_id
+
+    def assign_group(self, user_ids: np.ndarray | list[int] | range, name: str) -> None:
+        """
+        Moves users to a group, registering the group if needed.
+
+        Args:
+            user_ids (np.ndarray | list[int] | range): The IDs of the users.
+            name (str): The name of the group.
+        """
+        group_id = self.register_group(name)
+        if isinstance(user_ids, range) and user_ids.step == 1:
+            rows = slice(user_ids.start, user_ids.stop)
+        else:
+            user_ids = rows = np.unique(np.asarray(user_ids, dtype=np.int64))
+
+        balances = self._balances[rows]
+        self._add_to_group_totals(self._groups[rows], -balances)
+        self._groups[rows] = group_id
+        self._add_to_group_totals(np.full(len(user_ids), group_id), balances)
+
+    def group_holdings(self, name: str) -> np.ndarray:
+        """
+        Returns the total balance of every registered token held by a group.
+
+        Args:
+            name (str): The name of the group.
+        """
+        group_id = self.group_ids.get(name)
+        if group_id is None:
+            return np.zeros(len(self.tokens))
+
+        return np.array(self._group_totals[group_id][: len(self.tokens)])
+
+    def group_value(self, name: str) -> float:
+        """
+        Returns the total value held by a group at the current token prices.
+
+        Args:
+            name (str): The name of the group.
+        """
+        return float(self.group_holdings(name) @ self.prices)
+
+    def write_cells(
+        self, cells: np.ndarray, balances: np.ndarray, held: np.ndarray
+    ) -> None:
+        """
+        Overwrites a set of (user, token) cells in bulk, keeping the group
+        holdings in step.
+
+        Args:
+            cells (np.ndarray): The distinct flat indices of the cells into
+                the ledger arrays, as `user_id * token_capacity + token_id`.
+            balances (np.ndarray): The new balance of each cell.
+            held (np.ndarray): The new wallet membership of each cell.
+        """
+        ledger_balances = self._balances.reshape(-1)
+        num_tokens = self._balances.shape[1]
+
+        self._add_to_group_totals(
+            self._groups[cells // num_tokens],
+            balances - ledger_balances[cells],
+            cells % num_tokens,
+        )
+
+        ledger_balances[cells] = balances
+        self._held.reshape(-1)[cells] = held
+
+    def deposit(self, user_id: int, token: Token, amount: float) -> None:
+        """
+        Adds an amount of a token to a user's balance.
+
+        Args:
+            user_id (int): The ID of the user.
+            token (Token): The token to add.
+            amount (float): The amount of the token to add.
+        """
+        if amount < 0:
+            raise ValueError("Amount must be positive")
+
+        token_id = self.register_token(token)
+
+        balance = self._balances[user_id, token_id]
+        if not self._held[user_id, token_id]:
+            self._held[user_id, token_id] = True
+            self._add_to_group_total(self._groups[user_id], token_id, -float(balance))
+            balance = 0.0
+
+        self._balances[user_id, token_id] = balance + amount
+        self._add_to_group_total(self._groups[user_id], token_id, amount)
+
+    def deposit_many(
+        self, user_ids: range | np.ndarray, token: Token, amounts: float | np.ndarray
+    ) -> None:
+        """
+        Adds amounts of a token to the balances of many users at once, as
+        `deposit` would one by one.
+
+        Args:
+            user_ids (range | np.ndarray): The distinct IDs of the users.
+            token (Token): The token to add.
+            amounts (float | np.ndarray): The amount of the token to add to
+                every user, or to each user.
+        """
+        amounts = np.broadcast_to(np.asarray(amounts, dtype=float), (len(user_ids),))
+        if (amounts < 0).any():
+            raise ValueError("Amount must be positive")
+
+        token_id = self.register_token(token)
+        if isinstance(user_ids, range) and user_ids.step == 1:
+            rows = slice(user_ids.start, user_ids.stop)
+        else:
+            rows = np.asarray(user_ids, dtype=np.int64)
+
+        held = self._held[rows, token_id]
+        balances = np.where(held, self._balances[rows, token_id], 0.0) + amounts
+        self._add_to_group_totals(
+            self._groups[rows],
+            balances - self._balances[rows, token_id],
+            np.full(len(amounts), token_id),
+        )
+
+        self._balances[rows, token_id] = balances
+        self._held[rows, token_id] = True
+
+    def withdraw(self, user_id: int, token: Token, amount: float) -> None:
+        """
+        Removes an amount of a token from a user's balance.
+
+        Args:
+            user_id (int): The ID of the user.
+            token (Token): The token to remove.
+            amount (float): The amount of the token to remove.
+        """
+        if amount < 0:
+            raise ValueError("Amount must be positive")
+
+        token_id = self.token_ids.get(token.name)
+        if token_id is None or not self._held[user_id, token_id]:
+            raise ValueError("Token not in wallet")
+
+        balance = self._balances[user_id, token_id]
+        if balance < amount:
+            raise ValueError("Insufficient funds")
+
+        balance -= amount
+        self._balances[user_id, token_id] = balance
+        self._add_to_group_total(self._groups[user_id], token_id, -amount)
+
+        if balance == 0:
+            self._held[user_id, token_id] = False
+
+    def start_journal(self) -> None:
+        """
+        Starts recording the group holding updates of deposits, withdrawals
+        and bulk cell writes instead of applying them, so transactions can
+        run on several threads and their updates still be summed in a fixed
+        order.
+
+        Each thread records into the list given to `journal_to`.
+        """
+        self._journal = threading.local()
+
+    def journal_to(self, entries: list) -> None:
+        """
+        Sets the list the calling thread records its updates into.
+        """
+        self._journal.entries = entries
+
+    def stop_journal(self, journals: Iterable[list] = ()) -> None:
+        """
+        Stops journaling and applies recorded updates.
+
+        Args:
+            journals (Iterable[list]): The recorded updates to apply, in the
+                order to apply them. Updates left out are discarded.
+        """
+        self._journal = None
+
+        group_totals = self._group_totals
+        for entries in journals:
+            for group_id, token_id, amount in entries:
+                group_totals[group_id][token_id] += amount
+
+    def total_value(self, user_ids: np.ndarray | list[int] | None = None) -> float:
+        """
+        Returns the total value held by a group of users.
+
+        Args:
+            user_ids (np.ndarray | list[int] | None): The IDs of the users,
+                or None for every registered user.
+        """
+        balances = self.balances if user_ids is None else self.balances[user_ids]
+
+        return float(balances.sum(axis=0) @ self.prices)
+
+    def _resize(self, user_capacity: int, token_capacity: int) -> None:
+        balances = np.zeros((user_capacity, token_capacity))
+        held = np.zeros((user_capacity, token_capacity), dtype=bool)
+        groups = np.zeros(user_capacity, dtype=np.int32)
+
+        rows, cols = self._balances.shape
+        balances[:rows, :cols] = self._balances
+        held[:rows, :cols] = self._held
+        groups[:rows] = self._groups
+
+        for row in self._group_totals:
+            row.extend([0.0] * (token_capacity - cols))
+
+        self._balances = balances
+        self._held = held
+        self._groups = groups
+
+    def _add_to_group_total(self, group_id: int, token_id: int, amount: float) -> None:
+        if self._journal is None:
+            self._group_totals[group_id][token_id] += amount
+        else:
+            self._journal.entries.append((group_id, token_id, amount))
+
+    def _add_to_group_totals(
+        self,
+        group_ids: np.ndarray,
+        amounts: np.ndarray,
+        token_ids: np.ndarray | None = None,
+    ) -> None:
+        """
+        Adds amounts to the group holdings, summed per (group, token) first.
+
+        Args:
+            group_ids (np.ndarray): The group of each amount.
+            amounts (np.ndarray): The amounts, or rows of amounts per token
+                when `token_ids` is None.
+            token_ids (np.ndarray | None): The token of each amount.
+        """
+        num_tokens = self._balances.shape[1]
+        if token_ids is None:
+            group_ids = np.repeat(group_ids, amounts.shape[1])
+            token_ids = np.tile(np.arange(amounts.shape[1]), len(amounts))
+
+        keys = np.asarray(group_ids, dtype=np.int64) * num_tokens + token_ids
+        sums = np.bincount(keys, weights=np.ravel(amounts)).tolist()
+
+        for key in np.flatnonzero(sums).tolist():
+            self._add_to_group_total(key // num_tokens, key % num_tokens, sums[key])
+
+    def _refresh_group_totals(self) -> None:
+        """
+        Recomputes the group holdings from the balance table.
+        """
+        for row in self._group_totals:
+            row[:] = [0.0] * len(row)
+
+        self._add_to_group_totals(
+            self._groups[: self.num_users], self._balances[: self.num_users]
+        )
+
+
+class Wallet(MutableMapping):
+    """
+    Represents a user's wallet as a view over a row of a `Ledger`.
+
+    Only tokens that are in the wallet are visible, so a wallet behaves like
+    the `dict[Token, float]` it replaces.
+    """
+
+    __slots__ = ("ledger", "user_id")
+
+    def __init__(self, ledger: Ledger, user_id: int):
+        self.ledger = ledger
+        self.user_id = user_id
+
+    def __getitem__(self, token: Token) -> float:
+        token_id = self.ledger.token_ids.get(token.name)
+        if token_id is None or not self.ledger._held[self.user_id, token_id]:
+            raise KeyError(token)
+
+        return float(self.ledger._balances[self.user_id, token_id])
+
+    def __setitem__(self, token: Token, amount: float) -> None:
+        ledger = self.ledger
+        token_id = ledger.register_token(token)
+        group_id = ledger._groups[self.user_id]
+
+        ledger._group_totals[group_id][token_id] += amount - float(
+            ledger._balances[self.user_id, token_id]
+        )
+        ledger._held[self.user_id, token_id] = True
+        ledger._balances[self.user_id, token_id] = amount
+
+    def __delitem__(self, token: Token) -> None:
+        token_id = self.ledger.token_ids.get(token.name)
+        if token_id is None or not self.ledger._held[self.user_id, token_id]:
+            raise KeyError(token)
+
+        ledger = self.ledger
+        ledger._group_totals[ledger._groups[self.user_id]][token_id] -= float(
+            ledger._balances[self.user_id, token_id]
+        )
+        ledger._held[self.user_id, token_id] = False
+        ledger._balances[self.user_id, token_id] = 0.0
+
+    def __iter__(self) -> Iterator[Token]:
+        tokens = self.ledger.tokens
+        return compress(tokens, self.ledger._held[self.user_id, : len(tokens)].tolist())
+
+    def __len__(self) -> int:
+        tokens = self.ledger.tokens
+        return self.ledger._held[self.user_id, : len(tokens)].tolist().count(True)
+
+    def items(self) -> "WalletItems":
+        return WalletItems(self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+
+class WalletItems(ItemsView):
+    """
+    Represents the (token, amount) pairs of a `Wallet`, read row-wise from
+    its ledger.
+    """
+
+    def __iter__(self) -> Iterator[tuple[Token, float]]:
+        wallet: Wallet = self._mapping  # type: ignore
+        ledger, user_id = wallet.ledger, wallet.user_id
+        num_tokens = len(ledger.tokens)
+
+        held = ledger._held[user_id, :num_tokens].tolist()
+        balances = ledger._balances[user_id, :num_tokens].tolist()
+
+        return compress(zip(ledger.tokens, balances), held)
@@ -1 +1,6 @@
-from simulation.create_env import create_env_from_yaml
+from simulation.create_env import create_env_from_yaml, load_scenario
+from simulation.monte_carlo import MonteCarloRunner, Scenario, summarize
+from simulation.replay import ReplaySource, convert_csv
+from simulation.replica import ReplicaSimulator
+from simulation.runtime import AgentSession, AsyncAgentRuntime, Observation, RoundStats
+from simulation.scheduler import ArrivalProcess, EventScheduler
@@ -34,4 +34,9 @@ class BlockProducerAgent:
         #     )
         #     user.send_transaction(transaction=transaction, blockchain=blockchain)
 
-        blockchain.create_block()
+        # Producers take turns, so the gas fees are shared without drawing
+        # from the random stream.
+        block_producer = (
+            user_list[blockchain.block_number % len(user_list)] if user_list else None
+        )
+        blockchain.create_block(block_producer)
@@ -1,7 +1,7 @@
 import math
 import random
 
-from contracts.contract import Contract
+from contracts.amm_protocol import AmmProtocol
 from core.blockchain import Blockchain
 from core.transaction import Transaction
 from market.actors.user import User
@@ -10,96 +10,111 @@ from market.actors.user import User
 class LiquidityProviderAgent:
     """
     This class represents a liquidity provider agent.
+
+    Each provider keeps a part of the value it holds in a pool's two tokens
+    deposited in the pool, a smaller part the further the pool's price is from
+    the market price and a larger part the more fees its position has earned
+    relative to its value. Positions and their fees are valued from the
+    pool's share accounting and per-share fee accumulators, so an action
+    costs the same whatever the number of providers.
     """
 
     @staticmethod
     def simulate_lp_actions(
-        user_list: list[User], contract: Contract, blockchain: Blockchain
+        user_list: list[User],
+        contract: AmmProtocol,
+        blockchain: Blockchain,
+        target_share: float = 0.2,
+        threshold: float = 0.05,
+        gas_fee: float | None = None,
     ):
         """
         Simulates liquidity provider actions.
 
         Args:
-            user_list (list[User]): List of users.
-            contract (Contract): Contract object.
+            user_list (list[User]): List of liquidity providers.
+            contract (AmmProtocol): The contract whose pools are provided.
             blockchain (Blockchain): Blockchain object.
+            target_share (float): The part of its pair value a provider
+                deposits when the pool is at the market price.
+            threshold (float): The smallest change of position, as a part of
+                the pair value, worth a transaction.
+            gas_fee (float | None): The gas fee of every transaction.
         """
+        pools = [pool for pool in contract.get_pools() if pool.lp_token is not None]
+        if not pools:
+            return
+
         for user in user_list:
-            # Select tokens from the pool
-            token1, token2 = random.sample(blockchain.pool.tokens, 2)
+            pool = random.choice(pools)
+            (token_1, reserve_1), (token_2, reserve_2) = pool.token_reserve.items()
+            if (
+                reserve_1 <= 0
+                or reserve_2 <= 0
+                or token_1.value <= 0
+                or token_2.value <= 0
+            ):
+                continue
 
             # Calculate pool ratio and market ratio
-            pool_ratio = blockchain.get_spot_price(token1, token2)
-            market_ratio = token2.real_value / token1.real_value
+            pool_ratio = reserve_2 / reserve_1
+            market_ratio = token_1.value / token_2.value
 
             # Calculate LP strategy
             lp_discourage = abs(math.log(pool_ratio) - math.log(market_ratio))
-            lp_volume = (1 - lp_discourage) * user.total_value() * 0.2
-            lp_amount = lp_volume / blockchain.pool.pool_token.real_value
+            balance_1 = user.wallet.get(token_1, 0.0)
+            balance_2 = user.wallet.get(token_2, 0.0)
+            position_value = pool.position_value(user.address)
+            pair_value = (
+                position_value + balance_1 * token_1.value + balance_2 * token_2.value
+            )
+
+            # The fees earned make up for part of the divergence.
+            fee_yield = 0.0
+            if position_value > 0:
+                fees = pool.fees_earned(user.address)
+                fee_yield = (
+                    sum(amount * token.value for token, amount in fees.items())
+                    / position_value
+                )
+            target_value = (
+                max(0.0, 1 - lp_discourage + fee_yield) * target_share * pair_value
+            )
+
+            difference = target_value - position_value
+            if abs(difference) <= threshold * pair_value:
+                continue
 
             # Adjust investment
-            if lp_amount < 0:
-                lp_amount = min(
-                    -lp_amount, user.get_quantity(blockchain.pool.pool_token)
+            if difference > 0:
+                amount_1 = min(balance_1, difference / 2 / token_1.value)
+                amount_2 = min(balance_2, difference / 2 / token_2.value)
+                if amount_1 <= 0 or amount_2 <= 0:
+                    continue
+
+                transaction = Transaction(
+                    user,
+                    contract,
+                    "add_liquidity",
+                    {
+                        "token_1": token_1,
+                        "token_2": token_2,
+                        "amount_1": amount_1,
+                        "amount_2": amount_2,
+                    },
+                    gas_fee,
                 )
-                if lp_amount > 0:
-                    transaction = Transaction(
-                        user, contract, "withdraw", {"amount": lp_amount}
-                    )
-                    user.send_transaction(transaction, blockchain)
             else:
-                # Calculate needed budget and providing quantities
-                needed_budget = 0
-                providing_quantities = {}
-                for token in blockchain.tokens.values():
-                    if token != token1:
-                        needed_quantity = (
-                            blockchain.pool.get_quantity(token)
-                            / blockchain.pool.total_pool_token_quantity
-                            * lp_amount
-                        )
-                        active_quantity = user.get_quantity(token)
-                        if active_quantity > needed_quantity:
-                            transaction = Transaction(
-                                user,
-                                contract,
-                                "sell",
-                                {
-                                    "token": token,
-                                    "amount": active_quantity - needed_quantity,
-                                },
-                            )
-                            user.send_transaction(transaction, blockchain)
-                        else:
-                            needed_budget += (
-                                needed_quantity - active_quantity
-                            ) * token.real_value
-
-                # Adjust LP based on budget
-                if user.budget < needed_budget:
-                    lp_amount = lp_amount / needed_budget * user.budget * 0.9
+                shares = min(
+                    pool.lp_positions[user.address].shares,
+                    -difference / pool.share_value,
+                )
+                transaction = Transaction(
+                    user,
+                    contract,
+                    "remove_liquidity",
+                    {"token_1": token_1, "token_2": token_2, "shares": shares},
+                    gas_fee,
+                )
 
-                if lp_amount > 0.01:
-                    for token, quantity in blockchain.pool.quantities.items():
-                        needed_quantity = (
-                            quantity
-                            * lp_amount
-                            / blockchain.pool.total_pool_token_quantity
-                        )
-                        active_quantity = user.get_quantity(token)
-                        if active_quantity < needed_quantity:
-                            transaction = Transaction(
-                                user,
-                                contract,
-                                "buy",
-                                {
-                                    "token": token,
-                                    "amount": needed_quantity - active_quantity,
-                                },
-                            )
-                            user.send_transaction(transaction, blockchain)
-                        providing_quantities[token] = needed_quantity
-                    transaction = Transaction(
-                        user, contract, "provide", {"quantities": providing_quantities}
-                    )
-                    user.send_transaction(transaction, blockchain)
+            user.send_transaction(transaction, blockchain)
@@ -1,18 +1,37 @@
+import gc
 import random
 
+import numpy as np
+
 from contracts.contract import Contract
 from core.blockchain import Blockchain
-from core.transaction import Transaction
-from market.actors.user import User
+from core.transaction import CompiledTransaction
+from market.actors.user import Population, User
+from simulation.runtime import AgentSession
 
 
 class UserAgent:
     @staticmethod
     def simulate_user_actions(
-        user_list: list[User], contract: Contract, blockchain: Blockchain
+        user_list: list[User] | Population,
+        contract: Contract,
+        blockchain: Blockchain,
+        gas_fee: float | None = None,
     ):
-        random.shuffle(user_list)
-        for user in user_list:
+        swap = contract.opcode("swap")
+
+        # A population keeps its order: its indices are shuffled instead,
+        # which draws the same order, and each user is created only to act
+        # and is not kept, so a block does not materialize the population.
+        if isinstance(user_list, Population):
+            order = list(range(len(user_list)))
+            random.shuffle(order)
+            users = map(user_list.peek, order)
+        else:
+            random.shuffle(user_list)
+            users = user_list
+
+        for user in users:
             token_in, token_in_balance = random.choice(list(user.wallet.items()))
             amount_in = token_in_balance * random.uniform(0.01, 1.0)
 
@@ -24,14 +43,134 @@ class UserAgent:
             if not token_out:
                 continue
 
-            transaction = Transaction(
-                sender=user,
-                contract=contract,
-                function="swap",
-                args={
-                    "token_in": token_in,
-                    "amount_in": amount_in,
-                    "token_out": token_out,
-                },
+            transaction = CompiledTransaction(
+                user, contract, swap, (token_in, token_out, amount_in), gas_fee
             )
             user.send_transaction(transaction=transaction, blockchain=blockchain)
+
+    @staticmethod
+    def simulate_population_actions(
+        user_list: list[User] | Population,
+        contract: Contract,
+        blockchain: Blockchain,
+        rng: np.random.Generator,
+        gas_fee: float | None = None,
+    ):
+        """
+        Simulates the same actions as `simulate_user_actions` for the whole
+        population at once.
+
+        The order of the users, the token each sells, the part of its balance
+        sold and the token bought are drawn as arrays over the ledger's
+        balance table, and the swaps are added to the mempool in one batch.
+        The draws come from `rng` rather than the `random` module, and
+        `user_list` is left in its order.
+
+        Args:
+            user_list (list[User] | Population): List of users. Only the
+                users of a population that swap are created.
+            contract (Contract): Contract object.
+            blockchain (Blockchain): Blockchain object.
+            rng (np.random.Generator): The random generator to draw from.
+            gas_fee (float | None): The gas fee of every swap.
+        """
+        if not user_list:
+            return
+
+        ledger = blockchain.ledger
+        tokens = ledger.tokens
+        chain_ids = np.array(
+            sorted(ledger.token_ids[name] for name in blockchain.tokens), dtype=int
+        )
+        if not len(chain_ids):
+            return
+
+        order = rng.permutation(len(user_list))
+        if isinstance(user_list, Population):
+            user_ids = user_list.user_ids[order]
+        else:
+            user_ids = np.fromiter(
+                (user.user_id for user in user_list), dtype=int, count=len(user_list)
+            )[order]
+        held = ledger.held[user_ids]
+        balances = ledger.balances[user_ids]
+
+        # Each user sells one of the tokens in its wallet, drawn uniformly.
+        num_held = held.sum(axis=1)
+        picks = (rng.random(len(user_ids)) * num_held).astype(int)
+        token_in = np.argmax(np.cumsum(held, axis=1) > picks[:, None], axis=1)
+        amount_in = balances[np.arange(len(user_ids)), token_in] * rng.uniform(
+            0.01, 1.0, len(user_ids)
+        )
+
+        # ... for one of the blockchain's other tokens, drawn uniformly.
+        position = np.searchsorted(chain_ids, token_in)
+        is_chain_token = (position < len(chain_ids)) & (
+            chain_ids[np.minimum(position, len(chain_ids) - 1)] == token_in
+        )
+        num_choices = len(chain_ids) - is_chain_token
+        choices = (rng.random(len(user_ids)) * num_choices).astype(int)
+        choices += is_chain_token & (choices >= position)
+        active = (num_held > 0) & (num_choices > 0)
+        token_out = chain_ids[np.minimum(choices, len(chain_ids) - 1)]
+
+        swap = contract.opcode("swap")
+
+        # Allocating a transaction per user would otherwise trigger repeated
+        # full collections that find nothing to free.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            blockchain.add_transactions(
+                [
+                    CompiledTransaction(
+                        user_list[index],
+                        contract,
+                        swap,
+                        (tokens[token_1], tokens[token_2], amount),
+                        gas_fee,
+                    )
+                    for index, token_1, token_2, amount in zip(
+                        order[active].tolist(),
+                        token_in[active].tolist(),
+                        token_out[active].tolist(),
+                        amount_in[active].tolist(),
+                    )
+                ]
+            )
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    @staticmethod
+    async def act(session: AgentSession, contract: Contract):
+        """
+        Submits the swap `simulate_user_actions` draws for one user, as a
+        strategy of the `AsyncAgentRuntime`.
+
+        Args:
+            session (AgentSession): The session of the user's agent.
+            contract (Contract): Contract object.
+        """
+        user = session.user
+        if not len(user.wallet):
+            return
+
+        token_in, token_in_balance = random.choice(list(user.wallet.items()))
+        amount_in = token_in_balance * random.uniform(0.01, 1.0)
+
+        other_tokens = [
+            token for token in session.blockchain.tokens.values() if token != token_in
+        ]
+        if not other_tokens:
+            return
+
+        token_out = random.choice(other_tokens)
+        await session.send_transaction(
+            CompiledTransaction(
+                user,
+                contract,
+                contract.opcode("swap"),
+                (token_in, token_out, amount_in),
+            )
+        )
@@ -1,41 +1,492 @@
+import csv
+import gc
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterator
+
+import numpy as np
 import yaml
 
+from contracts.amm_protocol import AmmProtocol
 from contracts.uniswap_v2 import UniswapV2
+from contracts.uniswap_v3 import UniswapV3
 from core.blockchain import Blockchain
+from market.actors.user import User, address_of
+
+CONTRACTS: dict[str, type[AmmProtocol]] = {
+    "UniswapV2": UniswapV2,
+    "UniswapV3": UniswapV3,
+}
+
+# The libyaml parser when PyYAML was built with it, which is many times
+# faster than the pure-Python one.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+SCENARIO_CACHE_VERSION = 1
+
+# How many times a loader tries to store its entry while other processes keep
+# replacing it, before it uses its own parse without caching it.
+RENAME_ATTEMPTS = 3
+
+CHUNK_SIZE = 65536
+
+
+@dataclass
+class ScenarioSpec:
+    """
+    Represents a parsed scenario file, before a blockchain is built from it.
+
+    Attributes:
+        tokens (list[tuple[str, float]]): The name and value of every token.
+        contracts (list[dict]): The type, name and pools of every contract,
+            each pool as `[token_1, token_2, fee, reserve_1, reserve_2]`.
+        user_names (np.ndarray): The name of every user.
+        user_balances (np.ndarray): The (users x tokens) initial balances,
+            NaN where a token is not in the user's wallet.
+    """
+
+    tokens: list[tuple[str, float]]
+    contracts: list[dict]
+    user_names: np.ndarray
+    user_balances: np.ndarray
+
+
+def create_env_from_yaml(
+    yaml_file: str,
+    cache_dir: str | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    engine: str = "sequential",
+) -> Blockchain:
+    """
+    Creates a blockchain from a scenario file.
+
+    The scenario lists `tokens`, `users` and `contracts`. Every user entry
+    is either a user with its `tokens`, or a `file` of users next to the
+    scenario: a CSV with a `name` column and one balance column per token,
+    an NDJSON file of user entries, or a (users x tokens) `.npy` balance
+    table whose columns are listed in the entry's `tokens`. A contract is
+    created with the type `type`, defaulting to its `name`, and its `pools`
+    are positional `[token, token, fee]` triples or mappings of `tokens`,
+    `amounts` and `fee`.
+
+    Args:
+        yaml_file (str): The scenario file.
+        cache_dir (str | None): The directory of parsed scenarios, keyed by
+            the hash of the scenario and user files, or None to parse the
+            scenario every time.
+        chunk_size (int): The number of users read at a time from files.
+        engine (str): The execution engine of the blockchain.
+
+    Returns:
+        Blockchain: The blockchain.
+    """
+    return build_blockchain(load_scenario(yaml_file, cache_dir, chunk_size), engine)
+
+
+def load_scenario(
+    yaml_file: str, cache_dir: str | None = None, chunk_size: int = CHUNK_SIZE
+) -> ScenarioSpec:
+    """
+    Parses a scenario file, or reads it from the cache if it was parsed
+    before with the same contents.
+
+    Cached scenarios are keyed by the hash of the scenario file and record
+    the hashes of its user files, so a hit skips parsing the YAML and a
+    changed user file is parsed again. Processes may load the same scenario
+    into a cold cache at once: one of them stores it and the others use its
+    entry.
+
+    Args:
+        yaml_file (str): The scenario file.
+        cache_dir (str | None): The directory of parsed scenarios, or None
+            not to cache.
+        chunk_size (int): The number of users read at a time from files.
+
+    Returns:
+        ScenarioSpec: The parsed scenario.
+    """
+    base_dir = os.path.dirname(yaml_file)
+    with open(yaml_file, "rb") as file:
+        source = file.read()
+
+    if cache_dir is None:
+        return parse_scenario(
+            yaml.load(source, Loader=YAML_LOADER), base_dir, chunk_size
+        )
 
+    path = os.path.join(
+        cache_dir,
+        f"v{SCENARIO_CACHE_VERSION}-{hashlib.sha256(source).hexdigest()[:32]}",
+    )
+    cached = _read_valid_cache(path, base_dir)
+    if cached is not None:
+        return cached
 
-def create_env_from_yaml(yaml_file: str) -> Blockchain:
-    # Read YAML file
-    with open(yaml_file, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file)
+    data = yaml.load(source, Loader=YAML_LOADER)
+    spec = parse_scenario(data, base_dir, chunk_size)
+    stored = _write_cache(
+        spec,
+        path,
+        {
+            name: _file_digest(os.path.join(base_dir, name))
+            for name in _user_files(data)
+        },
+    )
+    if not stored:
+        # Another process stored the scenario first.
+        cached = _read_valid_cache(path, base_dir)
+        if cached is not None:
+            return cached
 
-    # Create blockchain
-    blockchain = Blockchain()
+    return spec
 
-    # Create tokens
-    for token_info in data["tokens"]:
-        blockchain.create_token(name=token_info["name"], value=token_info["value"])
 
-    # Create users
-    for user_info in data["users"]:
-        user = blockchain.create_user(user_info["name"])
-        for token_info in user_info["tokens"]:
-            user.add_to_wallet(
-                blockchain.tokens[token_info["name"]], token_info["amount"]
+def parse_scenario(
+    data: dict, base_dir: str = ".", chunk_size: int = CHUNK_SIZE
+) -> ScenarioSpec:
+    """
+    Parses the contents of a scenario file.
+
+    Args:
+        data (dict): The loaded scenario.
+        base_dir (str): The directory user files are relative to.
+        chunk_size (int): The number of users read at a time from files.
+
+    Returns:
+        ScenarioSpec: The parsed scenario.
+    """
+    tokens = [(info["name"], info["value"]) for info in data["tokens"]]
+    token_ids = {name: token_id for token_id, (name, _) in enumerate(tokens)}
+
+    names: list[np.ndarray] = []
+    balances: list[np.ndarray] = []
+    inline: list[dict] = []
+
+    def flush_inline():
+        if inline:
+            names.append(np.array([info["name"] for info in inline], dtype=str))
+            balances.append(_entry_balances(inline, token_ids))
+            inline.clear()
+
+    for user_info in data.get("users") or []:
+        if "file" not in user_info:
+            inline.append(user_info)
+            continue
+
+        flush_inline()
+        for chunk_names, chunk_balances in _read_user_file(
+            os.path.join(base_dir, user_info["file"]),
+            user_info.get("tokens"),
+            token_ids,
+            chunk_size,
+        ):
+            names.append(chunk_names)
+            balances.append(chunk_balances)
+    flush_inline()
+
+    contracts = []
+    for contract_info in data.get("contracts") or []:
+        # `pools` describes a single pool, or is a list of pools
+        pools_info = contract_info.get("pools") or []
+        if pools_info and isinstance(pools_info[0], dict) and "name" in pools_info[0]:
+            pools_info = [pools_info]
+
+        contracts.append(
+            {
+                "type": contract_info.get("type", contract_info["name"]),
+                "name": contract_info["name"],
+                "pools": [_parse_pool(pool_info) for pool_info in pools_info],
+            }
+        )
+
+    return ScenarioSpec(
+        tokens,
+        contracts,
+        np.concatenate(names) if names else np.array([], dtype=str),
+        (
+            np.concatenate(balances)
+            if balances
+            else np.empty((0, len(tokens)), dtype=float)
+        ),
+    )
+
+
+def build_blockchain(spec: ScenarioSpec, engine: str = "sequential") -> Blockchain:
+    """
+    Creates the blockchain of a parsed scenario.
+
+    Users are registered in the ledger together and their balances written
+    one token at a time. Their addresses are derived from their user IDs.
+
+    Args:
+        spec (ScenarioSpec): The parsed scenario.
+        engine (str): The execution engine of the blockchain.
+
+    Returns:
+        Blockchain: The blockchain.
+    """
+    blockchain = Blockchain(engine=engine)
+    ledger = blockchain.ledger
+
+    tokens = [blockchain.create_token(name, value) for name, value in spec.tokens]
+
+    user_ids = ledger.register_users(len(spec.user_names))
+    for token, amounts in zip(tokens, np.asarray(spec.user_balances).T):
+        held = ~np.isnan(amounts)
+        if held.all():
+            ledger.deposit_many(user_ids, token, amounts)
+        elif held.any():
+            ledger.deposit_many(
+                np.arange(user_ids.start, user_ids.stop)[held], token, amounts[held]
             )
 
-    # Create contracts
-    for contract_info in data["contracts"]:
-        if contract_info["name"] == "UniswapV2":
-            uniswap_v2 = UniswapV2()
-            blockchain.create_contract(uniswap_v2)
-            pool_info = contract_info["pools"]
-            uniswap_v2.create_pool(
-                blockchain.tokens[pool_info[0]["name"]],
-                blockchain.tokens[pool_info[1]["name"]],
-                pool_info[2]["fee"],
-                pool_info[0]["amount"],
-                pool_info[1]["amount"],
+    # Creating many users would otherwise trigger repeated full collections
+    # that find nothing to free.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for user_id, name in zip(user_ids, spec.user_names.tolist()):
+            address = address_of(user_id)
+            blockchain.users[address] = User(name, address, ledger, user_id)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    for contract_info in spec.contracts:
+        if contract_info["type"] in CONTRACTS:
+            contract = CONTRACTS[contract_info["type"]](contract_info["name"])
+            blockchain.create_contract(contract)
+            contract.create_pools(
+                (
+                    blockchain.tokens[name_1],
+                    blockchain.tokens[name_2],
+                    fee,
+                    reserve_1,
+                    reserve_2,
+                )
+                for name_1, name_2, fee, reserve_1, reserve_2 in contract_info["pools"]
             )
 
     return blockchain
+
+
+def _parse_pool(pool_info: list | dict) -> list:
+    if isinstance(pool_info, dict):
+        name_1, name_2 = pool_info["tokens"]
+        reserve_1, reserve_2 = pool_info["amounts"]
+        return [name_1, name_2, pool_info["fee"], reserve_1, reserve_2]
+
+    return [
+        pool_info[0]["name"],
+        pool_info[1]["name"],
+        pool_info[2]["fee"],
+        pool_info[0]["amount"],
+        pool_info[1]["amount"],
+    ]
+
+
+def _entry_balances(entries: list[dict], token_ids: dict[str, int]) -> np.ndarray:
+    """
+    Returns the balance table of user entries, each with a `tokens` list of
+    names and amounts.
+    """
+    balances = np.full((len(entries), len(token_ids)), np.nan)
+    for row, info in enumerate(entries):
+        for token_info in info.get("tokens") or []:
+            token_id = token_ids.get(token_info["name"])
+            if token_id is None:
+                raise ValueError(f"Unknown token {token_info['name']!r}")
+            balances[row, token_id] = token_info["amount"]
+
+    return balances
+
+
+def _read_user_file(
+    path: str,
+    columns: list[str] | None,
+    token_ids: dict[str, int],
+    chunk_size: int,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    Yields the names and balance tables of a user file, `chunk_size` users
+    at a time.
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".npy":
+        if columns is None:
+            raise ValueError(f"The token columns of {path} must be listed")
+
+        table = np.load(path, mmap_mode="r")
+        if table.ndim != 2 or table.shape[1] != len(columns):
+            raise ValueError(f"{path} must have a column per listed token")
+
+        positions = _column_positions(columns, token_ids)
+        for start in range(0, len(table), chunk_size):
+            chunk = np.asarray(table[start : start + chunk_size], dtype=float)
+            balances = np.full((len(chunk), len(token_ids)), np.nan)
+            balances[:, positions] = chunk
+            names = np.array(
+                [f"User_{index}" for index in range(start, start + len(chunk))],
+                dtype=str,
+            )
+            yield names, balances
+
+    elif extension in (".ndjson", ".jsonl"):
+        with open(path, "r", encoding="utf-8") as file:
+            lines = (line for line in file if line.strip())
+            while entries := [json.loads(line) for line in islice(lines, chunk_size)]:
+                names = np.array([info["name"] for info in entries], dtype=str)
+                yield names, _entry_balances(entries, token_ids)
+
+    elif extension == ".csv":
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            if header[0] != "name":
+                raise ValueError(f"The first column of {path} must be `name`")
+
+            positions = _column_positions(header[1:], token_ids)
+            rows = (row for row in reader if row)
+            while chunk := list(islice(rows, chunk_size)):
+                cells = np.array([row[1:] for row in chunk], dtype=str)
+                balances = np.full((len(chunk), len(token_ids)), np.nan)
+                balances[:, positions] = np.where(cells == "", "nan", cells).astype(
+                    float
+                )
+                yield np.array([row[0] for row in chunk], dtype=str), balances
+
+    else:
+        raise ValueError(f"Unsupported user file {path}")
+
+
+def _column_positions(columns: list[str], token_ids: dict[str, int]) -> list[int]:
+    unknown = [name for name in columns if name not in token_ids]
+    if unknown:
+        raise ValueError(f"Unknown tokens {unknown}")
+
+    return [token_ids[name] for name in columns]
+
+
+def _user_files(data: dict) -> list[str]:
+    return [
+        user_info["file"]
+        for user_info in data.get("users") or []
+        if "file" in user_info
+    ]
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _read_cache(path: str) -> tuple[ScenarioSpec, dict[str, str]]:
+    with open(os.path.join(path, "scenario.json"), "r", encoding="utf-8") as file:
+        meta = json.load(file)
+
+    spec = ScenarioSpec(
+        [tuple(token) for token in meta["tokens"]],
+        meta["contracts"],
+        np.load(os.path.join(path, "user_names.npy")),
+        np.load(os.path.join(path, "user_balances.npy"), mmap_mode="r"),
+    )
+
+    return spec, meta["user_files"]
+
+
+def _read_valid_cache(path: str, base_dir: str) -> ScenarioSpec | None:
+    try:
+        spec, user_files = _read_cache(path)
+    except FileNotFoundError:
+        # Not cached yet, or replaced by another process while being read.
+        return None
+
+    if all(
+        _file_digest(os.path.join(base_dir, name)) == digest
+        for name, digest in user_files.items()
+    ):
+        return spec
+
+    return None
+
+
+def _write_cache(spec: ScenarioSpec, path: str, user_files: dict[str, str]) -> bool:
+    """
+    Writes a parsed scenario and the hashes of its user files to the cache.
+
+    The entry is written to its own staging directory next to `path` and
+    renamed into place once complete, so an entry that exists is complete.
+    Processes writing the same entry at once race on the rename, and the
+    ones that lose discard their copy. An existing entry is only replaced
+    if it records other user files, so an entry another process has just
+    stored is never mistaken for a stale one.
+
+    Returns:
+        bool: Whether this call stored the entry, rather than another process.
+    """
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}.tmp-", dir=cache_dir)
+
+    try:
+        np.save(os.path.join(staging, "user_names.npy"), spec.user_names)
+        np.save(os.path.join(staging, "user_balances.npy"), spec.user_balances)
+        with open(
+            os.path.join(staging, "scenario.json"), "w", encoding="utf-8"
+        ) as file:
+            json.dump(
+                {
+                    "tokens": spec.tokens,
+                    "contracts": spec.contracts,
+                    "user_files": user_files,
+                },
+                file,
+            )
+
+        for _ in range(RENAME_ATTEMPTS):
+            cached_files = _cached_user_files(path)
+            if cached_files == user_files:
+                break
+
+            if cached_files is not None:
+                # A stale entry: moved aside before it is removed, as arrays
+                # memory-mapped from it must stay valid.
+                stale = f"{staging}.stale"
+                try:
+                    os.rename(path, stale)
+                except FileNotFoundError:
+                    pass
+                shutil.rmtree(stale, ignore_errors=True)
+
+            try:
+                os.rename(staging, path)
+                return True
+            except OSError:
+                # Another process renamed its entry into place first.
+                continue
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return False
+
+
+def _cached_user_files(path: str) -> dict[str, str] | None:
+    """
+    Returns the user file hashes recorded by a cache entry, or None if there
+    is no entry.
+    """
+    try:
+        with open(os.path.join(path, "scenario.json"), "r", encoding="utf-8") as file:
+            return json.load(file)["user_files"]
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,210 @@
+import multiprocessing
+import os
+import queue
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+from simulation.create_env import create_env_from_yaml
+from simulation.simulator import Epoch, Simulator
+
+# How long the runner waits for metrics before checking the replicas for errors.
+POLL_INTERVAL = 0.1
+
+
+@dataclass
+class Scenario:
+    """
+    Represents everything needed to rebuild a simulation inside a worker.
+
+    Only the config path, agent counts and epochs are shipped to workers;
+    each replica builds its own `Blockchain` from the YAML file.
+
+    Attributes:
+        config_path (str): The YAML file passed to `create_env_from_yaml`.
+        epochs (list[Epoch]): The epochs to run, with oracles keyed by token.
+        num_users (int): The number of users to create.
+        num_liquidity_providers (int): The number of liquidity providers to create.
+        num_block_producers (int): The number of block producers to create.
+        engine (str): The execution engine of the blockchain.
+        cache_dir (str | None): The directory of parsed scenarios shared by
+            the replicas, or None to parse the YAML file in every replica.
+    """
+
+    config_path: str
+    epochs: list[Epoch] = field(default_factory=list)
+    num_users: int = 100
+    num_liquidity_providers: int = 10
+    num_block_producers: int = 1
+    engine: str = "sequential"
+    cache_dir: str | None = None
+
+
+@dataclass
+class EpochMetrics:
+    """
+    Represents the summary metrics of one replica at the end of one epoch.
+
+    Attributes:
+        replica (int): The index of the replica.
+        seed (int): The seed of the replica.
+        epoch (int): The epoch number, 0 being the state before the first epoch.
+        metrics (dict[str, float]): The snapshot returned by `Simulator.get_snapshot`.
+    """
+
+    replica: int
+    seed: int
+    epoch: int
+    metrics: dict[str, float]
+
+
+def run_replica(
+    scenario: Scenario, replica: int, seed: int, results_queue: Any = None
+) -> list[EpochMetrics]:
+    """
+    Runs one replica of a scenario and returns its per-epoch metrics.
+
+    Args:
+        scenario (Scenario): The scenario to run.
+        replica (int): The index of the replica.
+        seed (int): The seed of the replica.
+        results_queue (Any): A queue each epoch's metrics are also put on as
+            soon as the epoch ends, or None.
+    """
+    random.seed(seed)
+
+    blockchain = create_env_from_yaml(
+        scenario.config_path, scenario.cache_dir, engine=scenario.engine
+    )
+
+    simulator = Simulator(blockchain, seed=seed)
+    simulator.create_users(scenario.num_users)
+    simulator.create_liquidity_providers(scenario.num_liquidity_providers)
+    simulator.create_block_producers(scenario.num_block_producers)
+
+    results: list[EpochMetrics] = []
+
+    def report(epoch_num: int) -> None:
+        metrics = EpochMetrics(replica, seed, epoch_num, simulator.get_snapshot())
+        results.append(metrics)
+        if results_queue is not None:
+            results_queue.put(metrics)
+
+    report(0)
+    for epoch_num, epoch in enumerate(scenario.epochs, start=1):
+        simulator.run_epoch(epoch.bind(blockchain.tokens))
+        report(epoch_num)
+
+    return results
+
+
+class MonteCarloRunner:
+    """
+    Runs many seeded replicas of a scenario across a process pool.
+
+    Attributes:
+        scenario (Scenario): The scenario to run.
+        num_replicas (int): The number of replicas to run.
+        seeds (list[int]): The seed of each replica.
+        max_workers (int): The number of worker processes.
+    """
+
+    def __init__(
+        self,
+        scenario: Scenario,
+        num_replicas: int,
+        seed: int | None = None,
+        max_workers: int | None = None,
+    ):
+        """
+        Initializes a Monte Carlo runner.
+
+        Args:
+            scenario (Scenario): The scenario to run.
+            num_replicas (int): The number of replicas to run.
+            seed (int | None): The root seed the replica seeds are derived from.
+            max_workers (int | None): The number of worker processes,
+                defaulting to the number of CPUs.
+        """
+        self.scenario = scenario
+        self.num_replicas = num_replicas
+        self.seeds = [
+            int(child.generate_state(1)[0])
+            for child in np.random.SeedSequence(seed).spawn(num_replicas)
+        ]
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def __repr__(self) -> str:
+        return f"MonteCarloRunner(replicas={self.num_replicas}, workers={self.max_workers})"
+
+    def run(self) -> Iterator[EpochMetrics]:
+        """
+        Runs every replica and yields each epoch's metrics as soon as a
+        replica finishes that epoch, in completion order.
+
+        The workers put their metrics on a queue shared through a manager
+        process. If a replica raises, its error is raised here once the
+        metrics it reported before have been yielded.
+        """
+        remaining = self.num_replicas * (len(self.scenario.epochs) + 1)
+
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(
+            max_workers=self.max_workers
+        ) as executor:
+            results_queue = manager.Queue()
+            futures = [
+                executor.submit(
+                    run_replica, self.scenario, replica, seed, results_queue
+                )
+                for replica, seed in enumerate(self.seeds)
+            ]
+
+            while remaining:
+                try:
+                    metrics = results_queue.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()  # type: ignore
+                    continue
+
+                remaining -= 1
+                yield metrics
+
+
+def summarize(
+    results: Iterable[EpochMetrics], percentiles: tuple[float, ...] = (5, 50, 95)
+) -> dict[int, dict[str, dict[str, float]]]:
+    """
+    Aggregates per-epoch metrics across replicas.
+
+    Args:
+        results (Iterable[EpochMetrics]): The metrics yielded by `MonteCarloRunner.run`.
+        percentiles (tuple[float, ...]): The percentiles to report.
+
+    Returns:
+        dict[int, dict[str, dict[str, float]]]: The mean, standard deviation
+            and percentiles of every metric, keyed by epoch then metric name.
+    """
+    samples: dict[int, dict[str, list[float]]] = {}
+    for result in results:
+        epoch_samples = samples.setdefault(result.epoch, {})
+        for name, value in result.metrics.items():
+            epoch_samples.setdefault(name, []).append(value)
+
+    summary: dict[int, dict[str, dict[str, float]]] = {}
+    for epoch, epoch_samples in sorted(samples.items()):
+        summary[epoch] = {}
+        for name, values in epoch_samples.items():
+            array = np.asarray(values)
+            stats = {"mean": float(array.mean()), "std": float(array.std())}
+            for percentile, value in zip(
+                percentiles, np.percentile(array, percentiles)
+            ):
+                stats[f"p{percentile:g}"] = float(value)
+            summary[epoch][name] = stats
+
+    return summary
@@ -0,0 +1,119 @@
+from typing import Callable
+
+import numpy as np
+
+
+def bounded_random_walk(
+    rng: np.random.Generator,
+    base: np.ndarray,
+    num_blocks: int,
+    max_percent: np.ndarray | float = 0.05,
+    change_limit: np.ndarray | float = 0.01,
+) -> np.ndarray:
+    """
+    Generates prices that deviate from `base` by a bounded random percentage,
+    which moves by at most `change_limit` per block.
+
+    This is the walk of `utils.math.adjust_random_percent`, drawn for every
+    block and token at once.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        base (np.ndarray): The base price of each token, shaped (..., tokens).
+        num_blocks (int): The number of blocks.
+        max_percent (np.ndarray | float): The bound of the deviation.
+        change_limit (np.ndarray | float): The largest change per block.
+
+    Returns:
+        np.ndarray: The prices, shaped (blocks, ..., tokens).
+    """
+    base = np.asarray(base, dtype=float)
+    random_percents = rng.uniform(-1.0, 1.0, (num_blocks, *base.shape)) * max_percent
+
+    percents = np.empty_like(random_percents)
+    prev_percent = np.zeros(base.shape)
+    for block in range(num_blocks):
+        prev_percent = np.clip(
+            random_percents[block],
+            prev_percent - change_limit,
+            prev_percent + change_limit,
+        )
+        percents[block] = prev_percent
+
+    return base * (1 + percents)
+
+
+def geometric_brownian_motion(
+    rng: np.random.Generator,
+    base: np.ndarray,
+    num_blocks: int,
+    volatility: np.ndarray | float = 0.01,
+    drift: np.ndarray | float = 0.0,
+) -> np.ndarray:
+    """
+    Generates prices following a geometric Brownian motion started at `base`.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        base (np.ndarray): The starting price of each token, shaped (..., tokens).
+        num_blocks (int): The number of blocks.
+        volatility (np.ndarray | float): The standard deviation of the log
+            return per block.
+        drift (np.ndarray | float): The expected return per block.
+
+    Returns:
+        np.ndarray: The prices, shaped (blocks, ..., tokens).
+    """
+    base = np.asarray(base, dtype=float)
+    shocks = rng.standard_normal((num_blocks, *base.shape))
+    log_returns = (drift - 0.5 * np.square(volatility)) + volatility * shocks
+
+    return base * np.exp(np.cumsum(log_returns, axis=0))
+
+
+def mean_reverting(
+    rng: np.random.Generator,
+    base: np.ndarray,
+    num_blocks: int,
+    volatility: np.ndarray | float = 0.01,
+    reversion: np.ndarray | float = 0.05,
+) -> np.ndarray:
+    """
+    Generates prices whose log deviation from `base` follows a discrete
+    Ornstein-Uhlenbeck process.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        base (np.ndarray): The long-run price of each token, shaped (..., tokens).
+        num_blocks (int): The number of blocks.
+        volatility (np.ndarray | float): The standard deviation of the log
+            shock per block.
+        reversion (np.ndarray | float): The fraction of the deviation undone
+            per block.
+
+    Returns:
+        np.ndarray: The prices, shaped (blocks, ..., tokens).
+    """
+    base = np.asarray(base, dtype=float)
+    shocks = rng.standard_normal((num_blocks, *base.shape)) * volatility
+
+    deviations = np.empty_like(shocks)
+    deviation = np.zeros(base.shape)
+    for block in range(num_blocks):
+        deviation = deviation * (1 - reversion) + shocks[block]
+        deviations[block] = deviation
+
+    return base * np.exp(deviations)
+
+
+PRICE_MODELS: dict[str, Callable[..., np.ndarray]] = {
+    "bounded": bounded_random_walk,
+    "gbm": geometric_brownian_motion,
+    "mean_reverting": mean_reverting,
+}
+
+MODEL_PARAMS: dict[str, tuple[str, ...]] = {
+    "bounded": ("max_percent", "change_limit"),
+    "gbm": ("volatility", "drift"),
+    "mean_reverting": ("volatility", "reversion"),
+}
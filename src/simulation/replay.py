@@ -0,0 +1,347 @@
+import argparse
+import csv
+import json
+import os
+from typing import Iterator
+
+import numpy as np
+
+from contracts.contract import Contract
+from core.blockchain import Blockchain
+from core.transaction import Transaction
+from market.actors.user import User
+from simulation.simulator import Epoch
+
+TRADE_DTYPE = np.dtype(
+    [
+        ("block", np.int64),
+        ("user", np.int64),
+        ("token_in", np.int32),
+        ("token_out", np.int32),
+        ("amount_in", np.float64),
+    ]
+)
+
+CHUNK_SIZE = 65536
+
+
+class TradeTrace:
+    """
+    Represents the recorded trade intents of a range of blocks.
+
+    Trades are stored sorted by block with a per-block offset index, so the
+    trades of a block are a slice of the memory-mapped records.
+
+    Attributes:
+        records (np.ndarray): The trade records, with `TRADE_DTYPE` fields.
+        offsets (np.ndarray): The index of the first trade of each block,
+            followed by the number of trades.
+        token_names (list[str]): The token name of each token ID.
+    """
+
+    def __init__(
+        self, records: np.ndarray, offsets: np.ndarray, token_names: list[str]
+    ):
+        self.records = records
+        self.offsets = offsets
+        self.token_names = token_names
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def block(self, block: int) -> np.ndarray:
+        """
+        Returns the trade records of a block, relative to the start of the trace.
+        """
+        return self.records[self.offsets[block] : self.offsets[block + 1]]
+
+    def slice(self, start: int, stop: int) -> "TradeTrace":
+        """
+        Returns the trace of blocks `start` to `stop`.
+        """
+        return TradeTrace(
+            self.records, self.offsets[start : stop + 1], self.token_names
+        )
+
+    def simulate_block(
+        self,
+        block: int,
+        user_list: list[User],
+        contract: Contract,
+        blockchain: Blockchain,
+    ):
+        """
+        Sends the recorded trades of a block as swaps, with each trade's user
+        index resolved against `user_list`.
+        """
+        tokens = [blockchain.tokens[name] for name in self.token_names]
+
+        for _, user, token_in, token_out, amount_in in self.block(block).tolist():
+            sender = user_list[user]
+            transaction = Transaction(
+                sender=sender,
+                contract=contract,
+                function="swap",
+                args={
+                    "token_in": tokens[token_in],
+                    "amount_in": amount_in,
+                    "token_out": tokens[token_out],
+                },
+            )
+            sender.send_transaction(transaction=transaction, blockchain=blockchain)
+
+
+class ReplaySource:
+    """
+    Represents a memory-mapped replay of per-block token prices and,
+    optionally, trade intents.
+
+    A replay is a directory holding `meta.json`, a (blocks x tokens)
+    `prices.npy`, the chain block number of each price row in `blocks.npy`
+    and, when trades were recorded, `trades.npy` and `trade_offsets.npy`.
+    Arrays are memory-mapped, so only the blocks being simulated are read
+    from disk.
+
+    Attributes:
+        path (str): The replay directory.
+        token_names (list[str]): The name of each price column.
+        prices (np.ndarray): The memory-mapped price matrix.
+        blocks (np.ndarray): The chain block number of each price row.
+        trades (TradeTrace | None): The memory-mapped trade trace, if any.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens a replay directory.
+
+        Args:
+            path (str): The replay directory, as written by `convert_csv`.
+        """
+        self.path = path
+
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+
+        self.token_names: list[str] = meta["tokens"]
+        self.prices = np.load(os.path.join(path, "prices.npy"), mmap_mode="r")
+
+        # Replays written before block numbers were kept number their rows.
+        blocks_path = os.path.join(path, "blocks.npy")
+        self.blocks = (
+            np.load(blocks_path, mmap_mode="r")
+            if os.path.exists(blocks_path)
+            else np.arange(len(self.prices))
+        )
+
+        self.trades: TradeTrace | None = None
+        if meta.get("num_trades") is not None:
+            self.trades = TradeTrace(
+                np.load(os.path.join(path, "trades.npy"), mmap_mode="r"),
+                np.load(os.path.join(path, "trade_offsets.npy"), mmap_mode="r"),
+                self.token_names,
+            )
+
+    def __repr__(self) -> str:
+        return f"ReplaySource({self.path!r}, blocks={self.num_blocks}, tokens={self.token_names})"
+
+    @property
+    def num_blocks(self) -> int:
+        return len(self.prices)
+
+    def epoch(
+        self, blockchain: Blockchain, start: int = 0, stop: int | None = None
+    ) -> Epoch:
+        """
+        Returns an epoch replaying blocks `start` to `stop`.
+
+        Args:
+            blockchain (Blockchain): The blockchain whose tokens the price
+                columns are matched to, by name.
+            start (int): The first block to replay.
+            stop (int | None): The block to stop at, defaulting to the last one.
+        """
+        stop = self.num_blocks if stop is None else min(stop, self.num_blocks)
+        prices = self.prices[start:stop]
+
+        oracle = {
+            blockchain.tokens[name]: float(price)
+            for name, price in zip(self.token_names, prices[0])
+        }
+        trades = None if self.trades is None else self.trades.slice(start, stop)
+
+        return Epoch(stop - start, oracle, prices=prices, trades=trades)
+
+    def epochs(self, blockchain: Blockchain, num_blocks: int) -> Iterator[Epoch]:
+        """
+        Yields consecutive epochs of `num_blocks` blocks covering the replay.
+        """
+        for start in range(0, self.num_blocks, num_blocks):
+            yield self.epoch(blockchain, start, start + num_blocks)
+
+
+def convert_csv(
+    prices_csv: str,
+    output_dir: str,
+    trades_csv: str | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> ReplaySource:
+    """
+    Converts CSV market data into a replay directory, streaming it in chunks.
+
+    The prices CSV has a `block` column of chain block numbers followed by
+    one column per token name, with one row per priced block in increasing
+    block order. The optional trades CSV has `block`, `user`, `token_in`,
+    `token_out` and `amount_in` columns, sorted by block, where `user` is
+    an index into the simulator's users and the tokens are names from the
+    prices header. Each trade is replayed in the row of the last priced
+    block at or before its block.
+
+    Args:
+        prices_csv (str): The path of the prices CSV.
+        output_dir (str): The replay directory to write.
+        trades_csv (str | None): The path of the trades CSV, if any.
+        chunk_size (int): The number of rows converted at a time.
+
+    Returns:
+        ReplaySource: The converted replay.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    with open(prices_csv, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        num_blocks = sum(1 for row in reader if row)
+
+    token_names = header[1:]
+    token_ids = {name: token_id for token_id, name in enumerate(token_names)}
+
+    prices = np.lib.format.open_memmap(
+        os.path.join(output_dir, "prices.npy"),
+        mode="w+",
+        dtype=np.float64,
+        shape=(num_blocks, len(token_names)),
+    )
+    blocks = np.lib.format.open_memmap(
+        os.path.join(output_dir, "blocks.npy"),
+        mode="w+",
+        dtype=np.int64,
+        shape=(num_blocks,),
+    )
+    for start, rows in _read_chunks(prices_csv, chunk_size):
+        blocks[start : start + len(rows)] = [int(row[0]) for row in rows]
+        prices[start : start + len(rows)] = [row[1:] for row in rows]
+    prices.flush()
+    blocks.flush()
+    del prices
+
+    if np.any(np.diff(blocks) <= 0):
+        raise ValueError(f"{prices_csv} is not sorted by block")
+
+    meta = {"tokens": token_names, "num_blocks": num_blocks, "num_trades": None}
+
+    if trades_csv is not None:
+        meta["num_trades"] = _convert_trades(
+            trades_csv, output_dir, token_ids, blocks, chunk_size
+        )
+    del blocks
+
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+
+    return ReplaySource(output_dir)
+
+
+def _convert_trades(
+    trades_csv: str,
+    output_dir: str,
+    token_ids: dict[str, int],
+    price_blocks: np.ndarray,
+    chunk_size: int,
+) -> int:
+    num_blocks = len(price_blocks)
+
+    with open(trades_csv, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        next(reader)
+        num_trades = sum(1 for row in reader if row)
+
+    trades = np.lib.format.open_memmap(
+        os.path.join(output_dir, "trades.npy"),
+        mode="w+",
+        dtype=TRADE_DTYPE,
+        shape=(num_trades,),
+    )
+    counts = np.zeros(num_blocks, dtype=np.int64)
+    last_block = 0
+
+    for start, rows in _read_chunks(trades_csv, chunk_size):
+        chunk = np.array(
+            [
+                (
+                    int(block),
+                    int(user),
+                    token_ids[token_in],
+                    token_ids[token_out],
+                    float(amount_in),
+                )
+                for block, user, token_in, token_out, amount_in in rows
+            ],
+            dtype=TRADE_DTYPE,
+        )
+
+        blocks = chunk["block"]
+        if blocks[0] < last_block or np.any(np.diff(blocks) < 0):
+            raise ValueError(f"{trades_csv} is not sorted by block")
+        if num_blocks == 0 or blocks[0] < price_blocks[0]:
+            raise ValueError(f"{trades_csv} has trades before the first priced block")
+        if blocks[-1] > price_blocks[-1]:
+            raise ValueError(f"{trades_csv} has trades past the last priced block")
+
+        rows = np.searchsorted(price_blocks, blocks, side="right") - 1
+        trades[start : start + len(chunk)] = chunk
+        counts += np.bincount(rows, minlength=num_blocks)
+        last_block = int(blocks[-1])
+
+    trades.flush()
+    del trades
+
+    offsets = np.zeros(num_blocks + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    np.save(os.path.join(output_dir, "trade_offsets.npy"), offsets)
+
+    return num_trades
+
+
+def _read_chunks(path: str, chunk_size: int) -> Iterator[tuple[int, list[list[str]]]]:
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        next(reader)
+
+        start = 0
+        rows: list[list[str]] = []
+        for row in reader:
+            if not row:
+                continue
+
+            rows.append(row)
+            if len(rows) == chunk_size:
+                yield start, rows
+                start += len(rows)
+                rows = []
+
+        if rows:
+            yield start, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert CSV market data to a replay")
+    parser.add_argument("prices_csv")
+    parser.add_argument("output_dir")
+    parser.add_argument("--trades", dest="trades_csv")
+    args = parser.parse_args()
+
+    print(convert_csv(args.prices_csv, args.output_dir, args.trades_csv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import numpy as np
+
+from contracts.amm_protocol import LiquidityPool
+from contracts.uniswap_v2 import UniswapV2, get_amount_out
+from market.actors.user import Population
+from simulation.simulator import Epoch, Simulator
+
+
+class ReplicaSimulator:
+    """
+    Simulates many independent copies of a single-pool `Simulator` at once.
+
+    Token values, pool reserves and user balances carry a leading replica
+    axis, and every step of `Simulator.run_epoch` (oracle walk, user swap
+    generation and swap execution) is evaluated as array operations across
+    all replicas. Replicas may differ in fee tier and oracle volatility.
+
+    Attributes:
+        num_replicas (int): The number of replicas.
+        pool (LiquidityPool): The template pool every replica starts from.
+        values (np.ndarray): The token values, shaped (replicas, tokens).
+        reserves (np.ndarray): The pool reserves, shaped (replicas, 2).
+        balances (np.ndarray): The user balances, shaped (replicas, users, tokens).
+        held (np.ndarray): Whether each user holds each token, shaped like `balances`.
+        fees (np.ndarray): The pool fee of each replica.
+        max_percents (np.ndarray | None): The oracle walk bound of each
+            replica, or None to use the epoch's.
+        change_limits (np.ndarray | None): The oracle walk step limit of each
+            replica, or None to use the epoch's.
+        volatilities (np.ndarray | None): The oracle volatility of each
+            replica, or None to use the epoch's.
+    """
+
+    def __init__(
+        self,
+        simulator: Simulator,
+        num_replicas: int,
+        fees: np.ndarray | float | None = None,
+        max_percents: np.ndarray | float | None = None,
+        change_limits: np.ndarray | float | None = None,
+        volatilities: np.ndarray | float | None = None,
+        seed: int | None = None,
+    ):
+        """
+        Initializes the replicas from the current state of a simulator.
+
+        Args:
+            simulator (Simulator): The simulator whose users and UniswapV2
+                pool every replica starts from.
+            num_replicas (int): The number of replicas.
+            fees (np.ndarray | float | None): The pool fee of each replica,
+                defaulting to the template pool's fee.
+            max_percents (np.ndarray | float | None): The oracle walk bound of
+                each replica, defaulting to the epoch's.
+            change_limits (np.ndarray | float | None): The oracle walk step
+                limit of each replica, defaulting to the epoch's.
+            volatilities (np.ndarray | float | None): The oracle volatility of
+                each replica for the GBM and mean-reverting models,
+                defaulting to the epoch's.
+            seed (int | None): The seed of the random generator.
+        """
+        blockchain = simulator.blockchain
+        uniswap_v2: UniswapV2 = blockchain.contracts["UniswapV2"]  # type: ignore
+
+        pools = uniswap_v2.get_pools()
+        if len(pools) != 1:
+            raise ValueError("Replica simulation supports a single pool")
+
+        self.num_replicas = num_replicas
+        self.pool: LiquidityPool = pools[0]
+        self.rng = np.random.default_rng(seed)
+
+        ledger = blockchain.ledger
+        self.tokens = list(ledger.tokens)
+        self.token_ids = dict(ledger.token_ids)
+        self.pool_tokens = np.array(
+            [ledger.token_ids[token.name] for token in self.pool.token_reserve]
+        )
+
+        # Side of each token in the pool, -1 for tokens outside of it.
+        self.pool_sides = np.full(len(self.tokens), -1)
+        self.pool_sides[self.pool_tokens] = [0, 1]
+
+        users = simulator.users
+        user_ids = (
+            users.user_ids
+            if isinstance(users, Population)
+            else [user.user_id for user in users]
+        )
+        shape = (num_replicas, len(user_ids), len(self.tokens))
+
+        self.values = np.tile(ledger.prices, (num_replicas, 1))
+        self.reserves = np.tile(
+            np.array(list(self.pool.token_reserve.values()), dtype=float),
+            (num_replicas, 1),
+        )
+        self.balances = np.broadcast_to(ledger.balances[user_ids], shape).copy()
+        self.held = np.broadcast_to(ledger.held[user_ids], shape).copy()
+
+        self.fees = self._per_replica(self.pool.fee if fees is None else fees)
+        self.max_percents = (
+            None if max_percents is None else self._per_replica(max_percents)
+        )
+        self.change_limits = (
+            None if change_limits is None else self._per_replica(change_limits)
+        )
+        self.volatilities = (
+            None if volatilities is None else self._per_replica(volatilities)
+        )
+
+    def __repr__(self) -> str:
+        return f"ReplicaSimulator(replicas={self.num_replicas}, users={self.balances.shape[1]}, pool={self.pool.pair_name})"
+
+    def run(self, epochs: list[Epoch]) -> list[dict[str, np.ndarray]]:
+        """
+        Runs the epochs on every replica.
+
+        Returns:
+            list[dict[str, np.ndarray]]: The snapshot before the first epoch
+                and after each epoch.
+        """
+        snapshots = [self.get_snapshot()]
+
+        for epoch in epochs:
+            self.run_epoch(epoch)
+            snapshots.append(self.get_snapshot())
+
+        return snapshots
+
+    def run_epoch(self, epoch: Epoch):
+        oracle_tokens = [self.token_ids[token.name] for token in epoch.oracle]
+        base = np.tile(list(epoch.oracle.values()), (self.num_replicas, 1))
+
+        params = {
+            name: values[:, None]
+            for name, values in (
+                ("max_percent", self.max_percents),
+                ("change_limit", self.change_limits),
+                ("volatility", self.volatilities),
+            )
+            if values is not None
+        }
+        prices = epoch.price_path(self.rng, base, **params)
+        if prices.ndim == 2:
+            prices = np.broadcast_to(prices[:, None], (len(prices), *base.shape))
+
+        for block in range(epoch.num_blocks):
+            self.values[:, oracle_tokens] = prices[block]
+
+            self._simulate_user_actions()
+
+    def _simulate_user_actions(self):
+        """
+        Draws one swap per user per replica from the balances at the start of
+        the block, then executes them in a random user order per replica.
+        """
+        num_replicas, num_users, num_tokens = self.balances.shape
+        replicas = np.arange(num_replicas)
+
+        # A uniformly random held token is the argmax of uniform scores.
+        scores = np.where(self.held, self.rng.random(self.balances.shape), -1.0)
+        token_in = scores.argmax(axis=2)
+        active = scores.max(axis=2) >= 0.0
+
+        balance_in = np.take_along_axis(self.balances, token_in[..., None], 2)[..., 0]
+        amount_in = balance_in * self.rng.uniform(0.01, 1.0, token_in.shape)
+
+        token_out = self.rng.integers(0, num_tokens - 1, token_in.shape)
+        token_out += token_out >= token_in
+
+        side_in = self.pool_sides[token_in]
+        side_out = self.pool_sides[token_out]
+        active &= (side_in >= 0) & (side_out >= 0)
+        side_in = np.maximum(side_in, 0)
+
+        order = self.rng.permuted(
+            np.broadcast_to(np.arange(num_users), (num_replicas, num_users)), axis=1
+        )
+
+        for users in order.T:
+            tokens_in = token_in[replicas, users]
+            tokens_out = token_out[replicas, users]
+            amounts_in = amount_in[replicas, users]
+            sides_in = side_in[replicas, users]
+
+            reserves_in = self.reserves[replicas, sides_in]
+            reserves_out = self.reserves[replicas, 1 - sides_in]
+            amounts_out = get_amount_out(
+                reserves_in, reserves_out, amounts_in, self.fees
+            )
+
+            balances_in = self.balances[replicas, users, tokens_in]
+            ok = (
+                active[replicas, users]
+                & self.held[replicas, users, tokens_in]
+                & (balances_in >= amounts_in)
+                & (reserves_out >= amounts_out)
+            )
+            amounts_in = np.where(ok, amounts_in, 0.0)
+            amounts_out = np.where(ok, amounts_out, 0.0)
+
+            self.reserves[replicas, sides_in] = reserves_in + amounts_in
+            self.reserves[replicas, 1 - sides_in] = reserves_out - amounts_out
+
+            balances_in = balances_in - amounts_in
+            self.balances[replicas, users, tokens_in] = balances_in
+            self.held[replicas, users, tokens_in] &= ~(ok & (balances_in == 0))
+
+            self.balances[replicas, users, tokens_out] += amounts_out
+            self.held[replicas, users, tokens_out] |= ok
+
+    def get_snapshot(self) -> dict[str, np.ndarray]:
+        """
+        Returns the summary metrics of every replica, keyed by metric name.
+        """
+        snapshot = {
+            "user_total_value": np.einsum("rut,rt->r", self.balances, self.values)
+        }
+
+        pool_values = self.values[:, self.pool_tokens]
+        for side, token in enumerate(self.pool.token_reserve):
+            snapshot[f"{self.pool.pair_name} {token.name} reserve"] = self.reserves[
+                :, side
+            ].copy()
+        snapshot[f"{self.pool.pair_name} tvl"] = (self.reserves * pool_values).sum(
+            axis=1
+        )
+
+        return snapshot
+
+    def _per_replica(self, value: np.ndarray | float) -> np.ndarray:
+        return np.broadcast_to(np.asarray(value, dtype=float), self.num_replicas).copy()
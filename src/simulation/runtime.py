@@ -0,0 +1,269 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from contracts.amm_protocol import AmmProtocol
+from core.blockchain import Blockchain
+from core.transaction import Transaction
+from market.actors.user import BlockProducer, User
+from utils.logger import events
+
+
+@dataclass(frozen=True)
+class Observation:
+    """
+    Represents the state of the blockchain the agents see during a block.
+
+    Transactions only execute when a block is sealed, so the state does not
+    change while the agents act and one observation serves all of them.
+
+    Attributes:
+        block_number (int): The number of the block being built.
+        prices (dict[str, float]): The value of each token.
+        reserves (dict[str, dict[str, float]]): The reserves of each pool,
+            by contract and pair, such as `"UniswapV2 USDC/ETH"`.
+        pending (int): The number of transactions in the mempool.
+    """
+
+    block_number: int
+    prices: dict[str, float]
+    reserves: dict[str, dict[str, float]]
+    pending: int
+
+
+@dataclass
+class RoundStats:
+    """
+    Represents what the agents did in a block.
+
+    Attributes:
+        block_number (int): The number of the sealed block.
+        completed (int): The number of agents that finished before the
+            deadline.
+        late (int): The number of agents cancelled at the deadline.
+        failed (int): The number of agents that raised.
+        submitted (int): The number of transactions submitted.
+        elapsed (float): The wall time of the round, in seconds.
+    """
+
+    block_number: int
+    completed: int = 0
+    late: int = 0
+    failed: int = 0
+    submitted: int = 0
+    elapsed: float = 0.0
+
+
+class AgentSession:
+    """
+    Represents the handle an agent acts through during a block.
+
+    Attributes:
+        runtime (AsyncAgentRuntime): The runtime running the agent.
+        user (User): The user the agent acts for.
+    """
+
+    __slots__ = ("runtime", "user")
+
+    def __init__(self, runtime: "AsyncAgentRuntime", user: User):
+        self.runtime = runtime
+        self.user = user
+
+    @property
+    def blockchain(self) -> Blockchain:
+        return self.runtime.blockchain
+
+    async def observe(self) -> Observation:
+        """
+        Returns the state of the blockchain, after the runtime's observation
+        latency.
+        """
+        if self.runtime.observe_latency > 0:
+            await asyncio.sleep(self.runtime.observe_latency)
+
+        return self.runtime.observation
+
+    async def send_transaction(self, transaction: Transaction) -> None:
+        """
+        Submits a transaction to the mempool, after the runtime's network
+        latency. The transaction is lost if the block is sealed first.
+
+        Args:
+            transaction (Transaction): The transaction to submit.
+        """
+        if self.runtime.network_latency > 0:
+            await asyncio.sleep(self.runtime.network_latency)
+
+        self.user.send_transaction(transaction, self.runtime.blockchain)
+        self.runtime._stats.submitted += 1
+
+
+Strategy = Callable[[AgentSession], Awaitable[None]]
+
+
+@dataclass
+class AsyncAgentRuntime:
+    """
+    Runs agents as coroutines that overlap their waits within each block.
+
+    Every block, each agent's strategy is called once with an `AgentSession`
+    and may await observations, its own I/O (such as a request to a model
+    server) and `send_transaction`. At most `max_concurrency` strategies run
+    at a time. When all of them are done, or `block_deadline` seconds after
+    the round started, the strategies still running are cancelled and the
+    block producer seals the block from the mempool.
+
+    Transactions enter the mempool in the order their agents get to submit
+    them, which depends on the timing of their I/O, so blocks with agents
+    racing the same deadline are not reproducible from a seed.
+
+    Attributes:
+        blockchain (Blockchain): The blockchain the agents act on.
+        block_producers (list[BlockProducer]): The producers sealing the
+            blocks in turn.
+        max_concurrency (int): The maximum number of strategies running at
+            once.
+        block_deadline (float | None): The wall time the agents have in each
+            block, in seconds, or None to wait for all of them.
+        network_latency (float): The delay before a submitted transaction
+            reaches the mempool, in seconds.
+        observe_latency (float): The delay before an observation is
+            returned, in seconds.
+        agents (list[tuple[User, Strategy]]): The registered agents.
+        observation (Observation | None): The state observed in the current
+            block.
+    """
+
+    blockchain: Blockchain
+    block_producers: list[BlockProducer] = field(default_factory=list)
+    max_concurrency: int = 1000
+    block_deadline: float | None = 1.0
+    network_latency: float = 0.0
+    observe_latency: float = 0.0
+    agents: list[tuple[User, Strategy]] = field(default_factory=list, repr=False)
+    observation: Observation | None = field(default=None, init=False, repr=False)
+    _stats: RoundStats | None = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if self.block_deadline is not None and self.block_deadline <= 0:
+            raise ValueError("block_deadline must be positive")
+        if self.network_latency < 0 or self.observe_latency < 0:
+            raise ValueError("Latencies must not be negative")
+
+    def add_agent(self, user: User, strategy: Strategy) -> None:
+        """
+        Registers an agent.
+
+        Args:
+            user (User): The user the agent acts for.
+            strategy (Strategy): The coroutine function called with the
+                agent's session every block.
+        """
+        self.agents.append((user, strategy))
+
+    def run(self, num_blocks: int) -> list[RoundStats]:
+        """
+        Runs a number of blocks on a new event loop.
+
+        Args:
+            num_blocks (int): The number of blocks.
+
+        Returns:
+            list[RoundStats]: The stats of each block.
+        """
+        return asyncio.run(self.run_blocks(num_blocks))
+
+    async def run_blocks(self, num_blocks: int) -> list[RoundStats]:
+        """
+        Runs a number of blocks on the running event loop.
+
+        Args:
+            num_blocks (int): The number of blocks.
+
+        Returns:
+            list[RoundStats]: The stats of each block.
+        """
+        return [await self.run_block() for _ in range(num_blocks)]
+
+    async def run_block(self) -> RoundStats:
+        """
+        Runs every agent's strategy for the next block, then seals it.
+
+        Returns:
+            RoundStats: What the agents did in the block.
+        """
+        blockchain = self.blockchain
+        start = time.perf_counter()
+
+        self.observation = self._observe()
+        stats = self._stats = RoundStats(blockchain.block_number)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [
+            asyncio.create_task(self._run_agent(semaphore, user, strategy))
+            for user, strategy in self.agents
+        ]
+
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=self.block_deadline)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+            stats.late = len(pending)
+            for task in done:
+                if task.result():
+                    stats.completed += 1
+                else:
+                    stats.failed += 1
+
+        # Submissions after the deadline are too late for this block.
+        self._stats = None
+
+        producers = self.block_producers
+        producer = (
+            producers[blockchain.block_number % len(producers)] if producers else None
+        )
+        blockchain.create_block(producer)
+
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+    async def _run_agent(
+        self, semaphore: asyncio.Semaphore, user: User, strategy: Strategy
+    ) -> bool:
+        async with semaphore:
+            try:
+                await strategy(AgentSession(self, user))
+            except Exception as e:
+                events.failure(
+                    e,
+                    "agent_failed",
+                    agent=user.name,
+                    block_number=self.blockchain.block_number,
+                )
+                return False
+
+        return True
+
+    def _observe(self) -> Observation:
+        blockchain = self.blockchain
+        reserves = {
+            f"{contract.name} {pool.pair_name}": {
+                token.name: reserve for token, reserve in pool.token_reserve.items()
+            }
+            for contract in blockchain.contracts.values()
+            if isinstance(contract, AmmProtocol)
+            for pool in contract.pools.values()
+        }
+
+        return Observation(
+            blockchain.block_number,
+            {name: token.value for name, token in blockchain.tokens.items()},
+            reserves,
+            len(blockchain.mempool),
+        )
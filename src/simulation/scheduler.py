@@ -0,0 +1,132 @@
+import heapq
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class ArrivalProcess:
+    """
+    Represents the Poisson arrivals of a population of agents.
+
+    Every agent arrives independently at `rate` times per block on average,
+    so the population as a whole arrives at `rate * len(agents)` times per
+    block, each time as an agent drawn uniformly.
+
+    Attributes:
+        name (str): The name of the process.
+        agents (list): The agents of the population.
+        rate (float): The expected number of arrivals of each agent per block.
+    """
+
+    name: str
+    agents: list
+    rate: float
+
+    @property
+    def total_rate(self) -> float:
+        return self.rate * len(self.agents)
+
+
+class EventScheduler:
+    """
+    Schedules the arrivals of agent populations on a time-ordered heap.
+
+    Time is measured in blocks, and an arrival at time `t` happens in block
+    `floor(t)`. Each process keeps only its next arrival on the heap, drawn
+    from an exponential gap when the previous one is popped, so stepping
+    through a simulation costs time proportional to the number of arrivals
+    rather than to blocks times agents.
+
+    Attributes:
+        rng (np.random.Generator): The random generator arrivals are drawn
+            from.
+        processes (dict[str, ArrivalProcess]): The registered processes.
+    """
+
+    def __init__(self, rng: np.random.Generator):
+        self.rng = rng
+        self.processes: dict[str, ArrivalProcess] = {}
+
+        self._heap: list[tuple[float, int, str]] = []
+        self._count = 0
+
+    def __repr__(self) -> str:
+        return f"EventScheduler(processes={list(self.processes)}, next_block={self.next_block()})"
+
+    def register(
+        self, process: ArrivalProcess, time: float = 0.0, schedule: bool = True
+    ) -> None:
+        """
+        Registers a process, with its first arrival drawn after `time`.
+
+        Args:
+            process (ArrivalProcess): The process.
+            time (float): The time the process starts at.
+            schedule (bool): Whether to draw the first arrival, rather than
+                restore it with `set_state`.
+        """
+        if process.name in self.processes:
+            raise ValueError(f"Arrival process {process.name!r} already registered")
+        if process.rate < 0:
+            raise ValueError("Arrival rates must not be negative")
+
+        self.processes[process.name] = process
+        if schedule:
+            self._schedule(process, time)
+
+    def next_block(self) -> int | None:
+        """
+        Returns the block of the next arrival, or None if nothing arrives.
+        """
+        return math.floor(self._heap[0][0]) if self._heap else None
+
+    def pop_block(self, block: int) -> dict[str, list]:
+        """
+        Removes the arrivals up to the end of a block and schedules the next
+        arrival of their processes.
+
+        Args:
+            block (int): The block.
+
+        Returns:
+            dict[str, list]: The arriving agents of each process, in order
+                of arrival.
+        """
+        arrivals: dict[str, list] = {}
+
+        heap = self._heap
+        while heap and heap[0][0] < block + 1:
+            time, _, name = heapq.heappop(heap)
+            process = self.processes[name]
+            if process.agents:
+                agent = process.agents[int(self.rng.integers(len(process.agents)))]
+                arrivals.setdefault(name, []).append(agent)
+            self._schedule(process, time)
+
+        return arrivals
+
+    def get_state(self) -> dict[str, float]:
+        """
+        Returns the time of the next arrival of every process that has one.
+        """
+        return {name: time for time, _, name in sorted(self._heap)}
+
+    def set_state(self, state: dict[str, float]) -> None:
+        """
+        Replaces the pending arrivals with the ones of `get_state`.
+        """
+        self._heap = []
+        for name, time in state.items():
+            if name in self.processes:
+                self._push(time, name)
+
+    def _schedule(self, process: ArrivalProcess, time: float) -> None:
+        total_rate = process.total_rate
+        if total_rate > 0:
+            self._push(time + self.rng.exponential(1 / total_rate), process.name)
+
+    def _push(self, time: float, name: str) -> None:
+        heapq.heappush(self._heap, (time, self._count, name))
+        self._count += 1
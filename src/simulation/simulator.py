@@ -1,68 +1,323 @@
+import copy
+import json
+import os
+import random
+import shutil
+from typing import Callable
+
+import numpy as np
+
+from contracts.amm_protocol import AmmProtocol, LiquidityPool
 from contracts.uniswap_v2 import UniswapV2
 from core.blockchain import Blockchain
-from market.actors.user import BlockProducer, User
+from core.checkpoint import load_blockchain, replace_directory, save_blockchain
+from market.actors.user import BlockProducer, Population, User
 from market.token import Token
-from simulation.agents import (BlockProducerAgent, LiquidityProviderAgent,
-                               UserAgent)
+from simulation.agents import BlockProducerAgent, LiquidityProviderAgent, UserAgent
+from simulation.price_path import MODEL_PARAMS, PRICE_MODELS
+from simulation.scheduler import ArrivalProcess, EventScheduler
 from utils.logger import with_logging
-from utils.math import adjust_random_percent
+from utils.profiling import Profiler, null_timer
+
+USER_MODES = ("individual", "population")
+ARRIVAL_POPULATIONS = ("users", "liquidity_providers")
+
+# An initial token balance: one amount for every agent, an amount per agent,
+# or a function drawing the amounts of a number of agents.
+Balance = float | np.ndarray | Callable[[int], np.ndarray]
 
 
 class Epoch:
-    def __init__(self, num_blocks: int, oracle: dict[Token, float]):
+    def __init__(
+        self,
+        num_blocks: int,
+        oracle: dict[Token, float],
+        max_percent: float = 0.05,
+        change_limit: float = 0.01,
+        price_model: str = "bounded",
+        volatility: float = 0.01,
+        drift: float = 0.0,
+        reversion: float = 0.05,
+        prices: np.ndarray | None = None,
+        seed: int | None = None,
+        trades: "TradeTrace | None" = None,  # type: ignore
+    ):
+        if price_model not in PRICE_MODELS:
+            raise ValueError(
+                f"Unknown price model {price_model!r}, expected one of {list(PRICE_MODELS)}"
+            )
+
+        if prices is not None and np.shape(prices) != (num_blocks, len(oracle)):
+            raise ValueError(
+                f"Price path must be shaped {(num_blocks, len(oracle))}, got {np.shape(prices)}"
+            )
+
         self.num_blocks = num_blocks
         self.oracle = oracle
+        self.max_percent = max_percent
+        self.change_limit = change_limit
+        self.price_model = price_model
+        self.volatility = volatility
+        self.drift = drift
+        self.reversion = reversion
+        self.prices = prices
+        self.seed = seed
+        self.trades = trades
 
     def __repr__(self) -> str:
         return f"Epoch({self.num_blocks}, {self.oracle})"
 
+    def bind(self, tokens: dict[str, Token]) -> "Epoch":
+        """
+        Returns a copy of the epoch whose oracle refers to the given tokens,
+        matched by name.
+        """
+        epoch = copy.copy(self)
+        epoch.oracle = {
+            tokens[token.name]: value for token, value in self.oracle.items()
+        }
+
+        return epoch
+
+    def price_path(
+        self,
+        rng: np.random.Generator | None = None,
+        base: np.ndarray | None = None,
+        **params: np.ndarray | float,
+    ) -> np.ndarray:
+        """
+        Returns the oracle price of every token at every block of the epoch.
+
+        The path given at construction is returned as is; otherwise it is
+        drawn from the epoch's price model, using the epoch's own seed when
+        it has one.
+
+        Args:
+            rng (np.random.Generator | None): The random generator to draw from.
+            base (np.ndarray | None): The base prices shaped (..., tokens),
+                defaulting to the oracle values.
+            params (np.ndarray | float): Overrides of the model parameters.
+
+        Returns:
+            np.ndarray: The prices, shaped (blocks, ..., tokens).
+        """
+        if self.prices is not None:
+            return np.asarray(self.prices)
+
+        if self.seed is not None or rng is None:
+            rng = np.random.default_rng(self.seed)
+
+        if base is None:
+            base = np.array(list(self.oracle.values()), dtype=float)
+
+        model_params = {
+            name: params.get(name, getattr(self, name))
+            for name in MODEL_PARAMS[self.price_model]
+        }
+
+        return PRICE_MODELS[self.price_model](
+            rng, base, self.num_blocks, **model_params
+        )
+
 
 class Simulator:
-    def __init__(self, blockchain: Blockchain):
+    def __init__(
+        self,
+        blockchain: Blockchain,
+        seed: int | None = None,
+        checkpoint_path: str | None = None,
+        checkpoint_every: int | None = None,
+        sample_every: int | None = None,
+        profiler: Profiler | None = None,
+        user_mode: str = "individual",
+        arrival_rates: dict[str, float] | None = None,
+        gas_fee: float | None = None,
+    ):
+        if checkpoint_every is not None and checkpoint_path is None:
+            raise ValueError("Automatic checkpoints need a checkpoint_path")
+
+        if user_mode not in USER_MODES:
+            raise ValueError(
+                f"Unknown user mode {user_mode!r}, expected one of {USER_MODES}"
+            )
+
         self.blockchain = blockchain
-        self.users: list[User] = []
-        self.liquidity_providers: list[User] = []
-        self.block_producers: list[BlockProducer] = []
+        self.rng = np.random.default_rng(seed)
+        self.users: list[User] | Population = []
+        self.liquidity_providers: list[User] | Population = []
+        self.block_producers: list[BlockProducer] | Population = []
+
+        # Whether users act one by one, or are drawn together from the
+        # ledger's balance table with `self.rng`.
+        self.user_mode = user_mode
+
+        # Without arrival rates, every agent acts in every block. With them,
+        # the users and liquidity providers arrive as Poisson processes, at
+        # the given expected number of arrivals per agent and block, and
+        # blocks where nothing happens are skipped.
+        if arrival_rates is not None and set(arrival_rates) - set(ARRIVAL_POPULATIONS):
+            raise ValueError(
+                f"Arrival rates are for the populations {ARRIVAL_POPULATIONS}"
+            )
+        self.arrival_rates = arrival_rates
+        self.scheduler: EventScheduler | None = None
+        self._arrivals: dict[str, float] | None = None
+
+        # The gas fee of the users' and liquidity providers' transactions,
+        # charged in the blockchain's fee token if it has one.
+        self.gas_fee = gas_fee
+
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+
+        # Snapshots taken every `sample_every` blocks, tagged with the block
+        # number. The metrics are maintained incrementally by the ledger, so
+        # sampling every block is cheap.
+        self.sample_every = sample_every
+        self.samples: list[dict[str, float]] = []
+
+        self.profiler = profiler
+        if profiler is not None:
+            blockchain.profiler = profiler
+
+        # Progress through the epochs of `run`, so a restored run resumes
+        # at the block it was checkpointed after.
+        self.epoch_index = 0
+        self.block_index = 0
+        self._prices: np.ndarray | None = None
+
+        # The pools with share tokens, the pool version each share token was
+        # last priced at, and the pools of every token, by token name.
+        self._num_pools = 0
+        self._lp_pools: list[LiquidityPool] = []
+        self._lp_versions: list[int] = []
+        self._lp_pool_indices: dict[str, list[int]] = {}
 
     def __repr__(self) -> str:
         return f"Simulator(blockchain={self.blockchain.name}, users={len(self.users)}, liquidity_providers={len(self.liquidity_providers)}, block_producers={len(self.block_producers)})"
 
     @with_logging
-    def create_users(self, num: int):
-        for i in range(num):
-            user = self.blockchain.create_user(name=f"User_{i}")
-
-            for token in self.blockchain.tokens.values():
-                user.add_to_wallet(token=token, amount=1000)
+    def create_users(
+        self, num: int, balances: dict[Token, Balance] | None = None, bulk: bool = False
+    ):
+        self._create_agents("users", num, "User_", User, 1000, balances, bulk, "users")
 
-            self.users.append(user)
+    @with_logging
+    def create_liquidity_providers(
+        self, num: int, balances: dict[Token, Balance] | None = None, bulk: bool = False
+    ):
+        self._create_agents(
+            "liquidity_providers",
+            num,
+            "LP_",
+            User,
+            50000,
+            balances,
+            bulk,
+            "liquidity_providers",
+        )
 
     @with_logging
-    def create_liquidity_providers(self, num: int):
-        for i in range(num):
-            lp = self.blockchain.create_user(name=f"LP_{i}")
+    def create_block_producers(
+        self, num: int, balances: dict[Token, Balance] | None = None, bulk: bool = False
+    ):
+        self._create_agents(
+            "block_producers",
+            num,
+            "BP_",
+            BlockProducer,
+            10000,
+            balances,
+            bulk,
+            "block_producers",
+        )
 
-            for token in self.blockchain.tokens.values():
-                lp.add_to_wallet(token=token, amount=50000)
+    def _create_agents(
+        self,
+        population: str,
+        num: int,
+        name_prefix: str,
+        kind: type[User],
+        amount: float,
+        balances: dict[Token, Balance] | None,
+        bulk: bool,
+        group: str,
+    ):
+        """
+        Creates agents of a population, with `amount` of every token unless
+        `balances` are given.
 
-            self.liquidity_providers.append(lp)
+        Args:
+            population (str): The simulator attribute listing the agents.
+            num (int): The number of agents.
+            name_prefix (str): The prefix of the agents' names.
+            kind (type[User]): The type of the agents.
+            amount (float): The default balance of every token.
+            balances (dict[Token, Balance] | None): The balance of each
+                token: one amount for every agent, an amount per agent, or a
+                function drawing `num` amounts.
+            bulk (bool): Whether to allocate the agents at once as a
+                `Population`, whose users are only created when accessed.
+            group (str): The ledger group of the agents.
+        """
+        if balances is None:
+            balances = {token: amount for token in self.blockchain.tokens.values()}
 
-    @with_logging
-    def create_block_producers(self, num: int):
+        if bulk:
+            if getattr(self, population):
+                raise ValueError(
+                    f"Bulk {population} must be created before any other {population}"
+                )
+
+            agents = self.blockchain.create_population(num, name_prefix, kind, balances)
+            setattr(self, population, agents)
+            self.blockchain.ledger.assign_group(agents.ids, group)
+            return
+
+        columns = [
+            (
+                token,
+                (
+                    amounts(num)
+                    if callable(amounts)
+                    else np.broadcast_to(np.asarray(amounts, dtype=float), (num,))
+                ).tolist(),
+            )
+            for token, amounts in balances.items()
+        ]
+
+        agents = getattr(self, population)
+        if not isinstance(agents, list):
+            raise ValueError(f"Cannot add {population} to a bulk population")
+
+        create = (
+            self.blockchain.create_block_producer
+            if issubclass(kind, BlockProducer)
+            else self.blockchain.create_user
+        )
         for i in range(num):
-            bp = self.blockchain.create_block_producer(name=f"BP_{i}")
+            agent = create(name=f"{name_prefix}{i}")
+
+            for token, amounts in columns:
+                agent.add_to_wallet(token=token, amount=amounts[i])
+
+            agents.append(agent)
 
-            for token in self.blockchain.tokens.values():
-                bp.add_to_wallet(token=token, amount=10000)
+        self.blockchain.ledger.assign_group([agent.user_id for agent in agents], group)
 
-            self.block_producers.append(bp)
+    def run(self, epochs: list[Epoch], verbose: bool = False) -> dict | None:
+        """
+        Runs the epochs, resuming after the last checkpointed block if the
+        simulator was restored from a checkpoint.
 
-    def run(self, epochs: list[Epoch], verbose: bool = False):
-        epoch_num = 0
+        Returns:
+            dict | None: The profiler report, if a profiler is attached.
+        """
+        epoch_num = self.epoch_index
         if verbose:
             self.print_snapshot(epoch_num)
 
-        for epoch in epochs:
+        for epoch in epochs[self.epoch_index :]:
             self.run_epoch(epoch)
 
             epoch_num += 1
@@ -70,40 +325,362 @@ class Simulator:
             if verbose:
                 self.print_snapshot(epoch_num)
 
+        self.epoch_index = 0
+
+        return None if self.profiler is None else self.profiler.report()
+
     @with_logging
     def run_epoch(self, epoch: Epoch):
-        prev_percents = {}
-        for _ in range(epoch.num_blocks):
-            for token, value in epoch.oracle.items():
-                prev_percent = prev_percents.get(token, 0.0)
-                random_percent = adjust_random_percent(
-                    prev_percent, max_percent=0.05, change_limit=0.01
-                )
-                prev_percents[token] = random_percent
-                token.value = value * (1 + random_percent)
+        if self._prices is None:
+            self._prices = epoch.price_path(self.rng)
 
-            UserAgent.simulate_user_actions(
-                self.users, self.blockchain.contracts["UniswapV2"], self.blockchain
-            )
+        if self.arrival_rates is None:
+            for block in range(self.block_index, epoch.num_blocks):
+                self._run_block(epoch, block)
+        else:
+            self._run_events(epoch)
+
+        self.epoch_index += 1
+        self.block_index = 0
+        self._prices = None
+
+    def _run_events(self, epoch: Epoch):
+        """
+        Runs an epoch from the arrivals of the event scheduler, only
+        materializing blocks where agents arrive, transactions are pending or
+        a sample or checkpoint is due. The blocks in between are recorded
+        empty in one step, and the prices jump to the next materialized block.
+        """
+        if epoch.trades is not None:
+            raise ValueError("Trade traces cannot be replayed from arrivals")
+
+        scheduler = self._get_scheduler()
+        blockchain = self.blockchain
+
+        block = self.block_index
+        while block < epoch.num_blocks:
+            height = blockchain.block_number
+
+            stop = epoch.num_blocks
+            if len(blockchain.mempool):
+                stop = block
+            next_block = scheduler.next_block()
+            if next_block is not None:
+                stop = min(stop, block + max(next_block - height, 0))
+            for every in (self.sample_every, self.checkpoint_every):
+                if every:
+                    stop = min(stop, block + every - 1 - height % every)
 
-            # LiquidityProviderAgent.simulate_lp_actions(
-            #     self.liquidity_providers,
-            #     self.blockchain.contracts["UniswapV2"],
-            #     self.blockchain,
-            # )
+            if stop > block:
+                blockchain.skip_blocks(stop - block)
+                block = self.block_index = stop
+                if block == epoch.num_blocks:
+                    break
 
+            self._run_block(epoch, block, scheduler.pop_block(blockchain.block_number))
+            block += 1
+
+    def _run_block(
+        self, epoch: Epoch, block: int, arrivals: dict[str, list] | None = None
+    ):
+        """
+        Runs a block of an epoch.
+
+        Args:
+            epoch (Epoch): The running epoch.
+            block (int): The index of the block in the epoch.
+            arrivals (dict[str, list] | None): The agents arriving in the
+                block, by population, or None for every agent to act.
+        """
+        profiler = self.profiler
+        timer = null_timer if profiler is None else profiler.timer
+        agent = "UserAgent" if epoch.trades is None else "TradeTrace"
+
+        if arrivals is None:
+            users, liquidity_providers = self.users, self.liquidity_providers
+        else:
+            users = arrivals.get("users", [])
+            liquidity_providers = arrivals.get("liquidity_providers", [])
+
+        if profiler is not None:
+            profiler.begin_block(self.blockchain.block_number)
+
+        with timer("phase", "oracle"):
+            changed = []
+            for token, value in zip(epoch.oracle, self._prices[block].tolist()):
+                if token.value != value:
+                    token.value = value
+                    changed.append(token)
+            self._update_lp_token_values(changed)
+
+        with timer("phase", "agents"), timer("agent", agent):
+            if epoch.trades is not None:
+                epoch.trades.simulate_block(
+                    block,
+                    users,
+                    self.blockchain.contracts["UniswapV2"],
+                    self.blockchain,
+                )
+            elif self.user_mode == "population":
+                UserAgent.simulate_population_actions(
+                    users,
+                    self.blockchain.contracts["UniswapV2"],
+                    self.blockchain,
+                    self.rng,
+                    self.gas_fee,
+                )
+            else:
+                UserAgent.simulate_user_actions(
+                    users,
+                    self.blockchain.contracts["UniswapV2"],
+                    self.blockchain,
+                    self.gas_fee,
+                )
+
+            if liquidity_providers:
+                with timer("agent", "LiquidityProviderAgent"):
+                    LiquidityProviderAgent.simulate_lp_actions(
+                        liquidity_providers,
+                        self.blockchain.contracts["UniswapV2"],
+                        self.blockchain,
+                        gas_fee=self.gas_fee,
+                    )
+
+        with timer("phase", "block_production"), timer("agent", "BlockProducerAgent"):
             BlockProducerAgent.simulate_bp_actions(
                 self.block_producers,
                 self.blockchain.contracts["UniswapV2"],
                 self.blockchain,
             )
 
+        if profiler is not None:
+            profiler.end_block()
+
+        self.block_index = block + 1
+        if self.sample_every and self.blockchain.block_number % self.sample_every == 0:
+            self.samples.append(
+                {"block": self.blockchain.block_number, **self.get_snapshot()}
+            )
+
+        if (
+            self.checkpoint_every
+            and self.blockchain.block_number % self.checkpoint_every == 0
+        ):
+            self.save_checkpoint(self.checkpoint_path)
+
+    def _get_scheduler(self) -> EventScheduler:
+        if self.scheduler is None:
+            # A restored simulator resumes the arrivals it had drawn.
+            restoring = self._arrivals is not None
+
+            self.scheduler = EventScheduler(self.rng)
+            for name in ARRIVAL_POPULATIONS:
+                self.scheduler.register(
+                    ArrivalProcess(
+                        name, getattr(self, name), self.arrival_rates.get(name, 0.0)
+                    ),
+                    self.blockchain.block_number,
+                    schedule=not restoring,
+                )
+
+            if restoring:
+                self.scheduler.set_state(self._arrivals)
+                self._arrivals = None
+
+        return self.scheduler
+
+    def save_checkpoint(self, path: str):
+        """
+        Writes the blockchain, the simulated populations, the random
+        generators and the progress through the running epoch to a
+        checkpoint directory.
+
+        The checkpoint is written next to `path` and moved into place once
+        complete, so a crash never leaves a partial checkpoint behind.
+
+        Args:
+            path (str): The checkpoint directory.
+        """
+        staging = f"{path}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+
+        save_blockchain(self.blockchain, staging)
+
+        for name, population in (
+            ("users", self.users),
+            ("liquidity_providers", self.liquidity_providers),
+            ("block_producers", self.block_producers),
+        ):
+            np.save(
+                os.path.join(staging, f"simulator_{name}.npy"),
+                (
+                    population.user_ids
+                    if isinstance(population, Population)
+                    else np.array([user.user_id for user in population], dtype=np.int64)
+                ),
+            )
+
+        if self._prices is not None:
+            np.save(os.path.join(staging, "epoch_prices.npy"), self._prices)
+
+        version, state, gauss = random.getstate()
+        meta = {
+            "rng": self.rng.bit_generator.state,
+            "random": [version, list(state), gauss],
+            "epoch_index": self.epoch_index,
+            "block_index": self.block_index,
+            "checkpoint_every": self.checkpoint_every,
+            "user_mode": self.user_mode,
+            "arrival_rates": self.arrival_rates,
+            "gas_fee": self.gas_fee,
+            "arrivals": (
+                None if self.scheduler is None else self.scheduler.get_state()
+            ),
+            # The bulk populations, as indices into the blockchain's.
+            "populations": {
+                name: self.blockchain.populations.index(population)
+                for name in ("users", "liquidity_providers", "block_producers")
+                if isinstance(population := getattr(self, name), Population)
+            },
+        }
+        with open(
+            os.path.join(staging, "simulator.json"), "w", encoding="utf-8"
+        ) as file:
+            json.dump(meta, file)
+
+        replace_directory(staging, path)
+
+    @classmethod
+    def load_checkpoint(cls, path: str, mmap: bool = True) -> "Simulator":
+        """
+        Restores a simulator and its blockchain from a checkpoint directory.
+
+        Running the same epochs, bound to the restored tokens with
+        `Epoch.bind`, continues from the block after the checkpoint. The
+        global `random` state is restored too, since the agents draw from it.
+
+        Args:
+            path (str): The checkpoint directory, as written by `save_checkpoint`.
+            mmap (bool): Whether to memory-map the ledger tables.
+
+        Returns:
+            Simulator: The restored simulator, checkpointing to `path`.
+        """
+        blockchain = load_blockchain(path, mmap)
+
+        with open(os.path.join(path, "simulator.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+
+        simulator = cls(
+            blockchain,
+            checkpoint_path=path,
+            checkpoint_every=meta["checkpoint_every"],
+            user_mode=meta.get("user_mode", "individual"),
+            arrival_rates=meta.get("arrival_rates"),
+            gas_fee=meta.get("gas_fee"),
+        )
+        simulator._arrivals = meta.get("arrivals")
+        simulator.rng.bit_generator.state = meta["rng"]
+
+        version, state, gauss = meta["random"]
+        random.setstate((version, tuple(state), gauss))
+
+        populations = meta.get("populations", {})
+        for name in ("users", "liquidity_providers", "block_producers"):
+            if name in populations:
+                setattr(simulator, name, blockchain.populations[populations[name]])
+                continue
+
+            user_ids = np.load(os.path.join(path, f"simulator_{name}.npy"))
+            setattr(
+                simulator,
+                name,
+                [blockchain.get_user(user_id) for user_id in user_ids.tolist()],
+            )
+
+        simulator.epoch_index = meta["epoch_index"]
+        simulator.block_index = meta["block_index"]
+        if os.path.exists(os.path.join(path, "epoch_prices.npy")):
+            simulator._prices = np.load(os.path.join(path, "epoch_prices.npy"))
+
+        return simulator
+
     def get_users_total_value(self) -> float:
-        total_value = 0
-        for user in self.users:
-            total_value += user.total_value
+        return self.blockchain.ledger.group_value("users")
+
+    def get_snapshot(self) -> dict[str, float]:
+        """
+        Returns the summary metrics of the current state, keyed by metric name.
+        """
+        self._update_lp_token_values()
+
+        ledger = self.blockchain.ledger
+        snapshot = {
+            "user_total_value": self.get_users_total_value(),
+            "liquidity_provider_total_value": ledger.group_value("liquidity_providers"),
+            "block_producer_total_value": ledger.group_value("block_producers"),
+        }
+
+        uniswap_v2: UniswapV2 = self.blockchain.contracts["UniswapV2"]  # type: ignore
+
+        for pool in uniswap_v2.get_pools():
+            for token, reserve in pool.token_reserve.items():
+                snapshot[f"{pool.pair_name} {token.name} reserve"] = reserve
+            snapshot[f"{pool.pair_name} tvl"] = pool.total_value_locked
+            snapshot[f"{pool.pair_name} share value"] = pool.share_value
+
+        return snapshot
+
+    def _update_lp_token_values(self, tokens: list[Token] | None = None):
+        """
+        Prices the pools' share tokens at the value of the reserves backing
+        them, so the ledger values liquidity providers' positions.
+
+        Only the pools whose reserves changed since they were last priced,
+        and the pools of `tokens`, whose values changed, are priced again.
+
+        Args:
+            tokens (list[Token] | None): The tokens whose values changed
+                since the last call, or None to price every pool again.
+        """
+        contracts = [
+            contract
+            for contract in self.blockchain.contracts.values()
+            if isinstance(contract, AmmProtocol)
+        ]
+        num_pools = sum(len(contract.pools) for contract in contracts)
+        if tokens is None or num_pools != self._num_pools:
+            # Pools are only ever added, so the pool lists are rebuilt when
+            # their number changes.
+            self._num_pools = num_pools
+            self._lp_pools = [
+                pool
+                for contract in contracts
+                for pool in contract.pools.values()
+                if pool.lp_token is not None
+            ]
+            self._lp_versions = [-1] * len(self._lp_pools)
+            self._lp_pool_indices = {}
+            for index, pool in enumerate(self._lp_pools):
+                for token in pool.token_reserve:
+                    self._lp_pool_indices.setdefault(token.name, []).append(index)
+
+        versions = self._lp_versions
+        stale = {
+            index
+            for token in tokens or ()
+            for index in self._lp_pool_indices.get(token.name, ())
+        }
+        stale.update(
+            index
+            for index, pool in enumerate(self._lp_pools)
+            if pool.version != versions[index]
+        )
 
-        return total_value
+        for index in stale:
+            pool = self._lp_pools[index]
+            pool.lp_token.value = pool.share_value  # type: ignore
+            versions[index] = pool.version
 
     def print_snapshot(self, epoch_num: int):
         print("-" * 80)
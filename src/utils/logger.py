@@ -1,3 +1,8 @@
+import atexit
+import queue
+import threading
+import time
+from collections import Counter
 from functools import wraps
 from typing import Any, Callable
 
@@ -14,6 +19,196 @@ logger.add(
     diagnose=True,
 )
 
+LEVELS = {
+    "TRACE": 5,
+    "DEBUG": 10,
+    "INFO": 20,
+    "SUCCESS": 25,
+    "WARNING": 30,
+    "ERROR": 40,
+    "CRITICAL": 50,
+}
+
+
+class EventLogger:
+    """
+    Represents a structured event log written by a background thread.
+
+    Events are a name and keyword fields. Callers only check the level and
+    enqueue the raw fields; formatting and writing to the loguru sinks happen
+    on the writer thread. The queue is bounded and never blocks: events that
+    do not fit are dropped and counted.
+
+    Failures are counted by error type before any gating. Their log records
+    are rate limited per (event, error type): the first `burst` in every
+    `window` seconds are written, then one in `sample_every`, each carrying
+    the number of records suppressed since the last one written.
+
+    Attributes:
+        level (str): The minimum level of the written events.
+        failures (Counter[str]): The number of failures by error type.
+        dropped (int): The number of events dropped because the queue was full.
+    """
+
+    def __init__(
+        self,
+        level: str = "INFO",
+        max_queue: int = 10000,
+        burst: int = 10,
+        window: float = 1.0,
+        sample_every: int = 1000,
+    ):
+        """
+        Initializes the event logger. The writer thread starts with the first
+        event.
+
+        Args:
+            level (str): The minimum level of the written events.
+            max_queue (int): The number of events that may wait for the writer.
+            burst (int): The number of failures of a kind written per window.
+            window (float): The length of a rate limiting window in seconds.
+            sample_every (int): The sampling interval of failures past the burst.
+        """
+        self.level = level
+        self.burst = burst
+        self.window = window
+        self.sample_every = sample_every
+
+        self.failures: Counter[str] = Counter()
+        self.dropped = 0
+
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._windows: dict[tuple[str, str], list] = {}
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._records: list | None = None
+
+    def __repr__(self) -> str:
+        return f"EventLogger(level={self.level!r}, failures={sum(self.failures.values())}, dropped={self.dropped})"
+
+    @property
+    def level(self) -> str:
+        return self._level
+
+    @level.setter
+    def level(self, level: str) -> None:
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level {level!r}, expected one of {list(LEVELS)}")
+
+        self._level = level
+        self._level_no = LEVELS[level]
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self._level_no
+
+    def log(self, level: str, event: str, **fields: Any) -> None:
+        """
+        Enqueues an event if its level is enabled.
+
+        Args:
+            level (str): The level of the event.
+            event (str): The name of the event.
+            fields (Any): The fields of the event, formatted by the writer.
+        """
+        if LEVELS[level] >= self._level_no:
+            self._put(level, event, fields)
+
+    def failure(
+        self, error: BaseException, event: str = "failure", **fields: Any
+    ) -> None:
+        """
+        Counts a failure by error type and enqueues a rate-limited WARNING event.
+
+        Args:
+            error (BaseException): The error that caused the failure.
+            event (str): The name of the event.
+            fields (Any): The fields of the event, formatted by the writer.
+        """
+        if self._records is not None:
+            self._records.append((error, event, fields))
+            return
+
+        error_type = type(error).__name__
+
+        # Failures may be reported from several threads at once.
+        with self._lock:
+            self.failures[error_type] += 1
+
+            if LEVELS["WARNING"] < self._level_no:
+                return
+
+            now = time.monotonic()
+            window = self._windows.get((event, error_type))
+            if window is None or now - window[0] >= self.window:
+                suppressed = 0 if window is None else window[2]
+                window = self._windows[(event, error_type)] = [now, 0, suppressed]
+
+            window[1] += 1
+            if window[1] > self.burst and (window[1] - self.burst) % self.sample_every:
+                window[2] += 1
+                return
+
+            if window[2]:
+                fields["suppressed"] = window[2]
+                window[2] = 0
+
+        fields["error"] = error
+        self._put("WARNING", event, fields)
+
+    def record_failures(self, records: list | None) -> None:
+        """
+        Records failures as (error, event, fields) into `records` instead of
+        counting and writing them, so a worker process can hand them to the
+        parent's logger. None stops recording.
+
+        Args:
+            records (list | None): The list to record failures into.
+        """
+        self._records = records
+
+    def flush(self) -> None:
+        """
+        Waits until every enqueued event has been written.
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def _put(self, level: str, event: str, fields: dict[str, Any]) -> None:
+        if self._thread is None:
+            self._start()
+
+        try:
+            self._queue.put_nowait((level, event, fields))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._thread = threading.Thread(
+                target=self._write_events, name="EventLogger", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _write_events(self) -> None:
+        while True:
+            level, event, fields = self._queue.get()
+            try:
+                message = " ".join(
+                    [event, *(f"{name}={value!r}" for name, value in fields.items())]
+                )
+                logger.log(level, message)
+            except Exception:  # pylint: disable=broad-except
+                self.dropped += 1
+            finally:
+                self._queue.task_done()
+
+
+events = EventLogger()
+
 
 def get_logger():
     """
@@ -25,12 +220,40 @@ def get_logger():
     return logger
 
 
+def get_event_logger() -> EventLogger:
+    """
+    Get the shared event logger.
+
+    Returns:
+        EventLogger: The event logger writing to the configured logger.
+    """
+    return events
+
+
+def describe(value: Any) -> str:
+    """
+    Returns a short description of a value for logging: the repr of numbers,
+    strings and None, and the type name and size of anything else.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return repr(value)
+
+    if isinstance(value, str):
+        return repr(value) if len(value) <= 80 else repr(value[:77] + "...")
+
+    if isinstance(value, (list, tuple, dict, set)):
+        return f"<{type(value).__name__}[{len(value)}]>"
+
+    return f"<{type(value).__name__}>"
+
+
 def with_logging(func: Callable) -> Callable:
     """
     Decorator to log the execution of a function.
 
-    Logs the function call with its arguments and keyword arguments,
-    successful execution, and any exceptions that occur.
+    Logs the function call with a short description of its arguments and
+    keyword arguments, its duration and result, and any exceptions that
+    occur, through the event logger.
 
     Args:
         func (Callable): The function to be wrapped by the decorator.
@@ -38,18 +261,39 @@ def with_logging(func: Callable) -> Callable:
     Returns:
         Callable: The wrapped function.
     """
+    name = func.__qualname__
 
     @wraps(func)
     def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not events.enabled("INFO"):
+            return func(*args, **kwargs)
+
+        start = time.perf_counter()
         try:
             # Execute the function
             result = func(*args, **kwargs)
-            # Logging after successful execution
-            logger.info(f"{func.__name__}({args}, {kwargs}): {result}")
-            return result
         except Exception as e:
             # Logging on exception
-            logger.error(f"{func.__name__}({args}, {kwargs}): {e}")
+            events.log(
+                "ERROR",
+                "call_failed",
+                function=name,
+                args=[describe(arg) for arg in args],
+                kwargs={key: describe(value) for key, value in kwargs.items()},
+                error=e,
+            )
             raise
 
+        # Logging after successful execution
+        events.log(
+            "INFO",
+            "call",
+            function=name,
+            args=[describe(arg) for arg in args],
+            kwargs={key: describe(value) for key, value in kwargs.items()},
+            seconds=round(time.perf_counter() - start, 6),
+            result=describe(result),
+        )
+        return result
+
     return wrapper
@@ -0,0 +1,212 @@
+import contextlib
+import cProfile
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+
+
+class Timer:
+    """
+    Represents a reusable context manager adding its elapsed time to one
+    profiler timer.
+    """
+
+    __slots__ = ("profiler", "category", "name", "start")
+
+    def __init__(self, profiler: "Profiler", category: str, name: str):
+        self.profiler = profiler
+        self.category = category
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.profiler.add(self.category, self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    """
+    Collects timers and counters of a simulation run, and optionally samples
+    `cProfile` and `tracemalloc` on every `sample_every`-th block.
+
+    Timers are grouped by category, such as simulation phases ("phase"),
+    agent types ("agent") and contract functions ("function"). Components
+    only report to a profiler when one is attached, so a run without one
+    pays nothing.
+
+    Attributes:
+        sample_every (int | None): The block interval of the samples, or
+            None to disable sampling.
+        sample_cprofile (bool): Whether samples include a `cProfile` of the block.
+        sample_memory (bool): Whether samples include the block's traced
+            memory peak.
+        sample_top (int): The number of functions kept per `cProfile` sample.
+        timers (dict[str, dict[str, list]]): The [seconds, calls] of every
+            timer, by category and name.
+        counters (dict[str, int]): The event counters.
+        samples (list[dict]): The per-block samples.
+    """
+
+    def __init__(
+        self,
+        sample_every: int | None = None,
+        sample_cprofile: bool = True,
+        sample_memory: bool = False,
+        sample_top: int = 20,
+    ):
+        self.sample_every = sample_every
+        self.sample_cprofile = sample_cprofile
+        self.sample_memory = sample_memory
+        self.sample_top = sample_top
+
+        self.timers: dict[str, dict[str, list]] = defaultdict(
+            lambda: defaultdict(lambda: [0.0, 0])
+        )
+        self.counters: dict[str, int] = defaultdict(int)
+        self.samples: list[dict] = []
+
+        self._timers: dict[tuple[str, str], Timer] = {}
+        self._sample: tuple[int, cProfile.Profile | None, bool] | None = None
+        self._start = time.perf_counter()
+
+    def __repr__(self) -> str:
+        return f"Profiler(blocks={self.counters['blocks']}, sample_every={self.sample_every})"
+
+    def timer(self, category: str, name: str) -> Timer:
+        """
+        Returns the context manager timing `name` in `category`.
+        """
+        timer = self._timers.get((category, name))
+        if timer is None:
+            timer = self._timers[(category, name)] = Timer(self, category, name)
+
+        return timer
+
+    def add(self, category: str, name: str, seconds: float, calls: int = 1) -> None:
+        """
+        Adds elapsed time to a timer.
+
+        Args:
+            category (str): The category of the timer.
+            name (str): The name of the timer.
+            seconds (float): The elapsed time.
+            calls (int): The number of calls the time covers.
+        """
+        timer = self.timers[category][name]
+        timer[0] += seconds
+        timer[1] += calls
+
+    def count(self, name: str, num: int = 1) -> None:
+        self.counters[name] += num
+
+    def begin_block(self, block_number: int) -> None:
+        """
+        Starts a block, and its sample if the block is sampled.
+        """
+        self.counters["blocks"] += 1
+
+        if not self.sample_every or block_number % self.sample_every:
+            return
+
+        started_tracing = False
+        if self.sample_memory:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        profile = None
+        if self.sample_cprofile:
+            profile = cProfile.Profile()
+            profile.enable()
+
+        self._sample = (block_number, profile, started_tracing)
+
+    def end_block(self) -> None:
+        """
+        Ends a block, recording its sample if the block is sampled.
+        """
+        if self._sample is None:
+            return
+
+        block_number, profile, started_tracing = self._sample
+        self._sample = None
+        sample: dict = {"block": block_number}
+
+        if profile is not None:
+            profile.disable()
+            sample["profile"] = self._top_functions(profile)
+
+        if self.sample_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            sample["memory"] = {"current": current, "peak": peak}
+            if started_tracing:
+                tracemalloc.stop()
+
+        self.samples.append(sample)
+
+    def report(self) -> dict:
+        """
+        Returns the collected timers, counters and samples.
+
+        Returns:
+            dict: The report, with the wall time since the profiler was
+                created or reset, every timer's total seconds, calls and
+                mean per call by category, the counters and the samples.
+        """
+        return {
+            "wall_seconds": time.perf_counter() - self._start,
+            "timers": {
+                category: {
+                    name: {
+                        "seconds": seconds,
+                        "calls": calls,
+                        "mean": seconds / calls if calls else 0.0,
+                    }
+                    for name, (seconds, calls) in sorted(timers.items())
+                }
+                for category, timers in self.timers.items()
+            },
+            "counters": dict(self.counters),
+            "samples": list(self.samples),
+        }
+
+    def reset(self) -> None:
+        self.timers.clear()
+        self.counters.clear()
+        self.samples = []
+        self._start = time.perf_counter()
+
+    def _top_functions(self, profile: cProfile.Profile) -> list[dict]:
+        stats = pstats.Stats(profile)
+        rows = sorted(
+            stats.stats.items(),  # type: ignore
+            key=lambda item: item[1][3],
+            reverse=True,
+        )
+
+        return [
+            {
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "total_seconds": total,
+                "cumulative_seconds": cumulative,
+            }
+            for (filename, line, name), (_, calls, total, cumulative, _) in rows[
+                : self.sample_top
+            ]
+        ]
+
+
+NULL_TIMER = contextlib.nullcontext()
+
+
+def null_timer(category: str, name: str) -> contextlib.nullcontext:
+    """
+    Stands in for `Profiler.timer` when no profiler is attached.
+    """
+    return NULL_TIMER
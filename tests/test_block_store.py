@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from core.transaction import CompiledTransaction, Transaction
+
+
+def _blockchain(retention: str = "all", keep_last: int | None = None) -> Blockchain:
+    blockchain = Blockchain(retention=retention, keep_last=keep_last)
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    blockchain.create_contract(UniswapV2()).create_pool(
+        usdc, eth, 0.003, 3_000_000, 1000
+    )
+    for name in ("Alice", "Bob"):
+        blockchain.create_user(name).add_to_wallet(usdc, 1000.0)
+
+    return blockchain
+
+
+def _swap(blockchain: Blockchain, name: str, amount_in: float, gas_fee=None):
+    sender = next(user for user in blockchain.users.values() if user.name == name)
+    return Transaction(
+        sender,
+        blockchain.contracts["UniswapV2"],
+        "swap",
+        {
+            "token_in": blockchain.tokens["USDC"],
+            "amount_in": amount_in,
+            "token_out": blockchain.tokens["ETH"],
+        },
+        gas_fee,
+    )
+
+
+def _add_block(blockchain: Blockchain, transactions: list) -> None:
+    blockchain.add_transactions(transactions)
+    blockchain.create_block()
+
+
+def test_blocks_are_rebuilt_from_their_rows():
+    blockchain = _blockchain()
+    uniswap_v2 = blockchain.contracts["UniswapV2"]
+    alice = next(iter(blockchain.users.values()))
+    compiled = CompiledTransaction(
+        alice,
+        uniswap_v2,
+        uniswap_v2.opcode("swap"),
+        (blockchain.tokens["USDC"], blockchain.tokens["ETH"], 5.0),
+    )
+    # Arguments that do not fit the row layout are kept as the object.
+    odd = Transaction(alice, uniswap_v2, "swap", {"token_in": "USDC"})
+    transactions = [_swap(blockchain, "Alice", 10.0, 0.5), compiled, odd]
+    _add_block(blockchain, transactions)
+    _add_block(blockchain, [_swap(blockchain, "Bob", 2000.0)])
+
+    first, second = blockchain.blocks[0], blockchain.blocks[1]
+    assert first.transactions[0] == transactions[0]
+    assert first.transactions[1].args == compiled.args
+    assert first.transactions[1].function == "swap"
+    assert first.transactions[2] is odd
+    assert first.statuses == [True, True, False]
+    assert second.statuses == [False]
+    assert second.transactions[0].sender.name == "Bob"
+    assert blockchain.blocks[-1].block_number == 1
+    assert blockchain.blocks.num_transactions.tolist() == [3, 1]
+    assert blockchain.blocks.num_failed.tolist() == [1, 1]
+
+
+def test_last_retention_keeps_only_recent_rows():
+    blockchain = _blockchain("last", keep_last=2)
+    for amount in (1.0, 2.0, 3.0, 4.0):
+        _add_block(blockchain, [_swap(blockchain, "Alice", amount)] * 2)
+    blockchain.skip_blocks(1)
+
+    assert len(blockchain.blocks) == 5
+    assert blockchain.blocks.num_transactions.tolist() == [2, 2, 2, 2, 0]
+    with pytest.raises(IndexError, match="no longer retained"):
+        blockchain.blocks[2]
+    assert blockchain.blocks[3].transactions[0].args["amount_in"] == 4.0
+    assert blockchain.blocks[4].transactions == []
+    np.testing.assert_array_equal(blockchain.blocks.columns["amount_a"], [4.0, 4.0])
+    assert [block.block_number for block in blockchain.blocks] == [3, 4]
+
+
+def test_summary_retention_keeps_only_counts():
+    blockchain = _blockchain("summary")
+    _add_block(
+        blockchain, [_swap(blockchain, "Alice", 1.0), _swap(blockchain, "Bob", 5e3)]
+    )
+
+    assert blockchain.blocks.num_failed.tolist() == [1]
+    assert len(blockchain.blocks.columns["sender"]) == 0
+    with pytest.raises(IndexError):
+        blockchain.blocks[0]
+
+
+def test_rows_grow_past_their_capacity():
+    blockchain = _blockchain()
+    for _ in range(3):
+        _add_block(blockchain, [_swap(blockchain, "Alice", 0.1)] * 700)
+
+    assert blockchain.blocks.num_transactions.tolist() == [700] * 3
+    assert len(blockchain.blocks[2].transactions) == 700
+    assert len(blockchain.blocks.columns["block"]) == 2100
+
+
+def test_rejects_unknown_retention():
+    with pytest.raises(ValueError, match="retention"):
+        Blockchain(retention="recent")
+    with pytest.raises(ValueError, match="keep_last"):
+        Blockchain(retention="last")
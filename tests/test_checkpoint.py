@@ -0,0 +1,252 @@
+import itertools
+import random
+
+import numpy as np
+
+from contracts.uniswap_v2 import UniswapV2
+from contracts.uniswap_v3 import UniswapV3
+from core.blockchain import Blockchain
+from core.checkpoint import load_blockchain, save_blockchain
+from core.transaction import Transaction
+from market.actors.user import User
+from simulation.simulator import Epoch, Simulator
+
+
+def _pool_state(blockchain: Blockchain) -> list:
+    return [
+        (
+            list(pool.token_reserve.values()),
+            pool.sqrt_price,
+            pool.tick,
+            pool.liquidity,
+            list(pool.fee_growth_global),
+            {
+                tick: (
+                    info.liquidity_gross,
+                    info.liquidity_net,
+                    list(info.fee_growth_outside),
+                )
+                for tick, info in pool.ticks.items()
+            },
+            pool.bitmap.words,
+            {
+                key: (
+                    position.liquidity,
+                    list(position.fee_growth_inside_last),
+                    list(position.tokens_owed),
+                )
+                for key, position in pool.positions.items()
+            },
+        )
+        for pool in blockchain.contracts["UniswapV3"].get_pools()
+    ]
+
+
+def _v2_state(blockchain: Blockchain) -> list:
+    return [
+        (
+            list(pool.token_reserve.values()),
+            list(pool.fee_per_share.values()),
+            pool.total_shares,
+            {
+                address: (position.shares, list(position.fees_earned.values()))
+                for address, position in pool.lp_positions.items()
+            },
+        )
+        for pool in blockchain.contracts["UniswapV2"].get_pools()
+    ]
+
+
+def test_uniswap_v2_round_trip(tmp_path):
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    uniswap_v2.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+
+    provider = blockchain.create_user("Provider")
+    provider.add_to_wallet(usdc, 30_000)
+    provider.add_to_wallet(eth, 10)
+    population = blockchain.create_population(
+        1000, balances={usdc: 1000.0, eth: np.linspace(0.1, 1, 1000)}
+    )
+    producer = blockchain.create_block_producer("Producer")
+
+    blockchain.add_transaction(
+        Transaction(
+            provider,
+            uniswap_v2,
+            "add_liquidity",
+            {"token_1": usdc, "amount_1": 30_000, "token_2": eth, "amount_2": 10},
+        )
+    )
+    for i in range(0, 1000, 7):
+        blockchain.add_transaction(
+            Transaction(
+                population[i],
+                uniswap_v2,
+                "swap",
+                {"token_in": usdc, "amount_in": 10.0 + i, "token_out": eth},
+                gas_fee=0.01,
+            )
+        )
+    blockchain.max_block_transactions = 100
+    blockchain.create_block(producer)
+    assert len(blockchain.mempool) > 0
+
+    save_blockchain(blockchain, str(tmp_path))
+    restored = load_blockchain(str(tmp_path))
+
+    assert _v2_state(restored) == _v2_state(blockchain)
+    assert [transaction.sender.name for transaction in restored.mempool] == [
+        transaction.sender.name for transaction in blockchain.mempool
+    ]
+    assert restored.populations[0].ids == population.ids
+    assert restored.get_user(producer.user_id).balance == producer.balance
+
+    for chain in (blockchain, restored):
+        chain.create_block()
+    assert _v2_state(restored) == _v2_state(blockchain)
+    np.testing.assert_array_equal(restored.ledger.balances, blockchain.ledger.balances)
+    assert restored.blocks.num_transactions.tolist() == (
+        blockchain.blocks.num_transactions.tolist()
+    )
+
+
+def _user(blockchain: Blockchain, name: str) -> User:
+    # Restored users are held in populations.
+    users = itertools.chain(blockchain.users.values(), *blockchain.populations)
+    return next(user for user in users if user.name == name)
+
+
+def _send(blockchain: Blockchain, name: str, function: str, **args) -> None:
+    sender = _user(blockchain, name)
+    blockchain.add_transaction(
+        Transaction(sender, blockchain.contracts["UniswapV3"], function, args)
+    )
+
+
+def _usdc_eth(blockchain: Blockchain) -> dict:
+    return {"token_1": blockchain.tokens["USDC"], "token_2": blockchain.tokens["ETH"]}
+
+
+def _swap(blockchain: Blockchain, name: str, token_in: str, amount_in: float):
+    token_out = "ETH" if token_in == "USDC" else "USDC"
+    _send(
+        blockchain,
+        name,
+        "swap",
+        token_in=blockchain.tokens[token_in],
+        token_out=blockchain.tokens[token_out],
+        amount_in=amount_in,
+    )
+
+
+def test_uniswap_v3_round_trip(tmp_path):
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    uniswap_v3 = blockchain.create_contract(UniswapV3())
+    uniswap_v3.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+
+    for name in ("Alice", "Bob"):
+        user = blockchain.create_user(name)
+        user.add_to_wallet(usdc, 1_000_000)
+        user.add_to_wallet(eth, 1000)
+
+    # A narrow range around the price of -80067, which the swaps cross.
+    _send(
+        blockchain,
+        "Alice",
+        "mint",
+        **_usdc_eth(blockchain),
+        tick_lower=-80100,
+        tick_upper=-80040,
+        liquidity=1e6,
+    )
+    blockchain.create_block()
+    _swap(blockchain, "Bob", "USDC", 200_000)
+    blockchain.create_block()
+    assert blockchain.blocks.num_failed.sum() == 0
+    assert not -80100 <= uniswap_v3.get_pools()[0].tick < -80040
+
+    save_blockchain(blockchain, str(tmp_path))
+    restored = load_blockchain(str(tmp_path))
+    assert _pool_state(restored) == _pool_state(blockchain)
+
+    for chain in (blockchain, restored):
+        _swap(chain, "Bob", "ETH", 100)
+        _send(
+            chain,
+            "Alice",
+            "collect",
+            **_usdc_eth(chain),
+            tick_lower=-80100,
+            tick_upper=-80040,
+        )
+        chain.create_block()
+
+    assert _pool_state(restored) == _pool_state(blockchain)
+    np.testing.assert_array_equal(restored.ledger.balances, blockchain.ledger.balances)
+    assert restored.blocks.num_failed.sum() == 0
+
+
+def test_restored_users_are_created_lazily(tmp_path):
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    users = [blockchain.create_user(f"U{i}") for i in range(300)]
+    for user in users[::3]:
+        user.add_to_wallet(usdc, 5.0)
+    producer = blockchain.create_block_producer("Producer")
+    producer.balance = 2.5
+    blockchain.create_population(100, balances={usdc: 1.0})
+
+    save_blockchain(blockchain, str(tmp_path))
+    restored = load_blockchain(str(tmp_path))
+
+    assert isinstance(restored.ledger._balances, np.memmap)
+    np.testing.assert_array_equal(restored.ledger.balances, blockchain.ledger.balances)
+    assert restored.users == {}
+    assert [len(population) for population in restored.populations] == [100, 300, 1]
+    # Only the block producer with a balance outside the ledger was created.
+    assert [len(population.created) for population in restored.populations] == [
+        0,
+        0,
+        1,
+    ]
+
+    user = restored.get_user(users[6].user_id)
+    assert (user.name, user.address) == (users[6].name, users[6].address)
+    assert user.wallet[usdc] == 5.0
+    assert restored.get_user(producer.user_id).balance == 2.5
+    assert len(restored.populations[1].created) == 1
+
+
+def test_simulator_resumes_from_a_checkpoint(tmp_path):
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    blockchain.create_contract(UniswapV2()).create_pool(
+        usdc, eth, 0.003, 3_000_000, 1000
+    )
+    simulator = Simulator(blockchain, seed=0)
+    simulator.create_users(50)
+    simulator.create_block_producers(1)
+    epoch = Epoch(3, {usdc: 1.0, eth: 3000.0}, seed=0)
+    simulator.run_epoch(epoch)
+
+    simulator.save_checkpoint(str(tmp_path / "checkpoint"))
+    restored = Simulator.load_checkpoint(str(tmp_path / "checkpoint"))
+
+    assert [user.name for user in restored.users] == [
+        user.name for user in simulator.users
+    ]
+    assert restored.block_producers[0].balance == simulator.block_producers[0].balance
+    # Both simulators draw from the global generator the checkpoint restored.
+    state = random.getstate()
+    simulator.run_epoch(epoch)
+    random.setstate(state)
+    restored.run_epoch(epoch.bind(restored.blockchain.tokens))
+    np.testing.assert_array_equal(
+        restored.blockchain.ledger.balances, blockchain.ledger.balances
+    )
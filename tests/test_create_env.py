@@ -0,0 +1,100 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from simulation import create_env
+from simulation.create_env import load_scenario
+
+SCENARIO = """\
+tokens:
+  - {name: USDC, value: 1}
+  - {name: ETH, value: 3000}
+users:
+  - name: Alice
+    tokens: [{name: USDC, amount: 5}]
+  - file: users.csv
+contracts:
+  - name: UniswapV2
+    pools:
+      - {tokens: [USDC, ETH], amounts: [3000000, 1000], fee: 0.003}
+"""
+
+
+@pytest.fixture
+def scenario(tmp_path) -> str:
+    (tmp_path / "users.csv").write_text(
+        "name,USDC,ETH\n" + "".join(f"U{i},{i},{2 * i}\n" for i in range(100))
+    )
+    path = tmp_path / "scenario.yaml"
+    path.write_text(SCENARIO)
+
+    return str(path)
+
+
+def test_concurrent_loads_into_cold_cache(scenario, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    expected = np.array(load_scenario(scenario).user_balances)
+
+    # Every loader misses the cache before any of them writes its entry.
+    loaders = 8
+    barrier = threading.Barrier(loaders)
+    parse_scenario = create_env.parse_scenario
+
+    def parse_together(*args):
+        spec = parse_scenario(*args)
+        barrier.wait()
+        return spec
+
+    monkeypatch.setattr(create_env, "parse_scenario", parse_together)
+
+    with ThreadPoolExecutor(max_workers=loaders) as executor:
+        results = list(
+            executor.map(
+                lambda _: np.array(load_scenario(scenario, cache_dir).user_balances),
+                range(loaders),
+            )
+        )
+
+    for balances in results:
+        np.testing.assert_array_equal(balances, expected)
+    # Only the entry is left, without the copies of the processes that lost.
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_changed_user_file_replaces_entry(scenario, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    load_scenario(scenario, cache_dir)
+
+    (tmp_path / "users.csv").write_text("name,USDC,ETH\nV,7,8\n")
+    spec = load_scenario(scenario, cache_dir)
+
+    assert list(spec.user_names) == ["Alice", "V"]
+    assert list(load_scenario(scenario, cache_dir).user_names) == ["Alice", "V"]
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_cache_hit_skips_parsing(scenario, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    parsed = load_scenario(scenario, cache_dir)
+
+    def fail(*args):
+        raise AssertionError("The scenario was parsed again")
+
+    monkeypatch.setattr(create_env, "parse_scenario", fail)
+    cached = load_scenario(scenario, cache_dir)
+
+    assert cached.tokens == parsed.tokens
+    assert cached.contracts == parsed.contracts
+    np.testing.assert_array_equal(cached.user_names, parsed.user_names)
+    np.testing.assert_array_equal(cached.user_balances, parsed.user_balances)
+
+    # Building from the cached scenario gives the same blockchain.
+    blockchain = create_env.build_blockchain(cached)
+    expected = create_env.build_blockchain(parsed)
+    np.testing.assert_array_equal(blockchain.ledger.balances, expected.ledger.balances)
+    assert [user.name for user in blockchain.users.values()] == [
+        user.name for user in expected.users.values()
+    ]
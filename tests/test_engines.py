@@ -0,0 +1,250 @@
+import random
+
+import numpy as np
+import pytest
+
+from contracts.amm_protocol import LiquidityPool
+from contracts.uniswap_v2 import UniswapV2
+from core import parallel
+from core.blockchain import Blockchain
+from core.transaction import CompiledTransaction, Transaction
+from market.token import Token
+from utils.logger import events
+
+NUM_TOKENS = 6
+NUM_USERS = 50
+NUM_TRANSACTIONS = 3000
+
+
+def _run(engine: str, max_workers: int | None = None):
+    rng = random.Random(0)
+    blockchain = Blockchain(engine=engine, max_workers=max_workers)
+    tokens = [blockchain.create_token(f"T{i}", 1.0 + i) for i in range(NUM_TOKENS)]
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    uniswap_v2.create_pools(
+        (tokens[i], tokens[i + 1], 0.003, 1e5, 1e5 / (1 + i))
+        for i in range(NUM_TOKENS - 1)
+    )
+    users = [blockchain.create_user(f"User_{i}") for i in range(NUM_USERS)]
+    for user in users:
+        for token in rng.sample(tokens, NUM_TOKENS // 2):
+            user.add_to_wallet(token, 1000.0)
+    blockchain.ledger.assign_group(
+        [user.user_id for user in users[: NUM_USERS // 2]], "half"
+    )
+
+    swap = uniswap_v2.opcode("swap")
+    for _ in range(NUM_TRANSACTIONS):
+        user = rng.choice(users)
+        i = rng.randrange(NUM_TOKENS - 1)
+        token_in, token_out = tokens[i], tokens[i + 1]
+        if rng.random() < 0.5:
+            token_in, token_out = token_out, token_in
+        # Some swaps exceed the sender's balance and fail.
+        amount_in = rng.uniform(0, 600)
+
+        kind = rng.random()
+        if kind < 0.01:
+            transaction = Transaction(
+                user,
+                uniswap_v2,
+                "add_liquidity",
+                {
+                    "token_1": tokens[i],
+                    "token_2": tokens[i + 1],
+                    "amount_1": amount_in,
+                    "amount_2": amount_in,
+                },
+            )
+        elif kind < 0.5:
+            transaction = Transaction(
+                user,
+                uniswap_v2,
+                "swap",
+                {"token_in": token_in, "amount_in": amount_in, "token_out": token_out},
+            )
+        else:
+            transaction = CompiledTransaction(
+                user, uniswap_v2, swap, (token_in, token_out, amount_in)
+            )
+        blockchain.add_transaction(transaction)
+
+    blockchain.create_block()
+
+    return blockchain
+
+
+def _assert_same_state(blockchain: Blockchain, reference: Blockchain) -> None:
+    np.testing.assert_array_equal(blockchain.ledger.balances, reference.ledger.balances)
+    np.testing.assert_array_equal(blockchain.ledger.held, reference.ledger.held)
+    np.testing.assert_allclose(
+        blockchain.ledger.group_totals, reference.ledger.group_totals, rtol=1e-12
+    )
+    np.testing.assert_array_equal(
+        blockchain.blocks.num_failed, reference.blocks.num_failed
+    )
+
+    pools = blockchain.contracts["UniswapV2"].get_pools()
+    reference_pools = reference.contracts["UniswapV2"].get_pools()
+    for pool, reference_pool in zip(pools, reference_pools):
+        assert list(pool.token_reserve.values()) == list(
+            reference_pool.token_reserve.values()
+        )
+        assert list(pool.fee_per_share.values()) == list(
+            reference_pool.fee_per_share.values()
+        )
+        assert pool.total_shares == reference_pool.total_shares
+
+
+@pytest.fixture(scope="module")
+def sequential() -> Blockchain:
+    return _run("sequential")
+
+
+def test_sequential_run_has_failures(sequential):
+    assert 0 < sequential.blocks.num_failed.sum() < NUM_TRANSACTIONS
+
+
+def test_batch_matches_sequential(sequential):
+    _assert_same_state(_run("batch"), sequential)
+
+
+def test_batch_of_failing_swaps_compiles_each_swap_about_once(monkeypatch):
+    blockchain = Blockchain(engine="batch")
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    uniswap_v2.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+    rich = blockchain.create_user("Rich")
+    rich.add_to_wallet(usdc, 1e6)
+    broke = blockchain.create_user("Broke")
+
+    compiled = []
+    execute_swaps = UniswapV2._execute_swaps
+
+    def counted_execute_swaps(contract, transactions, start, end):
+        compiled.append(end - start)
+        return execute_swaps(contract, transactions, start, end)
+
+    monkeypatch.setattr(UniswapV2, "_execute_swaps", counted_execute_swaps)
+
+    # A long run of failing swaps between two runs that execute.
+    senders = [rich] * 500 + [broke] * 5000 + [rich] * 500
+    for sender in senders:
+        blockchain.add_transaction(
+            Transaction(
+                sender,
+                uniswap_v2,
+                "swap",
+                {"token_in": usdc, "amount_in": 10.0, "token_out": eth},
+            )
+        )
+    blockchain.create_block()
+
+    assert blockchain.blocks.num_failed.tolist() == [5000]
+    assert rich.wallet[usdc] == 1e6 - 10_000
+    assert sum(compiled) < 2 * len(senders)
+
+
+@pytest.mark.parametrize("max_workers", [None, 1, 4])
+def test_parallel_matches_sequential(sequential, max_workers, monkeypatch):
+    # Run every segment on the workers, however short.
+    monkeypatch.setattr(parallel, "MIN_SEGMENT_SIZE", 0)
+
+    _assert_same_state(_run("parallel", max_workers), sequential)
+
+
+def _run_with_unlisted_token(engine: str, num_unlisted: int = 10) -> Blockchain:
+    blockchain = Blockchain(engine=engine, max_workers=2)
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    dai = blockchain.create_token("DAI", 1.0)
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    uniswap_v2.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+    # The ledger only lists X once a swap pays it out.
+    unlisted = Token("X", 1.0)
+    uniswap_v2.create_pool(dai, unlisted, 0.003, 1e5, 1e5)
+
+    alice = blockchain.create_user("Alice")
+    alice.add_to_wallet(usdc, 1000.0)
+    bob = blockchain.create_user("Bob")
+    bob.add_to_wallet(dai, 1000.0)
+
+    for number in range(10):
+        for sender, token_in, token_out, count in (
+            (alice, usdc, eth, 10),
+            (bob, dai, unlisted, num_unlisted),
+        ):
+            if number >= count:
+                continue
+            blockchain.add_transaction(
+                Transaction(
+                    sender,
+                    uniswap_v2,
+                    "swap",
+                    {
+                        "token_in": token_in,
+                        "amount_in": 10.0,
+                        "token_out": token_out,
+                    },
+                )
+            )
+    blockchain.create_block()
+
+    return blockchain
+
+
+def _record_partitions(monkeypatch) -> list[list[list[int]]]:
+    # Run every segment on the workers, however short.
+    monkeypatch.setattr(parallel, "MIN_SEGMENT_SIZE", 0)
+    partitions = []
+    partition = parallel.ParallelExecutor._partition
+
+    def recorded_partition(executor, *args):
+        partitions.append(partition(executor, *args))
+        return partitions[-1]
+
+    monkeypatch.setattr(parallel.ParallelExecutor, "_partition", recorded_partition)
+
+    return partitions
+
+
+def test_parallel_merges_forked_workers(sequential, monkeypatch):
+    partitions = _record_partitions(monkeypatch)
+    failures = sum(events.failures.values())
+
+    blockchain = _run("parallel", max_workers=4)
+
+    # The conflict-free groups of the first segment ran on 4 bins: 3 of
+    # them in forked workers.
+    assert len(partitions[0]) == 4
+    _assert_same_state(blockchain, sequential)
+    # The workers' failures are logged by the calling process.
+    assert sum(events.failures.values()) - failures == int(
+        sequential.blocks.num_failed.sum()
+    )
+
+
+# With fewer swaps, the swaps paying out the unlisted token form the smaller
+# group and run in a forked worker rather than in the calling process.
+@pytest.mark.parametrize("num_unlisted", [10, 5])
+def test_parallel_rolls_back_new_tokens(num_unlisted, monkeypatch):
+    partitions = _record_partitions(monkeypatch)
+    restores = []
+    restore = LiquidityPool.restore
+
+    def counted_restore(pool, state):
+        restores.append(pool)
+        restore(pool, state)
+
+    monkeypatch.setattr(LiquidityPool, "restore", counted_restore)
+
+    blockchain = _run_with_unlisted_token("parallel", num_unlisted)
+    reference = _run_with_unlisted_token("sequential", num_unlisted)
+
+    assert [len(bins) for bins in partitions] == [2]
+    # Both pools are rolled back, in the calling process.
+    assert len(restores) == 2
+    assert "X" in blockchain.ledger.token_ids
+    np.testing.assert_array_equal(blockchain.ledger.balances, reference.ledger.balances)
+    assert blockchain.blocks.num_failed.sum() == 0
@@ -0,0 +1,135 @@
+import json
+import threading
+
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from core.export import BlockExporter, ExportSink, NDJSONSink, create_sink
+from core.transaction import Transaction
+
+
+class RecordingSink(ExportSink):
+    def __init__(self, path: str, fail: bool = False):
+        super().__init__(path)
+        self.fail = fail
+        self.batches: list[tuple[str, dict, str]] = []
+
+    def write(self, table: str, columns: dict[str, list]) -> None:
+        if self.fail:
+            raise OSError("Disk full")
+        self.batches.append((table, columns, threading.current_thread().name))
+
+
+def _run(exporter: BlockExporter, num_blocks: int = 3) -> Blockchain:
+    blockchain = Blockchain(exporter=exporter)
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    uniswap_v2.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+    alice = blockchain.create_user("Alice")
+    alice.add_to_wallet(usdc, 1000.0)
+
+    for block in range(num_blocks):
+        for amount_in in (100.0, 5000.0):
+            blockchain.add_transaction(
+                Transaction(
+                    alice,
+                    uniswap_v2,
+                    "swap",
+                    {"token_in": usdc, "amount_in": amount_in, "token_out": eth},
+                    gas_fee=0.1 * block or None,
+                )
+            )
+        blockchain.create_block()
+
+    return blockchain
+
+
+def _read(path) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_ndjson_tables(tmp_path):
+    with BlockExporter(NDJSONSink(str(tmp_path)), batch_size=4) as exporter:
+        blockchain = _run(exporter)
+
+    transactions = _read(tmp_path / "transactions.ndjson")
+    assert [row["block"] for row in transactions] == [0, 0, 1, 1, 2, 2]
+    assert [row["status"] for row in transactions] == [True, False] * 3
+    assert transactions[0] == {
+        "block": 0,
+        "sender": "Alice",
+        "contract": "UniswapV2",
+        "function": "swap",
+        "token_a": "USDC",
+        "token_b": "ETH",
+        "amount_a": 100.0,
+        "amount_b": 0.0,
+        "gas_fee": None,
+        "status": True,
+    }
+    assert transactions[2]["gas_fee"] == 0.1
+
+    reserves = _read(tmp_path / "reserves.ndjson")
+    assert len(reserves) == 6
+    pool = blockchain.contracts["UniswapV2"].get_pools()[0]
+    assert [row["reserve"] for row in reserves[-2:]] == list(
+        pool.token_reserve.values()
+    )
+    prices = _read(tmp_path / "prices.ndjson")
+    assert [(row["block"], row["token"]) for row in prices[:2]] == [
+        (0, "USDC"),
+        (0, "ETH"),
+    ]
+    assert exporter.num_rows == {"transactions": 6, "reserves": 6, "prices": 6}
+
+
+def test_batches_are_written_on_the_writer_thread(tmp_path):
+    sink = RecordingSink(str(tmp_path))
+    exporter = BlockExporter(sink, batch_size=4)
+    _run(exporter, num_blocks=5)
+
+    # Full batches are handed over during the run, the rest on close.
+    exporter.flush()
+    written = [len(columns["block"]) for table, columns, _ in sink.batches]
+    assert sum(written) == 30
+    assert max(written) < 4 + 2
+    assert {thread for _, _, thread in sink.batches} == {"BlockExporter"}
+    exporter.close()
+    exporter.close()
+
+
+def test_writer_errors_reach_the_simulation(tmp_path):
+    exporter = BlockExporter(RecordingSink(str(tmp_path), fail=True), batch_size=1)
+
+    with pytest.raises(RuntimeError, match="Block export failed"):
+        _run(exporter, num_blocks=1)
+        exporter.flush()
+    with pytest.raises(RuntimeError):
+        exporter.close()
+
+
+def test_create_sink(tmp_path):
+    assert isinstance(create_sink(str(tmp_path)), NDJSONSink)
+    with pytest.raises(ValueError, match="export format"):
+        create_sink(str(tmp_path), "csv")
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_arrow_formats(tmp_path, format):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    with BlockExporter(create_sink(str(tmp_path), format), batch_size=2) as exporter:
+        _run(exporter)
+
+    path = str(tmp_path / f"transactions.{format}")
+    if format == "parquet":
+        table = pa.parquet.read_table(path)
+    else:
+        table = pa.ipc.open_file(path).read_all()
+    assert table.column("block").to_pylist() == [0, 0, 1, 1, 2, 2]
+    assert table.column("status").to_pylist() == [True, False] * 3
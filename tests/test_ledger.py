@@ -0,0 +1,95 @@
+import random
+
+import numpy as np
+import pytest
+
+from market.ledger import Ledger, Wallet
+from market.token import Token
+
+
+def _recomputed_totals(ledger: Ledger) -> np.ndarray:
+    totals = np.zeros((len(ledger.group_names), len(ledger.tokens)))
+    np.add.at(totals, ledger.groups, ledger.balances)
+
+    return totals
+
+
+def test_group_totals_follow_every_balance_update():
+    rng = random.Random(0)
+    # Small capacities, so tokens and users are added past them.
+    ledger = Ledger(user_capacity=2, token_capacity=1)
+    tokens = [Token(f"T{i}", 1.0 + i) for i in range(5)]
+    users = list(ledger.register_users(3))
+    ledger.assign_group(users[:2], "pair")
+
+    for step in range(2000):
+        if step % 200 == 0:
+            users.append(ledger.register_user())
+        if step % 300 == 0:
+            ledger.assign_group(rng.sample(users, 3), rng.choice(["pair", "rest"]))
+
+        user_id, token = rng.choice(users), rng.choice(tokens)
+        wallet = Wallet(ledger, user_id)
+        operation = rng.randrange(5)
+        if operation == 0:
+            ledger.deposit(user_id, token, rng.uniform(0, 10))
+        elif operation == 1 and wallet.get(token, 0.0) > 1.0:
+            ledger.withdraw(user_id, token, rng.uniform(0, wallet[token]))
+        elif operation == 2:
+            wallet[token] = rng.uniform(0, 10)
+        elif operation == 3 and token in wallet:
+            del wallet[token]
+        elif operation == 4:
+            ledger.deposit_many(np.array(rng.sample(users, 2)), token, [1.0, 2.0])
+
+    np.testing.assert_allclose(
+        ledger.group_totals, _recomputed_totals(ledger), atol=1e-9
+    )
+    for name in ledger.group_names:
+        ids = np.flatnonzero(ledger.groups == ledger.group_ids[name])
+        assert ledger.group_value(name) == pytest.approx(ledger.total_value(ids))
+
+
+def test_write_cells_updates_group_totals():
+    ledger = Ledger()
+    tokens = [Token("A", 2.0), Token("B", 3.0)]
+    for token in tokens:
+        ledger.register_token(token)
+    users = ledger.register_users(4)
+    ledger.deposit_many(users, tokens[0], 5.0)
+    ledger.assign_group(range(2, 4), "late")
+
+    num_tokens = ledger._balances.shape[1]
+    cells = np.array([0 * num_tokens + 1, 2 * num_tokens + 0, 3 * num_tokens + 1])
+    ledger.write_cells(cells, np.array([4.0, 1.0, 7.0]), np.array([True] * 3))
+
+    np.testing.assert_allclose(ledger.group_totals, _recomputed_totals(ledger))
+    np.testing.assert_allclose(ledger.group_holdings("late"), [6.0, 7.0])
+    assert ledger.group_value("late") == 6.0 * 2.0 + 7.0 * 3.0
+
+
+def test_journaled_updates_apply_only_when_kept():
+    ledger = Ledger()
+    token = Token("A", 1.0)
+    users = ledger.register_users(2)
+    ledger.deposit_many(users, token, 10.0)
+
+    ledger.start_journal()
+    kept, discarded = [], []
+    ledger.journal_to(kept)
+    ledger.withdraw(0, token, 4.0)
+    ledger.journal_to(discarded)
+    ledger.deposit(1, token, 3.0)
+
+    # Journaled updates are not applied until the journal stops.
+    np.testing.assert_allclose(ledger.group_holdings("default"), [20.0])
+    ledger.stop_journal([kept])
+    np.testing.assert_allclose(ledger.group_holdings("default"), [16.0])
+
+
+def test_unknown_group_holds_nothing():
+    ledger = Ledger()
+    ledger.register_token(Token("A", 1.0))
+
+    np.testing.assert_array_equal(ledger.group_holdings("missing"), [0.0])
+    assert ledger.group_value("missing") == 0.0
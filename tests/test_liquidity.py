@@ -0,0 +1,144 @@
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from simulation.agents.liquidity_provider import LiquidityProviderAgent
+from simulation.simulator import Simulator
+
+
+def _chain():
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    dai = blockchain.create_token("DAI", 1.0)
+    contract = blockchain.create_contract(UniswapV2())
+    contract.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+    contract.create_pool(usdc, dai, 0.0005, 1_000_000, 1_000_000)
+
+    providers = [blockchain.create_user(f"LP_{i}") for i in range(2)]
+    for provider in providers:
+        provider.add_to_wallet(usdc, 1e6)
+        provider.add_to_wallet(eth, 1000)
+        provider.add_to_wallet(dai, 1e6)
+
+    return blockchain, contract, providers, usdc, eth, dai
+
+
+def test_shares_are_minted_and_burnt_in_proportion_to_the_reserves():
+    _, contract, (first, second), usdc, eth, _ = _chain()
+    pool = contract._get_pool(usdc, eth)
+    initial_shares = pool.total_shares
+
+    shares = contract.add_liquidity(first, usdc, eth, 300_000, 1000)
+
+    # The ETH amount is reduced to match the pool's price.
+    assert shares == pytest.approx(initial_shares * 0.1)
+    assert first.wallet[eth] == pytest.approx(900)
+    assert first.wallet[pool.lp_token] == pytest.approx(shares)
+    assert pool.position_value(first.address) == pytest.approx(600_000)
+
+    contract.add_liquidity(second, usdc, eth, 600_000, 200)
+    assert pool.lp_positions[second.address].shares == pytest.approx(2 * shares)
+
+    amount_1, amount_2 = contract.remove_liquidity(first, usdc, eth, shares / 2)
+    assert (amount_1, amount_2) == (pytest.approx(150_000), pytest.approx(50))
+    assert pool.lp_positions[first.address].shares == pytest.approx(shares / 2)
+
+    with pytest.raises(ValueError):
+        contract.remove_liquidity(first, usdc, eth, shares)
+
+
+def test_fees_accrue_to_the_shares_held_when_they_were_paid():
+    _, contract, (first, second), usdc, eth, _ = _chain()
+    pool = contract._get_pool(usdc, eth)
+    shares = contract.add_liquidity(first, usdc, eth, 300_000, 100)
+    fee_share = shares / pool.total_shares
+
+    contract.swap(first, usdc, eth, 10_000)
+    assert pool.fees_earned(first.address)[usdc] == pytest.approx(30 * fee_share)
+
+    # A later provider earns nothing from the fees paid before it joined.
+    contract.add_liquidity(second, usdc, eth, 300_000, 100)
+    assert pool.fees_earned(second.address)[usdc] == 0.0
+
+    contract.swap(second, eth, usdc, 1)
+    fees = {
+        address: pool.fees_earned(address)[eth]
+        for address in (first.address, second.address)
+    }
+    total = 0.003 * pool.lp_positions[first.address].shares / pool.total_shares
+    assert fees[first.address] == pytest.approx(total)
+    assert fees[second.address] == pytest.approx(
+        fees[first.address]
+        * pool.lp_positions[second.address].shares
+        / pool.lp_positions[first.address].shares
+    )
+
+    # Burning shares settles their fees, which stay earned.
+    earned = pool.fees_earned(first.address)
+    contract.remove_liquidity(first, usdc, eth, pool.lp_positions[first.address].shares)
+    assert pool.fees_earned(first.address) == pytest.approx(earned)
+
+
+def test_only_changed_pools_share_tokens_are_repriced():
+    blockchain, contract, (provider, _), usdc, eth, dai = _chain()
+    simulator = Simulator(blockchain, seed=0)
+    eth_pool = contract._get_pool(usdc, eth)
+    dai_pool = contract._get_pool(usdc, dai)
+    simulator._update_lp_token_values()
+    assert eth_pool.lp_token.value == pytest.approx(eth_pool.share_value)
+
+    # Stale values mark the pools that are not priced again.
+    eth_pool.lp_token.value = dai_pool.lp_token.value = -1.0
+    simulator._update_lp_token_values([])
+    assert eth_pool.lp_token.value == dai_pool.lp_token.value == -1.0
+
+    contract.swap(provider, usdc, eth, 1000)
+    simulator._update_lp_token_values([])
+    assert eth_pool.lp_token.value == pytest.approx(eth_pool.share_value)
+    assert dai_pool.lp_token.value == -1.0
+
+    eth.value = 3100.0
+    eth_pool.lp_token.value = -1.0
+    simulator._update_lp_token_values([eth])
+    assert eth_pool.lp_token.value == pytest.approx(eth_pool.share_value)
+    assert dai_pool.lp_token.value == -1.0
+
+    # Pools created since the last call are priced too.
+    wbtc = blockchain.create_token("WBTC", 60_000.0)
+    wbtc_pool = contract.create_pool(usdc, wbtc, 0.003, 600_000, 10)
+    simulator._update_lp_token_values([])
+    assert wbtc_pool.lp_token.value == pytest.approx(wbtc_pool.share_value)
+
+    simulator._update_lp_token_values()
+    assert dai_pool.lp_token.value == pytest.approx(dai_pool.share_value)
+
+
+def test_providers_deposit_more_when_their_fees_are_high():
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    contract = blockchain.create_contract(UniswapV2())
+    pool = contract.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+    provider = blockchain.create_user("LP")
+    provider.add_to_wallet(usdc, 1e6)
+    provider.add_to_wallet(eth, 1000)
+    # A position at the target share of the provider's pair value.
+    contract.add_liquidity(provider, usdc, eth, 400_000, 400_000 / 3000)
+
+    LiquidityProviderAgent.simulate_lp_actions([provider], contract, blockchain)
+    assert len(blockchain.mempool) == 0
+
+    # Fees worth half the position, paid without moving the price.
+    position = pool.lp_positions[provider.address]
+    pool.add_fee(
+        usdc,
+        pool.position_value(provider.address) / 2 * pool.total_shares / position.shares,
+    )
+
+    LiquidityProviderAgent.simulate_lp_actions([provider], contract, blockchain)
+    (transaction,) = blockchain.mempool
+    assert transaction.function == "add_liquidity"
+    assert transaction.args["amount_1"] == pytest.approx(
+        (1.5 - 1) * 0.2 * 4_000_000 / 2
+    )
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from utils.logger import EventLogger, logger
+
+
+@pytest.fixture
+def messages():
+    messages: list[str] = []
+    sink = logger.add(messages.append, level="TRACE", format="{message}")
+    yield messages
+    logger.remove(sink)
+
+
+def test_failures_past_the_burst_are_sampled(messages):
+    events = EventLogger(burst=2, window=3600, sample_every=3)
+
+    for _ in range(10):
+        events.failure(ValueError("no liquidity"), "swap_failed")
+    events.flush()
+
+    assert events.failures == {"ValueError": 10}
+    # The 1st, 2nd, 5th and 8th failures are written, the later ones with the
+    # number suppressed since the previous one.
+    assert len(messages) == 4
+    assert ["suppressed=2" in message for message in messages] == [
+        False,
+        False,
+        True,
+        True,
+    ]
+
+
+def test_a_new_window_writes_a_new_burst(messages):
+    events = EventLogger(burst=1, window=0.0, sample_every=1000)
+
+    for _ in range(5):
+        events.failure(KeyError("token"), "lookup_failed")
+    events.flush()
+
+    assert len(messages) == 5
+
+
+def test_disabled_levels_are_counted_but_not_written(messages):
+    events = EventLogger(level="ERROR")
+
+    events.failure(ValueError("no liquidity"))
+    events.log("INFO", "call", function="run_epoch")
+    events.flush()
+
+    assert events.failures == {"ValueError": 1}
+    assert messages == []
+    assert events._thread is None
+    with pytest.raises(ValueError):
+        events.level = "VERBOSE"
+
+
+def test_a_full_queue_drops_events_without_blocking():
+    release = threading.Event()
+    sink = logger.add(lambda message: release.wait(), level="TRACE")
+    events = EventLogger(max_queue=1)
+    try:
+        events.log("INFO", "first")
+        # The writer holds the first event until released, so the queue
+        # fills up with the second.
+        while events._queue.unfinished_tasks != 1 or not events._queue.empty():
+            pass
+        events.log("INFO", "second")
+        events.log("INFO", "third")
+        assert events.dropped == 1
+    finally:
+        release.set()
+        events.flush()
+        logger.remove(sink)
+
+
+def test_concurrent_failures_are_all_counted(messages):
+    events = EventLogger(burst=10, window=3600, sample_every=1000)
+
+    def fail():
+        for _ in range(1000):
+            events.failure(ValueError("no liquidity"), "swap_failed")
+
+    threads = [threading.Thread(target=fail) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    events.flush()
+
+    assert events.failures == {"ValueError": 8000}
+    # The burst, then one in every thousand after it.
+    assert len(messages) == 10 + 7
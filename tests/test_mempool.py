@@ -0,0 +1,192 @@
+import itertools
+import random
+
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from contracts.uniswap_v3 import UniswapV3
+from core.blockchain import Blockchain
+from core.mempool import GAS_COSTS, Mempool
+from core.transaction import Transaction
+from market.actors.user import User
+
+
+@pytest.fixture
+def users() -> list:
+    blockchain = Blockchain()
+    return [blockchain.create_user(f"User_{i}") for i in range(4)]
+
+
+# Distinct arguments keep equal-looking transactions apart in comparisons.
+_TAGS = itertools.count()
+
+
+def _transaction(sender, gas_fee: float | None, function: str = "swap"):
+    return Transaction(sender, None, function, {"tag": next(_TAGS)}, gas_fee)  # type: ignore
+
+
+def test_higher_fees_first_then_arrival_order(users):
+    low, high, none, tie = (
+        _transaction(users[0], 1.0),
+        _transaction(users[1], 5.0),
+        _transaction(users[2], None),
+        _transaction(users[3], 5.0),
+    )
+    mempool = Mempool([low, high, none, tie])
+
+    assert mempool.pop_block() == [high, tie, low, none]
+    assert len(mempool) == 0
+
+
+def test_sender_order_comes_before_fees(users):
+    first = _transaction(users[0], 1.0)
+    second = _transaction(users[0], 10.0)
+    other = _transaction(users[1], 5.0)
+    mempool = Mempool([first, second, other])
+
+    # The sender's second transaction waits for its first, as with nonces.
+    assert mempool.pop_block() == [other, first, second]
+
+
+def test_extend_matches_repeated_add(users):
+    rng = random.Random(0)
+    transactions = [
+        _transaction(rng.choice(users), rng.choice([None, 1.0, 2.0]))
+        for _ in range(200)
+    ]
+
+    added = Mempool()
+    for transaction in transactions:
+        added.add(transaction)
+    extended = Mempool()
+    extended.extend(transactions[:50])
+    extended.extend(transactions[50:])
+
+    assert list(extended) == transactions
+    assert extended.pop_block() == added.pop_block()
+
+
+def test_block_limits_leave_the_rest_pending(users):
+    transactions = [
+        _transaction(users[i % len(users)], float(i), "add_liquidity") for i in range(8)
+    ]
+    mempool = Mempool(transactions)
+
+    # Each sender's second transaction pays more and follows its first.
+    block = mempool.pop_block(
+        max_transactions=5, max_gas=3 * GAS_COSTS["add_liquidity"]
+    )
+    assert block == [transactions[3], transactions[7], transactions[2]]
+    assert list(mempool) == [transactions[i] for i in (0, 1, 4, 5, 6)]
+
+    assert mempool.pop_block(max_transactions=2) == [transactions[6], transactions[1]]
+    assert len(mempool) == 3
+
+
+def test_gas_costs_cover_the_contract_functions():
+    functions = set(UniswapV2().functions) | set(UniswapV3().functions)
+
+    assert set(GAS_COSTS) == functions
+
+
+def test_senders_are_queued_by_address(users):
+    # Two objects for the same user, as a population hands out.
+    twin = User(users[0].name, users[0].address, users[0].ledger, users[0].user_id)
+    first = _transaction(users[0], 1.0)
+    second = _transaction(twin, 10.0)
+
+    assert Mempool([first, second]).pop_block() == [first, second]
+
+
+def _fee_chain(engine: str = "sequential"):
+    blockchain = Blockchain(engine=engine)
+    eth = blockchain.create_token("ETH", 3000.0)
+    usdc = blockchain.create_token("USDC", 1.0)
+    blockchain.fee_token = eth
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    uniswap_v2.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+
+    return blockchain, eth, usdc, uniswap_v2
+
+
+@pytest.mark.parametrize("engine", ["sequential", "batch", "parallel"])
+def test_fees_move_from_senders_to_the_producer(engine):
+    blockchain, eth, usdc, uniswap_v2 = _fee_chain(engine)
+    producer = blockchain.create_block_producer("Producer")
+    senders = [blockchain.create_user(f"User_{i}") for i in range(3)]
+    for sender in senders:
+        sender.add_to_wallet(eth, 1.0)
+        sender.add_to_wallet(usdc, 100.0)
+    before = blockchain.ledger.balances.sum(axis=0)
+
+    swaps = [
+        # Succeeds.
+        Transaction(
+            senders[0],
+            uniswap_v2,
+            "swap",
+            {"token_in": usdc, "token_out": eth, "amount_in": 50.0},
+            0.01,
+        ),
+        # Fails in the contract, but is included and pays its fee.
+        Transaction(
+            senders[1],
+            uniswap_v2,
+            "swap",
+            {"token_in": usdc, "token_out": eth, "amount_in": 500.0},
+            0.02,
+        ),
+        # Cannot pay its fee, so it is not run.
+        Transaction(
+            senders[2],
+            uniswap_v2,
+            "swap",
+            {"token_in": usdc, "token_out": eth, "amount_in": 50.0},
+            2.0,
+        ),
+    ]
+    blockchain.add_transactions(swaps)
+    blockchain.create_block(producer)
+
+    # The mempool orders the block by fee: the unpaid, failing, then
+    # succeeding swap.
+    assert blockchain.blocks[0].statuses == [False, False, True]
+    assert producer.balance == pytest.approx(0.03)
+    assert senders[1].wallet[eth] == pytest.approx(1.0 - 0.02)
+    assert senders[2].wallet[eth] == 1.0
+    assert senders[2].wallet[usdc] == 100.0
+
+    # The fees left the ledger's fee token supply, pools aside, and nothing
+    # else did.
+    pool = uniswap_v2.get_pools()[0]
+    after = blockchain.ledger.balances.sum(axis=0)
+    eth_out = 1000 - pool.token_reserve[eth]
+    usdc_in = pool.token_reserve[usdc] - 3_000_000
+    assert after[blockchain.ledger.token_ids["ETH"]] == pytest.approx(
+        before[blockchain.ledger.token_ids["ETH"]] - producer.balance + eth_out
+    )
+    assert after[blockchain.ledger.token_ids["USDC"]] == pytest.approx(
+        before[blockchain.ledger.token_ids["USDC"]] - usdc_in
+    )
+
+
+def test_without_a_fee_token_fees_only_order_the_mempool():
+    blockchain, eth, usdc, uniswap_v2 = _fee_chain()
+    blockchain.fee_token = None
+    producer = blockchain.create_block_producer("Producer")
+    sender = blockchain.create_user("User")
+    sender.add_to_wallet(usdc, 100.0)
+
+    blockchain.add_transaction(
+        Transaction(
+            sender,
+            uniswap_v2,
+            "swap",
+            {"token_in": usdc, "token_out": eth, "amount_in": 50.0},
+            5.0,
+        )
+    )
+    blockchain.create_block(producer)
+
+    assert producer.balance == 0.0
+    assert blockchain.blocks.num_failed.sum() == 0
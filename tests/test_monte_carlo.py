@@ -0,0 +1,71 @@
+import os
+import queue
+
+import pytest
+
+from market.token import Token
+from simulation import monte_carlo
+from simulation.monte_carlo import MonteCarloRunner, Scenario, run_replica, summarize
+from simulation.simulator import Epoch, Simulator
+
+CONFIG_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "data", "blockchain_config.yaml"
+)
+
+
+@pytest.fixture
+def scenario() -> Scenario:
+    oracle = {Token("USDC", 1.0): 1.0, Token("ETH", 3000.0): 3000.0}
+    return Scenario(
+        CONFIG_PATH,
+        [Epoch(3, oracle, seed=1), Epoch(3, oracle, seed=2)],
+        num_users=20,
+        num_liquidity_providers=2,
+    )
+
+
+def test_replica_reports_each_epoch_as_it_ends(scenario, monkeypatch):
+    results_queue: queue.Queue = queue.Queue()
+    queued_at_start = []
+    run_epoch = Simulator.run_epoch
+
+    def recorded_run_epoch(simulator, epoch):
+        queued_at_start.append(results_queue.qsize())
+        run_epoch(simulator, epoch)
+
+    monkeypatch.setattr(Simulator, "run_epoch", recorded_run_epoch)
+
+    results = run_replica(scenario, 0, 7, results_queue)
+
+    assert queued_at_start == [1, 2]
+    assert [results_queue.get_nowait() for _ in results] == results
+    assert [result.epoch for result in results] == [0, 1, 2]
+
+
+def test_replica_rejects_an_unknown_engine(scenario):
+    scenario.engine = "vectorized"
+
+    with pytest.raises(ValueError, match="Unknown engine"):
+        run_replica(scenario, 0, 7)
+
+
+def test_runner_yields_every_epoch_of_every_replica(scenario, monkeypatch):
+    monkeypatch.setattr(monte_carlo, "POLL_INTERVAL", 0.01)
+    runner = MonteCarloRunner(scenario, num_replicas=3, seed=0, max_workers=2)
+
+    results = list(runner.run())
+
+    assert sorted((result.replica, result.epoch) for result in results) == [
+        (replica, epoch) for replica in range(3) for epoch in range(3)
+    ]
+    assert {result.seed for result in results} == set(runner.seeds)
+    summary = summarize(results)
+    assert sorted(summary) == [0, 1, 2]
+
+
+def test_runner_raises_replica_errors(scenario):
+    scenario.engine = "vectorized"
+    runner = MonteCarloRunner(scenario, num_replicas=2, seed=0, max_workers=2)
+
+    with pytest.raises(ValueError, match="Unknown engine"):
+        list(runner.run())
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from simulation.price_path import (
+    bounded_random_walk,
+    geometric_brownian_motion,
+    mean_reverting,
+)
+from simulation.simulator import Epoch, Simulator
+
+
+def test_bounded_walk_respects_its_bounds():
+    base = np.array([1.0, 3000.0])
+    prices = bounded_random_walk(
+        np.random.default_rng(0), base, 500, max_percent=0.05, change_limit=0.01
+    )
+
+    percents = prices / base - 1
+    assert prices.shape == (500, 2)
+    assert np.abs(percents).max() <= 0.05 + 1e-12
+    steps = np.diff(np.vstack([np.zeros(2), percents]), axis=0)
+    assert np.abs(steps).max() <= 0.01 + 1e-12
+
+
+def test_gbm_log_returns_have_the_model_moments():
+    prices = geometric_brownian_motion(
+        np.random.default_rng(0), np.ones(1), 100_000, volatility=0.01, drift=0.001
+    )
+
+    log_returns = np.diff(np.log(prices[:, 0]))
+    assert log_returns.mean() == pytest.approx(0.001 - 0.5 * 0.01**2, abs=2e-4)
+    assert log_returns.std() == pytest.approx(0.01, rel=0.02)
+
+
+def test_mean_reverting_prices_stay_around_base():
+    base = np.array([2.0])
+    prices = mean_reverting(
+        np.random.default_rng(0), base, 100_000, volatility=0.01, reversion=0.1
+    )
+
+    deviations = np.log(prices[:, 0] / base[0])
+    assert deviations.mean() == pytest.approx(0.0, abs=0.01)
+    # The stationary deviation of the process.
+    assert deviations.std() == pytest.approx(0.01 / np.sqrt(1 - 0.9**2), rel=0.1)
+
+
+def test_paths_broadcast_over_leading_axes():
+    base = np.array([[1.0, 2.0]] * 3)
+    prices = mean_reverting(np.random.default_rng(0), base, 10, volatility=[[0.0]])
+
+    assert prices.shape == (10, 3, 2)
+    np.testing.assert_array_equal(prices, np.broadcast_to(base, (10, 3, 2)))
+
+
+@pytest.fixture
+def blockchain() -> Blockchain:
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    blockchain.create_contract(UniswapV2()).create_pool(
+        usdc, eth, 0.003, 3_000_000, 1000
+    )
+
+    return blockchain
+
+
+def _oracle(blockchain: Blockchain) -> dict:
+    return {token: token.value for token in blockchain.tokens.values()}
+
+
+@pytest.mark.parametrize("price_model", ["bounded", "gbm", "mean_reverting"])
+def test_seeded_epochs_draw_the_same_path(blockchain, price_model):
+    epoch = Epoch(50, _oracle(blockchain), price_model=price_model, seed=3)
+
+    np.testing.assert_array_equal(epoch.price_path(), epoch.price_path())
+    assert epoch.price_path().shape == (50, 2)
+
+
+def test_epoch_rejects_bad_paths_and_models(blockchain):
+    with pytest.raises(ValueError, match="shaped"):
+        Epoch(5, _oracle(blockchain), prices=np.ones((4, 2)))
+    with pytest.raises(ValueError, match="price model"):
+        Epoch(5, _oracle(blockchain), price_model="jump")
+
+
+def test_simulator_reads_prices_from_the_path(blockchain):
+    prices = np.column_stack([np.ones(5), np.linspace(3000.0, 3400.0, 5)])
+    epoch = Epoch(5, _oracle(blockchain), prices=prices)
+    simulator = Simulator(blockchain, seed=0)
+
+    simulator.run_epoch(epoch)
+
+    assert blockchain.tokens["ETH"].value == 3400.0
+    assert blockchain.tokens["USDC"].value == 1.0
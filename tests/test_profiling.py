@@ -0,0 +1,104 @@
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from simulation.simulator import Epoch, Simulator
+from utils.profiling import NULL_TIMER, Profiler, null_timer
+
+NUM_BLOCKS = 6
+
+
+def _simulator(engine: str = "sequential", profiler: Profiler | None = None):
+    blockchain = Blockchain(engine=engine)
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    blockchain.create_contract(UniswapV2()).create_pool(
+        usdc, eth, 0.003, 3_000_000, 1000
+    )
+
+    simulator = Simulator(blockchain, seed=0, profiler=profiler)
+    simulator.create_users(20)
+    simulator.create_liquidity_providers(2)
+    simulator.create_block_producers(1)
+
+    return simulator, Epoch(NUM_BLOCKS, {usdc: 1.0, eth: 3000.0}, seed=0)
+
+
+def test_report_covers_phases_agents_functions_and_counters():
+    simulator, epoch = _simulator(profiler=Profiler())
+
+    report = simulator.run([epoch])
+
+    blocks = simulator.blockchain.blocks
+    assert set(report["timers"]["phase"]) == {
+        "oracle",
+        "agents",
+        "block_production",
+    }
+    assert set(report["timers"]["agent"]) == {
+        "UserAgent",
+        "LiquidityProviderAgent",
+        "BlockProducerAgent",
+    }
+    assert report["timers"]["phase"]["oracle"]["calls"] == NUM_BLOCKS
+    assert "UniswapV2.swap" in report["timers"]["function"]
+    assert sum(
+        timer["calls"] for timer in report["timers"]["function"].values()
+    ) == int(blocks.num_transactions.sum())
+    assert report["counters"]["blocks"] == NUM_BLOCKS
+    assert report["counters"]["transactions"] == int(blocks.num_transactions.sum())
+    assert report["counters"]["failed_transactions"] == int(blocks.num_failed.sum())
+    assert report["samples"] == []
+
+
+def test_batch_engine_times_each_contract_batch():
+    simulator, epoch = _simulator("batch", Profiler())
+
+    report = simulator.run([epoch])
+
+    batches = report["timers"]["function"]["UniswapV2.process_batch"]
+    assert batches["calls"] == int(simulator.blockchain.blocks.num_transactions.sum())
+
+
+def test_samples_every_nth_block():
+    profiler = Profiler(sample_every=2, sample_memory=True, sample_top=5)
+    simulator, epoch = _simulator(profiler=profiler)
+
+    report = simulator.run([epoch])
+
+    assert [sample["block"] for sample in report["samples"]] == [0, 2, 4]
+    for sample in report["samples"]:
+        assert 0 < len(sample["profile"]) <= 5
+        assert sample["memory"]["peak"] >= sample["memory"]["current"] >= 0
+
+
+def test_without_a_profiler_nothing_is_reported():
+    simulator, epoch = _simulator()
+
+    assert simulator.run([epoch]) is None
+    assert simulator.blockchain.profiler is None
+    assert null_timer("phase", "oracle") is NULL_TIMER
+
+
+def test_timers_accumulate_and_reset():
+    profiler = Profiler()
+
+    timer = profiler.timer("phase", "work")
+    assert profiler.timer("phase", "work") is timer
+    for _ in range(3):
+        with timer:
+            pass
+    profiler.add("function", "f", 1.5, calls=3)
+    profiler.count("events", 2)
+
+    report = profiler.report()
+    assert report["timers"]["phase"]["work"]["calls"] == 3
+    assert report["timers"]["function"]["f"] == {
+        "seconds": 1.5,
+        "calls": 3,
+        "mean": pytest.approx(0.5),
+    }
+    assert report["counters"] == {"events": 2}
+
+    profiler.reset()
+    assert profiler.report()["timers"] == {}
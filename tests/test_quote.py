@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from contracts.uniswap_v3 import UniswapV3
+from core.blockchain import Blockchain
+
+AMOUNTS = np.array([0.5, 10.0, 250.0, 4000.0])
+
+
+def _chain(contract_type=UniswapV2):
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    dai = blockchain.create_token("DAI", 1.0)
+    contract = blockchain.create_contract(contract_type())
+    contract.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+    contract.create_pool(usdc, dai, 0.0005, 1_000_000, 1_000_000)
+    user = blockchain.create_user("User")
+    user.add_to_wallet(usdc, 1e6)
+
+    return contract, user, usdc, eth, dai
+
+
+@pytest.mark.parametrize("contract_type", [UniswapV2, UniswapV3])
+def test_quotes_match_swaps_without_changing_pools(contract_type):
+    contract, _, usdc, eth, _ = _chain(contract_type)
+    pool = contract._get_pool(usdc, eth)
+    version = pool.version
+
+    quote = contract.quote(usdc, eth, amount_in=AMOUNTS)
+
+    assert pool.version == version
+    for amount_in, amount_out in zip(AMOUNTS, quote.amount_out):
+        contract, user, usdc, eth, _ = _chain(contract_type)
+        assert contract.swap(user, usdc, eth, amount_in) == pytest.approx(amount_out)
+
+
+def test_reverse_quotes_invert_exact_input_quotes():
+    contract, user, usdc, eth, _ = _chain()
+    wanted = np.array([0.1, 1.0, 100.0, 1000.0, 2000.0])
+
+    quote = contract.quote(usdc, eth, amount_out=wanted)
+
+    np.testing.assert_allclose(quote.amount_out, wanted)
+    # The pool cannot pay out its whole reserve or more.
+    assert np.isinf(quote.amount_in[-2:]).all()
+    np.testing.assert_allclose(
+        contract.quote(usdc, eth, amount_in=quote.amount_in[:3]).amount_out,
+        wanted[:3],
+    )
+    assert contract.swap(user, usdc, eth, float(quote.amount_in[1])) == pytest.approx(
+        1.0
+    )
+
+
+def test_price_impact_grows_with_the_trade():
+    contract, _, usdc, eth, _ = _chain()
+
+    quote = contract.quote(usdc, eth, amount_in=np.append(0.0, AMOUNTS))
+
+    assert quote.price_impact[0] == 0.0
+    assert (np.diff(quote.price_impact) > 0).all()
+    np.testing.assert_allclose(quote.spot_price, 1000 / 3_000_000)
+    np.testing.assert_allclose(
+        quote.execution_price[1:], quote.amount_out[1:] / AMOUNTS
+    )
+
+
+def test_quote_pools_takes_shared_or_per_pool_amounts():
+    contract, _, usdc, eth, dai = _chain()
+    pairs = [(usdc, eth), (usdc, dai)]
+
+    shared = contract.quote_pools(pairs, amount_in=AMOUNTS)
+    rows = contract.quote_pools(pairs, amount_in=np.vstack([AMOUNTS, 2 * AMOUNTS]))
+
+    for (token_in, token_out), quote in zip(pairs, shared):
+        np.testing.assert_array_equal(
+            quote.amount_out, contract.quote(token_in, token_out, AMOUNTS).amount_out
+        )
+    np.testing.assert_array_equal(rows[0].amount_out, shared[0].amount_out)
+    np.testing.assert_array_equal(
+        rows[1].amount_out, contract.quote(usdc, dai, 2 * AMOUNTS).amount_out
+    )
+
+    with pytest.raises(ValueError, match="one row of amounts per pool"):
+        contract.quote_pools(pairs, amount_in=np.ones((3, 2)))
+    with pytest.raises(ValueError, match="Exactly one"):
+        contract.quote(usdc, eth)
+    with pytest.raises(ValueError, match="Exactly one"):
+        contract.quote(usdc, eth, amount_in=1.0, amount_out=1.0)
+
+
+def test_concentrated_pools_quote_exact_inputs_only():
+    contract, _, usdc, eth, _ = _chain(UniswapV3)
+
+    with pytest.raises(ValueError, match="exact inputs only"):
+        contract.quote(usdc, eth, amount_out=1.0)
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from simulation.replay import ReplaySource, convert_csv
+from simulation.simulator import Simulator
+
+# Prices of four chain blocks, with gaps between them.
+PRICES = """\
+block,USDC,ETH
+17000000,1.0,3000.0
+17000002,1.0,3010.0
+17000005,1.0,2990.0
+17000006,1.0,3005.0
+"""
+
+
+@pytest.fixture
+def prices_csv(tmp_path) -> str:
+    path = tmp_path / "prices.csv"
+    path.write_text(PRICES)
+
+    return str(path)
+
+
+def _trades_csv(tmp_path, rows: list[str]) -> str:
+    path = tmp_path / "trades.csv"
+    path.write_text("block,user,token_in,token_out,amount_in\n" + "".join(rows))
+
+    return str(path)
+
+
+def test_trades_map_to_their_priced_blocks(prices_csv, tmp_path):
+    trades_csv = _trades_csv(
+        tmp_path,
+        [
+            "17000000,0,USDC,ETH,100\n",
+            "17000002,1,ETH,USDC,0.5\n",
+            # Between priced blocks, so replayed with the prices of 17000002.
+            "17000003,0,USDC,ETH,200\n",
+            "17000006,1,USDC,ETH,300\n",
+        ],
+    )
+
+    replay = convert_csv(prices_csv, str(tmp_path / "replay"), trades_csv, 2)
+
+    assert replay.blocks.tolist() == [17000000, 17000002, 17000005, 17000006]
+    np.testing.assert_array_equal(replay.prices[:, 1], [3000, 3010, 2990, 3005])
+    trades = replay.trades
+    assert [len(trades.block(row)) for row in range(len(trades))] == [1, 2, 0, 1]
+    assert trades.block(1)["block"].tolist() == [17000002, 17000003]
+    assert trades.block(3)["amount_in"].tolist() == [300.0]
+
+    reopened = ReplaySource(str(tmp_path / "replay"))
+    assert reopened.blocks.tolist() == replay.blocks.tolist()
+
+
+@pytest.mark.parametrize(
+    "rows, message",
+    [
+        (["16999999,0,USDC,ETH,1\n"], "before the first"),
+        (["17000007,0,USDC,ETH,1\n"], "past the last"),
+        (["17000005,0,USDC,ETH,1\n", "17000002,0,USDC,ETH,1\n"], "not sorted"),
+    ],
+)
+def test_rejects_trades_outside_the_prices(prices_csv, tmp_path, rows, message):
+    with pytest.raises(ValueError, match=message):
+        convert_csv(prices_csv, str(tmp_path / "replay"), _trades_csv(tmp_path, rows))
+
+
+def test_rejects_unsorted_prices(tmp_path):
+    path = tmp_path / "prices.csv"
+    path.write_text("block,USDC\n5,1.0\n4,1.0\n")
+
+    with pytest.raises(ValueError, match="not sorted"):
+        convert_csv(str(path), str(tmp_path / "replay"))
+
+
+def test_epochs_replay_prices_and_trades(prices_csv, tmp_path):
+    replay = convert_csv(
+        prices_csv,
+        str(tmp_path / "replay"),
+        _trades_csv(tmp_path, ["17000002,0,USDC,ETH,100\n", "17000005,1,ETH,USDC,1\n"]),
+    )
+
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    blockchain.create_contract(UniswapV2()).create_pool(
+        usdc, eth, 0.003, 3_000_000, 1000
+    )
+    simulator = Simulator(blockchain)
+    simulator.create_users(2)
+    simulator.create_block_producers(1)
+
+    epochs = list(replay.epochs(blockchain, 3))
+    assert [epoch.num_blocks for epoch in epochs] == [3, 1]
+    for epoch in epochs:
+        simulator.run_epoch(epoch)
+
+    assert eth.value == 3005.0
+    assert blockchain.blocks.num_transactions.tolist() == [0, 1, 1, 0]
+    assert blockchain.blocks.num_failed.sum() == 0
+    assert simulator.users[0].wallet[usdc] == 900.0
+    assert simulator.users[1].wallet[eth] == 999.0
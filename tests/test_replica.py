@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from simulation.replica import ReplicaSimulator
+from simulation.simulator import Epoch, Simulator
+
+
+@pytest.fixture
+def simulator() -> Simulator:
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    uniswap_v2.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+
+    simulator = Simulator(blockchain, seed=0)
+    simulator.create_users(50)
+
+    return simulator
+
+
+def _epoch(simulator: Simulator) -> Epoch:
+    tokens = simulator.blockchain.tokens
+    return Epoch(10, {tokens["USDC"]: 1.0, tokens["ETH"]: 3000.0}, seed=0)
+
+
+def test_replicas_conserve_tokens(simulator):
+    replicas = ReplicaSimulator(simulator, 8, seed=0)
+    totals = replicas.balances.sum(axis=1)[:, replicas.pool_tokens] + replicas.reserves
+
+    replicas.run([_epoch(simulator)])
+
+    after = replicas.balances.sum(axis=1)[:, replicas.pool_tokens] + replicas.reserves
+    np.testing.assert_allclose(after, totals)
+    assert (replicas.balances >= 0).all()
+    # Every replica draws its own swaps.
+    assert len(np.unique(replicas.reserves[:, 0])) == 8
+
+
+def test_fee_tiers_grow_the_invariant(simulator):
+    replicas = ReplicaSimulator(simulator, 3, fees=[0.0, 0.003, 0.01], seed=0)
+    start = replicas.reserves.prod(axis=1)
+
+    replicas.run([_epoch(simulator)])
+
+    growth = replicas.reserves.prod(axis=1) / start
+    assert growth[0] == pytest.approx(1.0)
+    assert 1.0 < growth[1] < growth[2]
+
+
+def test_snapshots_hold_a_value_per_replica(simulator):
+    replicas = ReplicaSimulator(simulator, 4, volatilities=0.02, seed=0)
+
+    snapshots = replicas.run([_epoch(simulator), _epoch(simulator)])
+
+    assert len(snapshots) == 3
+    for snapshot in snapshots:
+        assert set(snapshot) == {
+            "user_total_value",
+            "USDC/ETH USDC reserve",
+            "USDC/ETH ETH reserve",
+            "USDC/ETH tvl",
+        }
+        assert all(values.shape == (4,) for values in snapshot.values())
+
+
+def test_rejects_several_pools(simulator):
+    blockchain = simulator.blockchain
+    dai = blockchain.create_token("DAI", 1.0)
+    blockchain.contracts["UniswapV2"].create_pool(
+        blockchain.tokens["USDC"], dai, 0.003, 1000, 1000
+    )
+
+    with pytest.raises(ValueError, match="single pool"):
+        ReplicaSimulator(simulator, 2)
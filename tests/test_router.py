@@ -0,0 +1,122 @@
+import itertools
+import random
+
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+
+
+def _graph(num_tokens: int, num_pools: int, seed: int = 0):
+    rng = random.Random(seed)
+    blockchain = Blockchain()
+    tokens = [blockchain.create_token(f"T{i}", 1.0) for i in range(num_tokens)]
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    pairs = rng.sample(list(itertools.combinations(tokens, 2)), num_pools)
+    uniswap_v2.create_pools(
+        (token_1, token_2, 0.003, rng.uniform(1e3, 1e5), rng.uniform(1e3, 1e5))
+        for token_1, token_2 in pairs
+    )
+
+    return blockchain, tokens, uniswap_v2
+
+
+def _output(uniswap_v2: UniswapV2, path: list, amount_in: float) -> float:
+    for token_in, token_out in zip(path, path[1:]):
+        pool = uniswap_v2._get_pool(token_in, token_out)
+        amount_in = uniswap_v2._get_amount_out(pool, token_in, token_out, amount_in)
+
+    return amount_in
+
+
+def _best_output(uniswap_v2: UniswapV2, tokens: list, token_in, token_out, amount):
+    # Every simple path of up to three pools.
+    best = 0.0
+    middle = [token for token in tokens if token not in (token_in, token_out)]
+    for length in range(3):
+        for hops in itertools.permutations(middle, length):
+            path = [token_in, *hops, token_out]
+            try:
+                best = max(best, _output(uniswap_v2, path, amount))
+            except (KeyError, ValueError):
+                continue
+
+    return best
+
+
+def test_best_path_matches_exhaustive_search():
+    blockchain, tokens, uniswap_v2 = _graph(8, 14)
+    uniswap_v2.router.max_paths = 100
+
+    for token_in, token_out in itertools.permutations(tokens[:5], 2):
+        try:
+            hops, amount_out = uniswap_v2.router.best_path(token_in, token_out, 500.0)
+        except ValueError:
+            assert _best_output(uniswap_v2, tokens, token_in, token_out, 500.0) == 0
+            continue
+
+        assert len(hops) <= 3
+        assert amount_out == pytest.approx(
+            _best_output(uniswap_v2, tokens, token_in, token_out, 500.0)
+        )
+
+
+def test_candidates_are_capped_on_dense_graphs():
+    num_tokens = 30
+    blockchain, tokens, uniswap_v2 = _graph(num_tokens, num_tokens * 29 // 2)
+
+    route = uniswap_v2.router.route(tokens[0], tokens[1])
+
+    # Exhaustively, there are 1 + 28 + 28 * 27 paths of up to three pools.
+    assert len(route.paths) <= uniswap_v2.router.max_paths + 1
+    token_ids = uniswap_v2.token_ids
+    assert [token_ids["T0"], token_ids["T1"]] in route.paths
+
+
+def test_swap_exact_in_follows_the_best_path():
+    blockchain = Blockchain()
+    a, b, c = (blockchain.create_token(name, 1.0) for name in "ABC")
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    # The direct pool is shallow, the path through B is deep.
+    uniswap_v2.create_pools(
+        [(a, c, 0.003, 100, 100), (a, b, 0.003, 1e6, 1e6), (b, c, 0.003, 1e6, 1e6)]
+    )
+    user = blockchain.create_user("User")
+    user.add_to_wallet(a, 50.0)
+
+    expected = _output(uniswap_v2, [a, b, c], 50.0)
+    assert uniswap_v2.swap_exact_in(user, a, c, 50.0) == pytest.approx(expected)
+    assert user.wallet[c] == pytest.approx(expected)
+    assert uniswap_v2._get_pool(a, c).token_reserve[a] == 100
+
+    # The route re-reads the reserves the swap changed.
+    hops, amount_out = uniswap_v2.router.best_path(a, c, 50.0)
+    assert amount_out == pytest.approx(_output(uniswap_v2, [a, b, c], 50.0))
+
+    with pytest.raises(ValueError, match="less than the minimum"):
+        uniswap_v2.swap_exact_in(user, c, a, 1.0, min_amount_out=10.0)
+
+
+def test_new_pools_drop_only_the_routes_they_could_be_on():
+    blockchain = Blockchain()
+    tokens = [blockchain.create_token(f"T{i}", 1.0) for i in range(10)]
+    uniswap_v2 = blockchain.create_contract(UniswapV2())
+    # Two chains, T0-T1-T2-T3 and T5-T6-T7.
+    uniswap_v2.create_pools(
+        (tokens[i], tokens[i + 1], 0.003, 1e4, 1e4) for i in (0, 1, 2, 5, 6)
+    )
+    router = uniswap_v2.router
+    near = router.route(tokens[0], tokens[3])
+    far = router.route(tokens[5], tokens[7])
+
+    # No simple path from T0 to T3 goes through T2-T8.
+    uniswap_v2.create_pool(tokens[2], tokens[8], 0.003, 1e4, 1e4)
+    assert router.route(tokens[0], tokens[3]) is near
+    assert router.route(tokens[5], tokens[7]) is far
+
+    uniswap_v2.create_pool(tokens[1], tokens[3], 0.003, 1e4, 1e4)
+    assert [0, 1, 3] in router.route(tokens[0], tokens[3]).paths
+    assert router.route(tokens[5], tokens[7]) is far
+
+    with pytest.raises(ValueError, match="No path"):
+        router.route(tokens[0], tokens[5])
@@ -0,0 +1,171 @@
+import asyncio
+import random
+
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from core.transaction import Transaction
+from simulation.agents.user import UserAgent
+from simulation.runtime import AsyncAgentRuntime
+from utils.logger import events
+
+
+def _runtime(num_users: int = 10, **kwargs):
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    contract = blockchain.create_contract(UniswapV2())
+    contract.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+    users = [blockchain.create_user(f"User_{i}") for i in range(num_users)]
+    for user in users:
+        user.add_to_wallet(usdc, 1000.0)
+
+    runtime = AsyncAgentRuntime(blockchain, **kwargs)
+
+    return runtime, contract, users, usdc, eth
+
+
+def _swap(contract, usdc, eth, delay: float = 0.0):
+    async def strategy(session):
+        await asyncio.sleep(delay)
+        await session.send_transaction(
+            Transaction(
+                session.user,
+                contract,
+                "swap",
+                {"token_in": usdc, "token_out": eth, "amount_in": 10.0},
+            )
+        )
+
+    return strategy
+
+
+def test_every_agent_acts_once_per_block():
+    random.seed(0)
+    runtime, contract, users, *_ = _runtime()
+    runtime.block_producers = [
+        runtime.blockchain.create_block_producer(f"BP_{i}") for i in range(2)
+    ]
+    for user in users:
+        runtime.add_agent(user, lambda session: UserAgent.act(session, contract))
+
+    stats = runtime.run(3)
+
+    assert [round_stats.block_number for round_stats in stats] == [0, 1, 2]
+    for round_stats in stats:
+        assert (round_stats.completed, round_stats.late, round_stats.failed) == (
+            10,
+            0,
+            0,
+        )
+        assert round_stats.submitted == 10
+    assert runtime.blockchain.blocks.num_transactions.tolist() == [10, 10, 10]
+
+
+def test_agents_past_the_deadline_are_cancelled():
+    runtime, contract, users, usdc, eth = _runtime(block_deadline=0.05)
+    for index, user in enumerate(users):
+        runtime.add_agent(user, _swap(contract, usdc, eth, 5.0 if index % 2 else 0.0))
+
+    (stats,) = runtime.run(1)
+
+    assert (stats.completed, stats.late, stats.submitted) == (5, 5, 5)
+    assert stats.elapsed < 1.0
+    block = runtime.blockchain.blocks[0]
+    assert {transaction.sender.name for transaction in block.transactions} == {
+        user.name for user in users[::2]
+    }
+
+
+def test_transactions_slower_than_the_deadline_are_lost():
+    runtime, contract, users, usdc, eth = _runtime(
+        block_deadline=0.05, network_latency=5.0
+    )
+    runtime.add_agent(users[0], _swap(contract, usdc, eth))
+
+    (stats,) = runtime.run(1)
+
+    assert (stats.late, stats.submitted) == (1, 0)
+    assert runtime.blockchain.blocks.num_transactions.tolist() == [0]
+
+
+def test_failing_agents_are_counted_and_logged():
+    runtime, contract, users, usdc, eth = _runtime(num_users=4)
+    failures = events.failures["RuntimeError"]
+
+    async def failing(session):
+        raise RuntimeError("model server unavailable")
+
+    for user in users[:3]:
+        runtime.add_agent(user, failing)
+    runtime.add_agent(users[3], _swap(contract, usdc, eth))
+
+    (stats,) = runtime.run(1)
+
+    assert (stats.completed, stats.failed, stats.submitted) == (1, 3, 1)
+    assert events.failures["RuntimeError"] - failures == 3
+
+
+def test_waits_overlap_up_to_the_concurrency_limit():
+    runtime, contract, users, usdc, eth = _runtime(
+        num_users=40, max_concurrency=8, block_deadline=None
+    )
+    running, peak = 0, 0
+
+    async def waiting(session):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    for user in users:
+        runtime.add_agent(user, waiting)
+
+    (stats,) = runtime.run(1)
+
+    assert peak == 8
+    assert stats.completed == 40
+    # 5 rounds of overlapping waits rather than 40 waits one after another.
+    assert stats.elapsed < 40 * 0.02
+
+
+def test_agents_share_one_observation_per_block():
+    runtime, contract, users, usdc, eth = _runtime(num_users=3, observe_latency=0.01)
+    observations = []
+
+    async def observing(session):
+        observations.append(await session.observe())
+        await _swap(contract, usdc, eth)(session)
+
+    for user in users:
+        runtime.add_agent(user, observing)
+
+    runtime.run(2)
+
+    assert [observation.block_number for observation in observations] == [0] * 3 + [
+        1
+    ] * 3
+    assert observations[0] is observations[2]
+    assert observations[0].prices == {"USDC": 1.0, "ETH": 3000.0}
+    assert observations[0].reserves == {
+        "UniswapV2 USDC/ETH": {"USDC": 3_000_000, "ETH": 1000}
+    }
+    # The second block sees the reserves after the first block's swaps.
+    assert observations[3].reserves["UniswapV2 USDC/ETH"]["USDC"] == 3_000_030
+    assert observations[0].pending == 0
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"max_concurrency": 0},
+        {"block_deadline": 0.0},
+        {"network_latency": -1.0},
+        {"observe_latency": -1.0},
+    ],
+)
+def test_invalid_settings_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        AsyncAgentRuntime(Blockchain(), **kwargs)
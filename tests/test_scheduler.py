@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from simulation.scheduler import ArrivalProcess, EventScheduler
+from simulation.simulator import Epoch, Simulator
+
+
+def _arrivals(scheduler: EventScheduler, num_blocks: int) -> list[dict[str, list]]:
+    return [scheduler.pop_block(block) for block in range(num_blocks)]
+
+
+def test_arrivals_follow_the_rates():
+    scheduler = EventScheduler(np.random.default_rng(0))
+    users = list(range(100))
+    scheduler.register(ArrivalProcess("users", users, 0.01))
+    scheduler.register(ArrivalProcess("providers", ["LP"], 0.5))
+
+    blocks = _arrivals(scheduler, 10_000)
+
+    # 100 users arriving once per 100 blocks each, and 1 provider arriving
+    # once per 2 blocks: about 10000 and 5000 arrivals.
+    num_users = sum(len(block.get("users", [])) for block in blocks)
+    num_providers = sum(len(block.get("providers", [])) for block in blocks)
+    assert num_users == pytest.approx(10_000, rel=0.05)
+    assert num_providers == pytest.approx(5_000, rel=0.05)
+    counts = np.bincount(
+        [user for block in blocks for user in block.get("users", [])], minlength=100
+    )
+    assert counts.min() > 50
+
+
+def test_blocks_pop_only_their_arrivals():
+    scheduler = EventScheduler(np.random.default_rng(1))
+    scheduler.register(ArrivalProcess("users", ["a", "b"], 0.05))
+
+    for _ in range(20):
+        block = scheduler.next_block()
+        # Nothing arrives before the next arrival's block.
+        if block > 0:
+            assert scheduler.pop_block(block - 1) == {}
+        assert scheduler.pop_block(block)["users"]
+        assert scheduler.next_block() > block
+
+
+def test_idle_processes_are_never_scheduled():
+    scheduler = EventScheduler(np.random.default_rng(0))
+    scheduler.register(ArrivalProcess("idle", ["a"], 0.0))
+    scheduler.register(ArrivalProcess("empty", [], 1.0))
+
+    assert scheduler.next_block() is None
+    assert _arrivals(scheduler, 10) == [{}] * 10
+
+
+def test_invalid_processes_are_rejected():
+    scheduler = EventScheduler(np.random.default_rng(0))
+    scheduler.register(ArrivalProcess("users", ["a"], 1.0))
+
+    with pytest.raises(ValueError):
+        scheduler.register(ArrivalProcess("users", ["b"], 1.0))
+    with pytest.raises(ValueError):
+        scheduler.register(ArrivalProcess("providers", ["b"], -1.0))
+
+
+def test_restored_state_continues_the_same_arrivals():
+    scheduler = EventScheduler(np.random.default_rng(2))
+    scheduler.register(ArrivalProcess("users", list(range(10)), 0.1))
+    scheduler.register(ArrivalProcess("providers", list(range(3)), 0.02))
+    _arrivals(scheduler, 50)
+    state = scheduler.get_state()
+    rng_state = scheduler.rng.bit_generator.state
+
+    expected = [scheduler.pop_block(block) for block in range(50, 100)]
+
+    rng = np.random.default_rng()
+    rng.bit_generator.state = rng_state
+    restored = EventScheduler(rng)
+    restored.register(ArrivalProcess("users", list(range(10)), 0.1), schedule=False)
+    restored.register(ArrivalProcess("providers", list(range(3)), 0.02), schedule=False)
+    restored.set_state(state)
+
+    assert [restored.pop_block(block) for block in range(50, 100)] == expected
+
+
+def _simulator(**kwargs) -> tuple[Simulator, Epoch]:
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    blockchain.create_contract(UniswapV2()).create_pool(
+        usdc, eth, 0.003, 3_000_000, 1000
+    )
+
+    simulator = Simulator(blockchain, seed=0, **kwargs)
+    simulator.create_users(50)
+    simulator.create_liquidity_providers(2)
+    simulator.create_block_producers(1)
+
+    return simulator, Epoch(1000, {usdc: 1.0, eth: 3000.0}, seed=0)
+
+
+def test_simulator_skips_blocks_without_arrivals(monkeypatch):
+    simulator, epoch = _simulator(
+        arrival_rates={"users": 0.0005, "liquidity_providers": 0.001},
+        sample_every=250,
+    )
+    run_block = Simulator._run_block
+    materialized = []
+
+    def recorded_run_block(simulator, epoch, block, arrivals=None):
+        materialized.append((block, arrivals))
+        run_block(simulator, epoch, block, arrivals)
+
+    monkeypatch.setattr(Simulator, "_run_block", recorded_run_block)
+
+    simulator.run([epoch, epoch])
+
+    blocks = simulator.blockchain.blocks
+    assert len(blocks) == 2000
+    # About 25 user and 2 provider arrivals per epoch.
+    assert 20 < len(materialized) < 100
+    assert all(arrivals is not None for _, arrivals in materialized)
+    num_arrivals = sum(
+        len(agents) for _, arrivals in materialized for agents in arrivals.values()
+    )
+    assert blocks.num_transactions.sum() <= num_arrivals
+    # Samples are still taken on schedule.
+    assert [sample["block"] for sample in simulator.samples] == list(
+        range(250, 2001, 250)
+    )
+
+
+def test_arrivals_need_known_populations_and_no_trade_traces():
+    with pytest.raises(ValueError):
+        _simulator(arrival_rates={"block_producers": 1.0})
+
+    simulator, epoch = _simulator(arrival_rates={"users": 0.01})
+    epoch.trades = object()
+    with pytest.raises(ValueError):
+        simulator.run_epoch(epoch)
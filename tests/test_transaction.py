@@ -0,0 +1,122 @@
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from core.transaction import CompiledTransaction, Transaction
+
+
+def _chain():
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    contract = blockchain.create_contract(UniswapV2())
+    contract.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+    user = blockchain.create_user("User")
+    user.add_to_wallet(usdc, 10_000)
+
+    return blockchain, contract, user, usdc, eth
+
+
+def test_dispatch_table_follows_the_contract_functions():
+    _, contract, *_ = _chain()
+    dispatch = contract.dispatch
+
+    assert contract.dispatch is dispatch
+    assert dispatch.names == list(contract.functions)
+    for name, function in contract.functions.items():
+        opcode = contract.opcode(name)
+        assert dispatch.names[opcode] == name
+        assert dispatch.functions[opcode] is function
+    assert dispatch.operands[contract.opcode("swap_exact_in")] == (
+        "token_in",
+        "token_out",
+        "amount_in",
+        "min_amount_out",
+    )
+
+    with pytest.raises(ValueError):
+        contract.opcode("flash_loan")
+
+
+def test_compiled_transactions_match_their_source():
+    _, contract, user, usdc, eth = _chain()
+    transaction = Transaction(
+        user,
+        contract,
+        "swap_exact_in",
+        {"amount_in": 100.0, "token_out": eth, "token_in": usdc},
+        0.5,
+    )
+
+    compiled = transaction.compile()
+
+    assert compiled.opcode == contract.opcode("swap_exact_in")
+    # Operands follow the parameters, whatever the order of the arguments.
+    assert compiled.operands == (usdc, eth, 100.0)
+    assert compiled.function == transaction.function
+    assert compiled.args == {"token_in": usdc, "token_out": eth, "amount_in": 100.0}
+    assert (compiled.sender, compiled.gas_fee) == (user, 0.5)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [{"token_in": None, "amount_in": 1.0}, {"token_in": None, "amount": 1.0}],
+)
+def test_arguments_that_are_not_leading_parameters_do_not_compile(args):
+    _, contract, user, *_ = _chain()
+
+    with pytest.raises(ValueError):
+        Transaction(user, contract, "swap", args).compile()
+
+
+def test_compiled_and_keyword_transactions_process_alike():
+    results = []
+    for compile_transactions in (False, True):
+        blockchain, contract, user, usdc, eth = _chain()
+        transactions = [
+            Transaction(
+                user,
+                contract,
+                "swap",
+                {"token_in": usdc, "token_out": eth, "amount_in": amount},
+            )
+            for amount in (1000.0, 1e9)
+        ]
+        if compile_transactions:
+            transactions = [transaction.compile() for transaction in transactions]
+
+        statuses = [transaction.process() for transaction in transactions]
+        results.append((statuses, user.wallet[usdc], user.wallet[eth]))
+
+    assert results[0] == results[1]
+    assert results[0][0] == [True, False]
+
+
+def test_block_store_decodes_compiled_transactions():
+    blockchain, contract, user, usdc, eth = _chain()
+    blockchain.add_transactions(
+        [
+            CompiledTransaction(
+                user, contract, contract.opcode("swap"), (usdc, eth, 1000.0)
+            ),
+            Transaction(
+                user,
+                contract,
+                "swap",
+                {"token_in": eth, "token_out": usdc, "amount_in": 0.1},
+            ),
+        ]
+    )
+
+    blockchain.create_block()
+
+    block = blockchain.blocks[0]
+    assert [transaction.function for transaction in block.transactions] == [
+        "swap",
+        "swap",
+    ]
+    assert [transaction.args for transaction in block.transactions] == [
+        {"token_in": usdc, "token_out": eth, "amount_in": 1000.0},
+        {"token_in": eth, "token_out": usdc, "amount_in": 0.1},
+    ]
+    assert block.statuses == [True, True]
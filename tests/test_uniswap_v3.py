@@ -0,0 +1,225 @@
+import random
+
+import numpy as np
+import pytest
+
+from contracts.uniswap_v3 import ConcentratedPool, UniswapV3, sqrt_price_at_tick
+from core import parallel
+from core.blockchain import Blockchain
+from core.transaction import CompiledTransaction, Transaction
+from market.token import Token
+
+
+@pytest.fixture
+def pool() -> ConcentratedPool:
+    # Between ticks 30 and 31, so the first ticks down are 0 and -600.
+    return ConcentratedPool(
+        Token("USDC", 1.0), Token("ETH", 1.0), 0.003, price=1.0001**30.5
+    )
+
+
+def test_swap_within_range_pays_its_position(pool):
+    pool.mint("a", -600, 600, 1000.0)
+
+    pool.swap(Token("USDC", 1.0), 1.0)
+
+    fees = pool.collect("a", -600, 600)
+    assert fees[0] == pytest.approx(0.003)
+    assert fees[1] == 0.0
+
+
+def test_crossing_splits_fees_between_adjacent_ranges(pool):
+    liquidity = 1000.0
+    pool.mint("lower", -600, 0, liquidity)
+    pool.mint("upper", 0, 600, liquidity)
+
+    # The input that takes the price down to tick 0, fee included, is the
+    # part of the swap the upper range serves.
+    sqrt_price = pool.sqrt_price
+    sqrt_target = sqrt_price_at_tick(0)
+    to_target = liquidity * (sqrt_price - sqrt_target) / (sqrt_price * sqrt_target)
+    upper_fee = to_target * pool.fee / (1 - pool.fee)
+
+    amount_in = 2.0
+    pool.swap(Token("USDC", 1.0), amount_in)
+    assert pool.tick < 0
+
+    upper = pool.collect("upper", 0, 600)
+    lower = pool.collect("lower", -600, 0)
+    assert upper[0] == pytest.approx(upper_fee)
+    assert lower[0] == pytest.approx(amount_in * pool.fee - upper_fee)
+    assert lower[0] > 0
+
+
+def test_crossing_back_keeps_fees_in_their_ranges(pool):
+    pool.mint("lower", -600, 0, 1000.0)
+    pool.mint("upper", 0, 600, 1000.0)
+
+    pool.swap(Token("USDC", 1.0), 2.0)
+    pool.swap(Token("ETH", 1.0), 2.0)
+    assert pool.tick >= 0
+
+    upper = pool.collect("upper", 0, 600)
+    lower = pool.collect("lower", -600, 0)
+    assert sum(upper) + sum(lower) == pytest.approx(4.0 * pool.fee)
+    assert min(upper + lower) > 0
+
+
+def _state(pool: ConcentratedPool) -> tuple:
+    return (
+        dict(pool.token_reserve),
+        pool.version,
+        pool.sqrt_price,
+        pool.tick,
+        pool.liquidity,
+        list(pool.fee_growth_global),
+        {
+            tick: (info.liquidity_gross, info.liquidity_net, info.fee_growth_outside)
+            for tick, info in pool.ticks.items()
+        },
+        dict(pool.bitmap.words),
+        # Owners are compared by their ranges, as the addresses are random.
+        sorted(
+            (key[1:], position.liquidity, position.fee_growth_inside_last)
+            for key, position in pool.positions.items()
+        ),
+    )
+
+
+def test_restore_undoes_swaps_and_position_changes(pool):
+    pool.mint("lower", -600, 0, 1000.0)
+    pool.mint("upper", 0, 600, 1000.0)
+    pool.swap(Token("ETH", 1.0), 0.5)
+    before = _state(pool)
+
+    snapshot = pool.snapshot()
+    pool.swap(Token("USDC", 1.0), 2.0)
+    pool.mint("wide", -1200, 1200, 500.0)
+    pool.burn("upper", 0, 600, 400.0)
+    pool.collect("lower", -600, 0)
+    assert _state(pool) != before
+
+    pool.restore(snapshot)
+    assert _state(pool) == before
+    assert pool.bitmap.is_initialized(600) and not pool.bitmap.is_initialized(1200)
+
+
+def _v3_chain(engine: str = "sequential"):
+    blockchain = Blockchain(engine=engine, max_workers=2)
+    tokens = [blockchain.create_token(f"T{i}", 1.0) for i in range(4)]
+    uniswap_v3 = blockchain.create_contract(UniswapV3())
+    for token_1, token_2 in zip(tokens[::2], tokens[1::2]):
+        uniswap_v3.create_pool(token_1, token_2, 0.003, 1e4, 1e4)
+
+    users = [blockchain.create_user(f"User_{i}") for i in range(8)]
+    for user in users:
+        for token in tokens:
+            user.add_to_wallet(token, 1000.0)
+
+    return blockchain, tokens, uniswap_v3, users
+
+
+def test_conflict_keys_are_the_pool_of_every_function():
+    blockchain, tokens, uniswap_v3, users = _v3_chain()
+    pool = uniswap_v3._get_pool(tokens[0], tokens[1])
+
+    for function, args in (
+        ("swap", {"token_in": tokens[1], "token_out": tokens[0], "amount_in": 1.0}),
+        ("mint", {"token_1": tokens[0], "token_2": tokens[1], "tick_lower": -600}),
+        ("collect", {"tick_lower": -600, "token_2": tokens[0], "token_1": tokens[1]}),
+    ):
+        transaction = Transaction(users[0], uniswap_v3, function, args)
+        assert uniswap_v3.conflict_keys(transaction) == (pool,)
+
+    compiled = CompiledTransaction(
+        users[0],
+        uniswap_v3,
+        uniswap_v3.opcode("burn"),
+        (tokens[0], tokens[1], 0, 60, 1.0),
+    )
+    assert uniswap_v3.conflict_keys(compiled) == (pool,)
+
+    unknown = Transaction(
+        users[0], uniswap_v3, "swap", {"token_in": tokens[0], "token_out": tokens[2]}
+    )
+    assert uniswap_v3.conflict_keys(unknown) is None
+
+
+def test_mint_takes_the_pool_tokens_in_either_order():
+    blockchain, tokens, uniswap_v3, users = _v3_chain()
+    pool = uniswap_v3._get_pool(tokens[0], tokens[1])
+
+    amounts = uniswap_v3.mint(users[0], tokens[1], tokens[0], -600, 600, 100.0)
+
+    assert users[0].wallet[tokens[0]] == pytest.approx(1000.0 - amounts[0])
+    assert users[0].wallet[tokens[1]] == pytest.approx(1000.0 - amounts[1])
+    assert pool.positions[(users[0].address, -600, 600)].liquidity == 100.0
+
+
+def _run_v3(engine: str) -> Blockchain:
+    rng = random.Random(0)
+    blockchain, tokens, uniswap_v3, users = _v3_chain(engine)
+
+    for _ in range(400):
+        # Half the users trade on each pool, so the pools' groups are apart.
+        number = rng.randrange(len(users))
+        user = users[number]
+        pair = (0, 1) if number % 2 else (2, 3)
+        token_1, token_2 = tokens[pair[0]], tokens[pair[1]]
+        if rng.random() < 0.2:
+            blockchain.add_transaction(
+                Transaction(
+                    user,
+                    uniswap_v3,
+                    "mint",
+                    {
+                        "token_1": token_1,
+                        "token_2": token_2,
+                        "tick_lower": -600,
+                        "tick_upper": 600,
+                        "liquidity": rng.uniform(1, 50),
+                    },
+                )
+            )
+        else:
+            if rng.random() < 0.5:
+                token_1, token_2 = token_2, token_1
+            blockchain.add_transaction(
+                Transaction(
+                    user,
+                    uniswap_v3,
+                    "swap",
+                    {
+                        "token_in": token_1,
+                        "token_out": token_2,
+                        "amount_in": rng.uniform(1, 100),
+                    },
+                )
+            )
+    blockchain.create_block()
+
+    return blockchain
+
+
+def test_parallel_engine_matches_sequential_on_concentrated_pools(monkeypatch):
+    # Run every segment on the workers, however short.
+    monkeypatch.setattr(parallel, "MIN_SEGMENT_SIZE", 0)
+    partitions = []
+    partition = parallel.ParallelExecutor._partition
+
+    def recorded_partition(executor, *args):
+        partitions.append(partition(executor, *args))
+        return partitions[-1]
+
+    monkeypatch.setattr(parallel.ParallelExecutor, "_partition", recorded_partition)
+    sequential = _run_v3("sequential")
+
+    concurrent = _run_v3("parallel")
+
+    assert [len(bins) for bins in partitions] == [2]
+
+    np.testing.assert_array_equal(
+        concurrent.ledger.balances, sequential.ledger.balances
+    )
+    for name, pool in concurrent.contracts["UniswapV3"].pools.items():
+        assert _state(pool) == _state(sequential.contracts["UniswapV3"].pools[name])
@@ -0,0 +1,132 @@
+import random
+
+import numpy as np
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from market.actors.user import BlockProducer, Population, address_of
+from market.ledger import Ledger
+from market.token import Token
+from simulation.agents.user import UserAgent
+
+
+def test_users_are_created_on_first_access_and_kept():
+    ledger = Ledger()
+    population = Population(ledger, ledger.register_users(5), name_prefix="LP_")
+
+    assert population.created == {}
+    np.testing.assert_array_equal(population.user_ids, range(5))
+
+    user = population[3]
+    assert population[-2] is user
+    assert (user.name, user.address, user.user_id) == ("LP_3", address_of(3), 3)
+    assert list(population.created) == [3]
+
+    assert [user.name for user in population[1:3]] == ["LP_1", "LP_2"]
+    assert len(list(population)) == len(population.created) == 5
+    with pytest.raises(IndexError):
+        population[5]
+
+
+def test_peeked_users_are_not_kept():
+    ledger = Ledger()
+    population = Population(ledger, ledger.register_users(3))
+    kept = population[0]
+
+    peeked = population.peek(1)
+
+    assert population.peek(0) is kept
+    assert peeked == population.peek(-2)
+    assert peeked is not population.peek(1)
+    assert list(population.created) == [0]
+    # Every object of a user views the same ledger row.
+    token = Token("USDC", 1.0)
+    peeked.add_to_wallet(token, 5.0)
+    assert population[1].wallet[token] == 5.0
+
+
+def test_restored_names_and_addresses_are_used():
+    ledger = Ledger()
+    ids = ledger.register_users(2)
+    population = Population(
+        ledger,
+        ids,
+        BlockProducer,
+        names=np.array(["Alice", "Bob"]),
+        addresses=np.array(["0xa", "0xb"]),
+    )
+
+    assert isinstance(population[1], BlockProducer)
+    assert (population[1].name, population[1].address) == ("Bob", "0xb")
+    with pytest.raises(ValueError):
+        Population(ledger, ids, names=np.array(["Alice"]))
+
+
+def test_users_are_found_by_id():
+    blockchain = Blockchain()
+    blockchain.create_user("Outsider")
+    first = blockchain.create_population(3)
+    second = blockchain.create_population(2, "Bot_")
+
+    assert second.get(first.ids[0]) is None
+    assert blockchain.get_user(second.ids[1]) is second[1]
+    assert blockchain.get_user(first.ids[2]).name == "User_2"
+
+
+def test_populations_are_funded_in_bulk():
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    dai = blockchain.create_token("DAI", 1.0)
+
+    population = blockchain.create_population(
+        4,
+        balances={
+            usdc: 100.0,
+            eth: np.array([1.0, 2.0, 3.0, 4.0]),
+            dai: lambda num: np.full(num, 7.0),
+        },
+    )
+
+    assert population.created == {}
+    assert dict(population[2].wallet) == {usdc: 100.0, eth: 3.0, dai: 7.0}
+
+
+def _swaps(users, blockchain):
+    random.seed(0)
+    UserAgent.simulate_user_actions(
+        users, blockchain.contracts["UniswapV2"], blockchain
+    )
+
+    return [
+        (transaction.sender.name, transaction.operands)
+        for transaction in blockchain.mempool
+    ]
+
+
+def _chain() -> tuple[Blockchain, dict]:
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    blockchain.create_contract(UniswapV2()).create_pool(
+        usdc, eth, 0.003, 3_000_000, 1000
+    )
+
+    return blockchain, {usdc: 1000.0, eth: 1.0}
+
+
+def test_user_agents_act_for_a_population_without_keeping_it():
+    blockchain, balances = _chain()
+    population = blockchain.create_population(200, balances=balances)
+
+    swaps = _swaps(population, blockchain)
+
+    assert population.created == {}
+    assert len(swaps) == 200
+    # The same draws as for a list of the same users.
+    blockchain, balances = _chain()
+    users = list(blockchain.create_population(200, balances=balances))
+    assert _swaps(users, blockchain) == swaps
+    # A list is still shuffled in place.
+    assert [user.name for user in users] != [f"User_{i}" for i in range(200)]
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+from contracts.uniswap_v2 import UniswapV2
+from core.blockchain import Blockchain
+from simulation.agents.user import UserAgent
+from simulation.simulator import Epoch, Simulator
+
+
+def _chain():
+    blockchain = Blockchain()
+    usdc = blockchain.create_token("USDC", 1.0)
+    eth = blockchain.create_token("ETH", 3000.0)
+    dai = blockchain.create_token("DAI", 1.0)
+    contract = blockchain.create_contract(UniswapV2())
+    contract.create_pool(usdc, eth, 0.003, 3_000_000, 1000)
+    contract.create_pool(usdc, dai, 0.0005, 1_000_000, 1_000_000)
+
+    return blockchain, contract, usdc, eth, dai
+
+
+def _users(blockchain, usdc, eth, dai):
+    users = [blockchain.create_user(f"User_{i}") for i in range(60)]
+    for index, user in enumerate(users):
+        # Users hold no token, one token or several, including a token that
+        # is not one of the blockchain's.
+        if index % 4 == 0:
+            continue
+        user.add_to_wallet(usdc, 100.0 + index)
+        if index % 4 >= 2:
+            user.add_to_wallet(eth, 1.0 + index)
+        if index % 4 == 3:
+            user.add_to_wallet(dai, 10.0 + index)
+
+    outsider = users[5]
+    outsider.wallet.clear()
+    lp_token = blockchain.contracts["UniswapV2"].get_pools()[0].lp_token
+    outsider.add_to_wallet(lp_token, 7.0)
+
+    return users
+
+
+def test_every_holder_swaps_part_of_a_held_token_for_another_token():
+    blockchain, contract, usdc, eth, dai = _chain()
+    users = _users(blockchain, usdc, eth, dai)
+    order = list(users)
+    balances = {user.address: dict(user.wallet) for user in users}
+
+    UserAgent.simulate_population_actions(
+        users, contract, blockchain, np.random.default_rng(0), gas_fee=0.5
+    )
+
+    transactions = list(blockchain.mempool)
+    senders = [transaction.sender for transaction in transactions]
+    assert sorted(user.name for user in senders) == sorted(
+        user.name for user in users if len(user.wallet)
+    )
+    assert users == order
+    for transaction in transactions:
+        token_in, token_out, amount_in = transaction.operands
+        balance = balances[transaction.sender.address][token_in]
+        assert 0.01 * balance <= amount_in <= balance
+        assert token_out in blockchain.tokens.values()
+        assert token_out != token_in
+        assert transaction.function == "swap"
+        assert transaction.gas_fee == 0.5
+
+
+def test_draws_follow_the_generator():
+    mempools = []
+    for _ in range(2):
+        blockchain, contract, usdc, eth, dai = _chain()
+        users = _users(blockchain, usdc, eth, dai)
+        UserAgent.simulate_population_actions(
+            users, contract, blockchain, np.random.default_rng(7)
+        )
+        mempools.append(
+            [
+                (transaction.sender.name, transaction.args)
+                for transaction in blockchain.mempool
+            ]
+        )
+
+    assert mempools[0] == mempools[1]
+    # Every token a user holds is drawn for some user.
+    assert {args["token_in"].name for _, args in mempools[0]} >= {"USDC", "ETH", "DAI"}
+
+
+def test_only_swapping_users_of_a_population_are_created():
+    blockchain, contract, usdc, *_ = _chain()
+    population = blockchain.create_population(1000)
+    blockchain.ledger.deposit_many(population.ids[::2], usdc, 100.0)
+
+    UserAgent.simulate_population_actions(
+        population, contract, blockchain, np.random.default_rng(0)
+    )
+
+    assert len(blockchain.mempool) == 500
+    assert sorted(population.created) == list(range(0, 1000, 2))
+
+
+@pytest.mark.parametrize("user_list", [[], "no tokens"])
+def test_nothing_is_submitted_without_users_or_tokens(user_list):
+    blockchain = Blockchain()
+    contract = blockchain.create_contract(UniswapV2())
+    if user_list:
+        user_list = [blockchain.create_user("User")]
+
+    UserAgent.simulate_population_actions(
+        user_list, contract, blockchain, np.random.default_rng(0)
+    )
+
+    assert len(blockchain.mempool) == 0
+
+
+def test_simulator_runs_in_population_mode():
+    reports = []
+    for _ in range(2):
+        blockchain, _, usdc, eth, dai = _chain()
+        simulator = Simulator(blockchain, seed=3, user_mode="population")
+        simulator.create_users(200, bulk=True)
+        simulator.create_block_producers(1)
+
+        simulator.run([Epoch(5, {usdc: 1.0, eth: 3000.0, dai: 1.0}, seed=0)])
+
+        blocks = blockchain.blocks
+        reports.append(
+            (blocks.num_transactions.tolist(), simulator.get_users_total_value())
+        )
+
+    assert reports[0] == reports[1]
+    assert all(count > 0 for count in reports[0][0])
+    with pytest.raises(ValueError):
+        Simulator(Blockchain(), user_mode="vectorized")